@@ -0,0 +1,90 @@
+import asyncio
+import json
+import aiohttp
+
+from util import debugger
+from BaseApi.Bithumb.config import Urls
+from BaseApi.Bithumb.base_subscriber import BithumbMessageHandler
+from BaseApi.event_loop import SharedEventLoop
+
+
+class BithumbAsyncSubscriber(BithumbMessageHandler):
+    """
+        asyncio version of BithumbSubscriber, it has the same subscribe_orderbook/subscribe_trade.
+        websocket runs as a task on SharedEventLoop, so every asyncio subscriber shares one thread.
+    """
+    RECONNECT_WAIT_TIME = 1
+
+    def __init__(self, data_store, lock_dic, event_loop=None, recorder=None):
+        """
+            data_store: An object for storing orderbook&candle data, using orderbook&candle queue in this object.
+            lock_dic: dictionary for avoid race condition, {orderbook: Lock, candle: Lock}
+            event_loop: SharedEventLoop, default is the process wide one
+            recorder: FrameRecorder for received frames
+        """
+        debugger.debug('BithumbAsyncSubscriber::: start')
+
+        self._init_message_handler(data_store, lock_dic, recorder=recorder)
+        self.name = 'bithumb_async_subscriber'
+
+        self.keep_running = False
+        self._is_stopped = False
+        self._ws = None
+
+        self._event_loop = event_loop or SharedEventLoop.instance()
+        self._task_future = self._event_loop.run_coroutine(self._run())
+
+    def _send_with_subscribe_set(self, topic):
+        data = self.subscribe_set[topic]
+        debugger.debug('Bithumb subscribe topic - [{}], subscribe set - [{}]'.format(topic, data))
+
+        # it's sent on connect if websocket is not connected yet
+        self._event_loop.run_coroutine(self._send(json.dumps(data)))
+
+    async def _send(self, message):
+        if self._ws is not None and not self._ws.closed:
+            await self._ws.send_str(message)
+
+    async def _run(self):
+        async with aiohttp.ClientSession() as session:
+            while not self._is_stopped:
+                try:
+                    await self._receive(session)
+                except asyncio.CancelledError:
+                    raise
+                except Exception:
+                    debugger.exception('BithumbAsyncSubscriber::: Unexpected error from websocket task.')
+                finally:
+                    self.keep_running = False
+                    self.opened.clear()
+                    self._ws = None
+
+                if not self._is_stopped:
+                    debugger.debug('BithumbAsyncSubscriber::: reconnect websocket.')
+                    await asyncio.sleep(self.RECONNECT_WAIT_TIME)
+
+    async def _receive(self, session):
+        async with session.ws_connect(Urls.Websocket.BASE, heartbeat=30) as ws:
+            self._ws = ws
+            self.keep_running = True
+            self.opened.set()
+
+            # subscribe again after reconnection
+            for topic in list(self.subscribe_set):
+                await ws.send_str(json.dumps(self.subscribe_set[topic]))
+
+            async for message in ws:
+                if message.type in (aiohttp.WSMsgType.TEXT, aiohttp.WSMsgType.BINARY):
+                    try:
+                        self.handle_message(message.data)
+                    except Exception:
+                        debugger.exception('BithumbAsyncSubscriber::: failed to handle message.')
+
+                elif message.type in (aiohttp.WSMsgType.CLOSED, aiohttp.WSMsgType.ERROR):
+                    debugger.debug('BithumbAsyncSubscriber::: Disconnected websocket.')
+                    break
+
+    def stop(self):
+        self._is_stopped = True
+        if self._ws is not None:
+            self._event_loop.run_coroutine(self._ws.close())
@@ -1,4 +1,3 @@
-import requests
 import time
 import hmac
 import hashlib
@@ -7,29 +6,48 @@ import asyncio
 import json
 import aiohttp
 
+from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import urlencode
-from decimal import Decimal
 
 from BaseApi.Bithumb.utils import sai_to_bithumb_converter, bithumb_to_sai_converter
 
 from BaseApi.Bithumb.base_subscriber import BithumbSubscriber
+from BaseApi.Bithumb.async_subscriber import BithumbAsyncSubscriber
 from BaseApi.objects import DataStore
 from BaseApi.Bithumb.config import Urls
 from BaseApi.objects import ResultObject
 from BaseApi.settings import Consts
 from BaseApi.messages import WarningMessage, MessageDebug
+from BaseApi.http_session import get_session, get_async_session, TIMEOUT
 from util import debugger
 
 
 class BaseBithumb(object):
     name = 'Bithumb'
 
-    def __init__(self, key, secret):
+    # seconds, tickers are reused within it so repeated calls during startup don't hit the api
+    TICKERS_CACHE_TTL = 5
+
+    # seconds to wait for websocket to open before subscribing
+    SUBSCRIBER_OPEN_TIMEOUT = 10
+
+    # BTC & KRW markets are fetched concurrently
+    _executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='bithumb_public_api')
+
+    def __init__(self, key, secret, snapshot_mode=False):
+        """
+            snapshot_mode: if True, readers get copy-on-write snapshots without taking ingest locks
+        """
         self._key = key
         self._secret = secret
 
-        self.data_store = DataStore()
+        self.data_store = DataStore(snapshot_mode)
+
+        # (fetched time, ResultObject)
+        self._tickers_cache = (0, None)
+        self._tickers_lock = threading.Lock()
 
+        # prime tickers cache for get_available()
         self._get_tickers()
 
         self._lock_dic = {
@@ -40,74 +58,149 @@ class BaseBithumb(object):
 
         self._subscriber = None
 
+        # (trade version, ResultObject), rebuilt only when new trades are stored
+        self._latest_trade_snapshot = (None, None)
+
+    def _parse_response(self, response, path, extra):
+        if 'message' in response:
+            message = MessageDebug.FAIL_RESPONSE_DETAILS.format(name=self.name, body=response['message'],
+                                                                path=path, parameter=extra)
+            debugger.debug(message)
+
+            user_message = WarningMessage.FAIL_MESSAGE_BODY.format(name=self.name, message=response['message'])
+            return ResultObject(False, str(), message=user_message, wait_time=1)
+        else:
+            return ResultObject(True, response)
+
     def _public_api(self, path, extra=None):
         if extra is None:
             extra = dict()
 
         try:
-            rq = requests.get(Urls.BASE + path, params=extra)
-            response = rq.json()
+            rq = get_session().get(Urls.BASE + path, params=extra, timeout=TIMEOUT)
+            return self._parse_response(rq.json(), path, extra)
+
+        except Exception:
+            debugger.exception('FATAL: Bithumb, _public_api')
+            return ResultObject(False, str(), message=WarningMessage.EXCEPTION_RAISED.format(name=self.name), wait_time=1)
 
-            if 'message' in response:
-                message = MessageDebug.FAIL_RESPONSE_DETAILS.format(name=self.name, body=response['message'],
-                                                                    path=path, parameter=extra)
-                debugger.debug(message)
+    async def _async_public_api(self, path, extra=None):
+        if extra is None:
+            extra = dict()
 
-                user_message = WarningMessage.FAIL_MESSAGE_BODY.format(name=self.name, message=response['message'])
-                return ResultObject(False, str(), message=user_message, wait_time=1)
-            else:
-                return ResultObject(True, response)
+        try:
+            async with get_async_session().get(Urls.BASE + path, params=extra) as rq:
+                response = await rq.json(content_type=None)
+            return self._parse_response(response, path, extra)
 
         except Exception:
-            debugger.exception('FATAL: Bithumb, _public_api')
+            debugger.exception('FATAL: Bithumb, _async_public_api')
             return ResultObject(False, str(), message=WarningMessage.EXCEPTION_RAISED.format(name=self.name), wait_time=1)
 
+    def _get_cached_tickers(self):
+        fetched_time, result = self._tickers_cache
+        if result is not None and time.time() - fetched_time < self.TICKERS_CACHE_TTL:
+            return result
+        return None
+
+    def _set_tickers_cache(self, result_object_btc_market, result_object_krw_market):
+        """
+            returns ResultObject of both markets, None if any of them is failed
+        """
+        if not (result_object_btc_market.success and result_object_krw_market.success):
+            return None
+
+        btc_market_data = dict(result_object_btc_market.data['data'])
+        krw_market_data = dict(result_object_krw_market.data['data'])
+
+        btc_market_data.pop('date', None)
+        krw_market_data.pop('date', None)
+
+        all_market_pair = dict(
+            btc_market=btc_market_data,
+            krw_market=krw_market_data
+        )
+        result = ResultObject(True, all_market_pair)
+        self._tickers_cache = (time.time(), result)
+        return result
+
     def _get_tickers(self):
-        for _ in range(3):
-            result_object_btc_market = self._public_api(Urls.TICKERS.format(market='BTC'))
-            result_object_krw_market = self._public_api(Urls.TICKERS.format(market='KRW'))
+        """
+            BTC, KRW market tickers fetched at once, cached for TICKERS_CACHE_TTL and shared by concurrent callers.
+            cached data should not be modified.
+        """
+        with self._tickers_lock:
+            result = self._get_cached_tickers()
+            if result is not None:
+                return result
+
+            paths = [Urls.TICKERS.format(market='BTC'), Urls.TICKERS.format(market='KRW')]
+            for _ in range(3):
+                result_object_btc_market, result_object_krw_market = self._executor.map(self._public_api, paths)
 
-            if result_object_btc_market.success and result_object_krw_market.success:
-                btc_market_data = result_object_btc_market.data['data']
-                krw_market_data = result_object_krw_market.data['data']
+                result = self._set_tickers_cache(result_object_btc_market, result_object_krw_market)
+                if result is not None:
+                    return result
 
-                btc_market_data.pop('date')
-                krw_market_data.pop('date')
+                time.sleep(result_object_btc_market.wait_time)
+            else:
+                return ResultObject(False, str())
+
+    async def _async_get_tickers(self):
+        result = self._get_cached_tickers()
+        if result is not None:
+            return result
+
+        for _ in range(3):
+            result_object_btc_market, result_object_krw_market = await asyncio.gather(
+                self._async_public_api(Urls.TICKERS.format(market='BTC')),
+                self._async_public_api(Urls.TICKERS.format(market='KRW'))
+            )
 
-                all_market_pair = dict(
-                    btc_market=btc_market_data,
-                    krw_market=krw_market_data
-                )
-                return ResultObject(True, all_market_pair)
+            result = self._set_tickers_cache(result_object_btc_market, result_object_krw_market)
+            if result is not None:
+                return result
 
-            time.sleep(result_object_btc_market.wait_time)
+            await asyncio.sleep(result_object_btc_market.wait_time)
         else:
             return ResultObject(False, str())
 
+    def _to_sai_symbols(self, result):
+        if not result.success:
+            return list()
+
+        btc_market = result.data.get('btc_market')
+        krw_market = result.data.get('krw_market')
+
+        sai_symbols = list()
+        for trade in btc_market:
+            sai_symbol = 'BTC_{}'.format(trade)
+            sai_symbols.append(sai_symbol)
+
+        for trade in krw_market:
+            sai_symbol = 'KRW_{}'.format(trade)
+            sai_symbols.append(sai_symbol)
+
+        return sai_symbols
+
     def get_available(self):
         """
             bithumb have only BTC, KRW markets
         """
+        return self._to_sai_symbols(self._get_tickers())
 
-        result = self._get_tickers()
-        if result.success:
-            btc_market = result.data.get('btc_market')
-            krw_market = result.data.get('krw_market')
-
-            sai_symbols = list()
-            for trade in btc_market:
-                sai_symbol = 'BTC_{}'.format(trade)
-                sai_symbols.append(sai_symbol)
-
-            for trade in krw_market:
-                sai_symbol = 'KRW_{}'.format(trade)
-                sai_symbols.append(sai_symbol)
-
-            return sai_symbols
-        return list()
+    async def get_available_async(self):
+        return self._to_sai_symbols(await self._async_get_tickers())
 
-    def set_subscriber(self):
-        self._subscriber = BithumbSubscriber(self.data_store, self._lock_dic)
+    def set_subscriber(self, use_event_loop=False, recorder=None):
+        """
+            use_event_loop: if True, websocket runs as a task on the shared asyncio event loop instead of its own thread
+            recorder: FrameRecorder, received websocket frames are recorded for replay
+        """
+        if use_event_loop:
+            self._subscriber = BithumbAsyncSubscriber(self.data_store, self._lock_dic, recorder=recorder)
+        else:
+            self._subscriber = BithumbSubscriber(self.data_store, self._lock_dic, recorder=recorder)
 
     def get_orderbook(self):
         with self._lock_dic[Consts.ORDERBOOK]:
@@ -116,7 +209,7 @@ class BaseBithumb(object):
                 return ResultObject(False, message=WarningMessage.ORDERBOOK_NOT_STORED.format(name=self.name),
                                     wait_time=1)
 
-            return ResultObject(True, data_dic)
+            return ResultObject(True, {symbol: orderbook.to_dict() for symbol, orderbook in data_dic.items()})
 
     def get_trade(self):
         with self._lock_dic[Consts.TRADE]:
@@ -127,69 +220,146 @@ class BaseBithumb(object):
 
             return ResultObject(True, data_dic)
 
+    def get_orderbook_snapshot(self):
+        """
+            returns Snapshot of sai symbol -> dict(bid, ask), it's available only in snapshot mode
+        """
+        return self.data_store.get_orderbook_snapshot()
+
+    def get_trade_snapshot(self):
+        """
+            returns Snapshot of sai symbol -> dict(price, amount), it's available only in snapshot mode
+        """
+        return self.data_store.get_trade_snapshot()
+
     def get_orderbook_high_low_sync(self):
+        if self.data_store.snapshot_mode:
+            snapshot = self.data_store.get_orderbook_snapshot()
+            if not snapshot.data:
+                return ResultObject(False, message=WarningMessage.ORDERBOOK_NOT_STORED.format(name=self.name),
+                                    wait_time=1)
+            return ResultObject(True, snapshot.data)
+
         with self._lock_dic[Consts.ORDERBOOK]:
             data_dic = self.data_store.orderbook_queue
             if not self.data_store.orderbook_queue:
                 return ResultObject(False, message=WarningMessage.ORDERBOOK_NOT_STORED.format(name=self.name),
                                     wait_time=1)
 
+            # best bid/ask are maintained on ingest
             dic_ = dict()
-            for key in data_dic:
-                sai_key = bithumb_to_sai_converter(key)
-
-                bid_ask_dict = data_dic[key]
-                bid, ask = Decimal('-inf'), Decimal('inf')
-                dic_.setdefault(sai_key, dict(bid=None, ask=None))
-
-                bids_list = bid_ask_dict[Consts.BIDS]
-                asks_list = bid_ask_dict[Consts.ASKS]
-
-                for bid_dict in bids_list:
-                    bid_price = float(bid_dict['price'])
-                    bid = bid_price if bid_price > bid else bid
-                else:
-                    if bids_list:
-                        dic_[sai_key]['bid'] = bid
-
-                for ask_dict in asks_list:
-                    ask_price = float(ask_dict['price'])
-                    ask = ask_price if ask_price < ask else ask
-                else:
-                    if asks_list:
-                        dic_[sai_key]['ask'] = ask
-            else:
-                return ResultObject(True, dic_)
+            for key, orderbook in data_dic.items():
+                dic_[bithumb_to_sai_converter(key)] = dict(bid=orderbook.best_bid, ask=orderbook.best_ask)
+
+            return ResultObject(True, dic_)
 
     async def get_orderbook_high_low(self):
         return self.get_orderbook_high_low_sync()
 
+    def get_orderbook_depth_sync(self, symbols=None):
+        """
+            symbols: sai symbols, default is every stored symbol
+            returns sai symbol -> dict(bids=[(price, amount), ...], asks=[...]), best levels first
+            levels are bounded by Consts.ORDERBOOK_LIMITATION
+        """
+        with self._lock_dic[Consts.ORDERBOOK]:
+            data_dic = self.data_store.orderbook_queue
+            if not data_dic:
+                return ResultObject(False, message=WarningMessage.ORDERBOOK_NOT_STORED.format(name=self.name),
+                                    wait_time=1)
+
+            if symbols is None:
+                symbols = [bithumb_to_sai_converter(key) for key in data_dic]
+
+            dic_ = dict()
+            for symbol in symbols:
+                orderbook = data_dic.get(sai_to_bithumb_converter(symbol))
+                if orderbook is not None:
+                    dic_[symbol] = {Consts.BIDS: orderbook.bids, Consts.ASKS: orderbook.asks}
+
+            return ResultObject(True, dic_)
+
     def get_latest_trade(self):
+        """
+            returns versioned snapshot of latest trades, sai symbol -> dict(price, amount)
+            the same object is returned until new trades are stored, do not modify it.
+        """
+        if self.data_store.snapshot_mode:
+            snapshot = self.data_store.get_trade_snapshot()
+            if not snapshot.data:
+                return ResultObject(False, message=WarningMessage.TRADE_NOT_STORED.format(name=self.name),
+                                    wait_time=1)
+            return ResultObject(True, snapshot.data)
+
         with self._lock_dic[Consts.TRADE]:
             data_dic = self.data_store.trade_queue
             if not self.data_store.trade_queue:
                 return ResultObject(False, message=WarningMessage.TRADE_NOT_STORED.format(name=self.name),
                                     wait_time=1)
 
+            version, snapshot = self._latest_trade_snapshot
+            if version == self.data_store.trade_version:
+                return snapshot
+
             dic_ = dict()
-            for key in data_dic:
-                sai_key = bithumb_to_sai_converter(key)
-                trade_dic = data_dic[key]
+            for key, trade_dic in data_dic.items():
+                dic_[bithumb_to_sai_converter(key)] = trade_dic['latest']
 
-                dic_.setdefault(sai_key, dict())
-                dic_[sai_key] = trade_dic['latest']
-            else:
-                return ResultObject(True, dic_)
+            snapshot = ResultObject(True, dic_)
+            self._latest_trade_snapshot = (self.data_store.trade_version, snapshot)
+            return snapshot
+
+    def get_latest_trade_by_symbol(self, symbol):
+        """
+            symbol: sai symbol, ex) KRW_BTC
+            returns dict(price, amount) of the latest trade of the symbol
+        """
+        if self.data_store.snapshot_mode:
+            trade = self.data_store.get_trade_record(symbol)
+            if not trade:
+                return ResultObject(False, message=WarningMessage.TRADE_NOT_STORED.format(name=self.name),
+                                    wait_time=1)
+            return ResultObject(True, trade)
+
+        with self._lock_dic[Consts.TRADE]:
+            trade_dic = self.data_store.trade_queue.get(sai_to_bithumb_converter(symbol))
+            if not trade_dic:
+                return ResultObject(False, message=WarningMessage.TRADE_NOT_STORED.format(name=self.name),
+                                    wait_time=1)
+
+            return ResultObject(True, trade_dic['latest'])
+
+    def pop_updated_orderbook_symbols(self):
+        """
+            return sai symbols whose orderbook changed since the last call and reset them.
+        """
+        with self._lock_dic[Consts.ORDERBOOK]:
+            updated = self.data_store.updated_orderbook_symbols
+            self.data_store.updated_orderbook_symbols = set()
+
+        return {bithumb_to_sai_converter(symbol) for symbol in updated}
+
+    def pop_updated_trade_symbols(self):
+        """
+            return sai symbols that got new trades since the last call and reset them.
+        """
+        with self._lock_dic[Consts.TRADE]:
+            updated = self.data_store.updated_trade_symbols
+            self.data_store.updated_trade_symbols = set()
+
+        return {bithumb_to_sai_converter(symbol) for symbol in updated}
+
+    def _wait_subscriber_open(self):
+        if not self._subscriber.wait_until_open(self.SUBSCRIBER_OPEN_TIMEOUT):
+            debugger.warning('{}::: websocket is not opened in {} seconds'.format(
+                self.name, self.SUBSCRIBER_OPEN_TIMEOUT))
 
     def set_subscribe_orderbook(self, coin):
         """
             subscribe orderbook.
             coin: it can be list or string, [XRP_BTC, ETH_BTC]
         """
-        for _ in range(10):
-            time.sleep(1)
-            if self._subscriber.keep_running:
-                break
+        self._wait_subscriber_open()
 
         coin = list(map(sai_to_bithumb_converter, coin)) if isinstance(coin, (set, list)) \
             else sai_to_bithumb_converter(coin)
@@ -203,10 +373,7 @@ class BaseBithumb(object):
             subscribe trade detail.
             coin: it can be list or string, [XRP_BTC, ETH_BTC]
         """
-        for _ in range(10):
-            time.sleep(1)
-            if self._subscriber.keep_running:
-                break
+        self._wait_subscriber_open()
 
         coin = list(map(sai_to_bithumb_converter, coin)) if isinstance(coin, (set, list)) \
             else sai_to_bithumb_converter(coin)
@@ -4,34 +4,56 @@ except ImportError:
     import _thread as thread
 
 import json
+import logging
+import threading
+import time
 import websocket
 import gzip
 
 from util import debugger
+from metrics import metrics
 from BaseApi.Bithumb.config import Urls, BithumbConsts
+from BaseApi.Bithumb.utils import bithumb_to_sai_converter
 from BaseApi.settings import Consts
+from BaseApi.objects import OrderBook
+from BaseApi.decoder import get_decoder, peek_type
 
 from websocket import WebSocketConnectionClosedException
 from threading import Event
 
 
-class BithumbSubscriber(websocket.WebSocketApp):
-    def __init__(self, data_store, lock_dic):
+class BithumbMessageHandler(object):
+    """
+        subscribe set & receivers shared by websocket subscribers, they feed the same DataStore.
+        subclass should implement _send_with_subscribe_set(topic)
+    """
+    EXCHANGE = 'bithumb'
+
+    def _init_message_handler(self, data_store, lock_dic, decoder_name=None, recorder=None):
         """
-            data_store: An object for storing orderbook&candle data, using orderbook&candle queue in this object.
-            lock_dic: dictionary for avoid race condition, {orderbook: Lock, candle: Lock}
+            decoder_name: json decoder for frames, orjson, ujson or json. default is the fastest installed one
+            recorder: FrameRecorder, every received frame is recorded if it's given
         """
-        debugger.debug('BithumbSubscriber::: start')
-
-        super(BithumbSubscriber, self).__init__(Urls.Websocket.BASE, on_message=self.on_message)
-
-        websocket.enableTrace(True)
         self.data_store = data_store
-        self.name = 'bithumb_subscriber'
-        self._default_socket_id = 1
-        self._unsub_id = 2
-        self._stopped = Event()
         self._lock_dic = lock_dic
+        self._recorder = recorder
+
+        # set while websocket is open
+        self.opened = threading.Event()
+
+        self._loads = get_decoder(decoder_name)
+        self._receiver_dict = {
+            BithumbConsts.ORDERBOOK: self.orderbook_receiver,
+            BithumbConsts.CANDLE: self.candle_receiver,
+            BithumbConsts.TRADE: self.trade_receiver
+        }
+        self._channel_dict = {
+            BithumbConsts.ORDERBOOK: Consts.ORDERBOOK,
+            BithumbConsts.CANDLE: Consts.CANDLE,
+            BithumbConsts.TRADE: Consts.TRADE
+        }
+        # frame type -> (messages counter, ingest latency histogram)
+        self._message_metric_dict = dict()
 
         self._candle_symbol_set = set()
         self._orderbook_symbol_set = set()
@@ -39,8 +61,6 @@ class BithumbSubscriber(websocket.WebSocketApp):
 
         self.subscribe_set = dict()
 
-        self.start_run_forever_thread()
-
     def _remove_contents(self, symbol, symbol_set):
         try:
             symbol_set.remove(symbol)
@@ -48,17 +68,13 @@ class BithumbSubscriber(websocket.WebSocketApp):
             debugger.debug('BithumbSubscriber::: remove error, [{}]'.format(ex))
 
     def _send_with_subscribe_set(self, topic):
-        data = self.subscribe_set[topic]
-        debugger.debug('Bithumb subscribe topic - [{}], subscribe set - [{}]'.format(topic, data))
-        self.send(json.dumps(data))
+        raise NotImplementedError
 
-    def start_run_forever_thread(self):
-        debugger.debug('BithumbSubscriber::: start_run_forever_thread')
-        self.subscribe_thread = threading.Thread(target=self.run_forever, daemon=True)
-        self.subscribe_thread.start()
-
-    def stop(self):
-        self._stopped.set()
+    def wait_until_open(self, timeout=None):
+        """
+            returns True if websocket is open within timeout
+        """
+        return self.opened.wait(timeout)
 
     def subscribe_orderbook(self, value):
         debugger.debug('BithumbSubscriber::: subscribe_orderbook')
@@ -100,86 +116,156 @@ class BithumbSubscriber(websocket.WebSocketApp):
         self._remove_contents(symbol, self._trade_symbol_set)
         self.subscribe_trade(symbol)
 
-    def on_message(self, *args):
-        message, *_ = args
-        try:
-            data = json.loads(message)
-            type_ = data.get('type', None)
-            if not type_:
-                return
-
-            if type_ == BithumbConsts.ORDERBOOK:
-                self.orderbook_receiver(data)
-            elif type_ == BithumbConsts.CANDLE:
-                self.candle_receiver(data)
-            elif type_ == BithumbConsts.TRADE:
-                self.trade_receiver(data)
-
-        except WebSocketConnectionClosedException:
-            debugger.debug('BithumbSubscriber::: Disconnected orderbook websocket.')
-            self.stop()
-            raise WebSocketConnectionClosedException
-
-        except Exception as ex:
-            debugger.exception('BithumbSubscriber::: Unexpected error from Websocket thread.')
-            self.stop()
-            raise ex
+    def _get_message_metrics(self, type_):
+        message_metrics = self._message_metric_dict.get(type_)
+        if message_metrics is None:
+            channel = self._channel_dict.get(type_, 'other')
+            message_metrics = self._message_metric_dict[type_] = (
+                metrics.counter('messages_total', exchange=self.EXCHANGE, channel=channel),
+                metrics.histogram('stage_seconds', stage='ingest', exchange=self.EXCHANGE, channel=channel)
+            )
+        return message_metrics
+
+    def handle_message(self, message):
+        received_at = time.perf_counter()
+        if self._recorder is not None:
+            self._recorder.write(message)
+
+        # dispatch on type from the head of the frame, frames without receiver are not decoded at all
+        type_ = peek_type(message)
+        if type_ is None:
+            data = self._loads(message)
+            type_ = data.get('type', None) if isinstance(data, dict) else None
+            if type_ in self._receiver_dict:
+                self._receiver_dict[type_](data)
+        else:
+            receiver = self._receiver_dict.get(type_)
+            if receiver is not None:
+                receiver(self._loads(message))
+
+        # receipt to store update
+        message_counter, ingest_histogram = self._get_message_metrics(type_)
+        message_counter.inc()
+        ingest_histogram.observe(time.perf_counter() - received_at)
 
     def candle_receiver(self, data):
         pass
 
     def orderbook_receiver(self, data):
-        # data could contain more than one symbol
+        # data could contain more than one symbol, each item is a delta of a price level
         with self._lock_dic[Consts.ORDERBOOK]:
             content = data['content']
             orderbook_list = content['list']
 
-            _dic = dict()
+            orderbook_queue = self.data_store.orderbook_queue
+            updated_orderbook_dict = dict()
             for each in orderbook_list:
                 symbol = each['symbol']
 
-                detail_list = _dic.setdefault(symbol, list())
-                detail_list.append(each)
-
-            for symbol in _dic:
-                if symbol not in self.data_store.orderbook_queue:
-                    self.data_store.orderbook_queue.setdefault(symbol, dict(bids=list(), asks=list()))
-                else:
-                    self.data_store.orderbook_queue[symbol] = dict(bids=list(), asks=list())
+                orderbook = orderbook_queue.get(symbol)
+                if orderbook is None:
+                    orderbook = orderbook_queue[symbol] = OrderBook()
 
-                for detail in detail_list:
-                    price = detail['price']
-                    amount = detail['quantity']
-                    order_type = detail['orderType']
+                orderbook.apply(each['orderType'], float(each['price']), float(each['quantity']))
+                updated_orderbook_dict[symbol] = orderbook
 
-                    _detail = dict(price=price, amount=amount)
+            self.data_store.updated_orderbook_symbols.update(updated_orderbook_dict)
+            self.data_store.orderbook_version += 1
+            self.data_store.orderbook_updated_at = time.time()
 
-                    if order_type == Consts.BID:
-                        self.data_store.orderbook_queue[symbol][Consts.BIDS].append(_detail)
-                    elif order_type == Consts.ASK:
-                        self.data_store.orderbook_queue[symbol][Consts.ASKS].append(_detail)
+            if self.data_store.snapshot_mode:
+                self.data_store.publish_orderbook_snapshot({
+                    bithumb_to_sai_converter(symbol): dict(bid=orderbook.best_bid, ask=orderbook.best_ask)
+                    for symbol, orderbook in updated_orderbook_dict.items()
+                })
 
     def trade_receiver(self, data):
         with self._lock_dic[Consts.TRADE]:
             content = data['content']
             transaction_list = content['list']
 
-            _dic = dict()
+            trade_queue = self.data_store.trade_queue
+            updated_trade_dict = dict()
             for each in transaction_list:
                 symbol = each['symbol']
 
-                detail_list = _dic.setdefault(symbol, list())
-                detail_list.append(each)
+                trade_dic = trade_queue.get(symbol)
+                if trade_dic is None:
+                    trade_dic = trade_queue[symbol] = dict(buy=None, sell=None, latest=None)
+
+                trade_ = dict(price=float(each['contPrice']), amount=float(each['contQty']))
+                direction = Consts.SELL if each['buySellGb'] == '1' else Consts.BUY
+
+                trade_dic[direction] = trade_
+                trade_dic['latest'] = trade_
+                updated_trade_dict[symbol] = trade_
 
-            for symbol in _dic:
-                if symbol not in self.data_store.trade_queue:
-                    self.data_store.trade_queue.setdefault(symbol, dict(buy=None, sell=None, latest=None))
+            self.data_store.updated_trade_symbols.update(updated_trade_dict)
+            self.data_store.trade_version += 1
+            self.data_store.trade_updated_at = time.time()
 
-                for detail in detail_list:
-                    price = float(detail['contPrice'])
-                    amount = float(detail['contQty'])
-                    direction = Consts.SELL if detail['buySellGb'] == '1' else Consts.BUY
+            if self.data_store.snapshot_mode:
+                # latest trade dict is created per trade and never modified, so it's shared as it is
+                self.data_store.publish_trade_snapshot({
+                    bithumb_to_sai_converter(symbol): trade_ for symbol, trade_ in updated_trade_dict.items()
+                })
 
-                    trade_ = dict(price=price, amount=amount)
-                    self.data_store.trade_queue[symbol][direction] = trade_
-                    self.data_store.trade_queue[symbol]['latest'] = trade_
+
+class BithumbSubscriber(BithumbMessageHandler, websocket.WebSocketApp):
+    def __init__(self, data_store, lock_dic, recorder=None):
+        """
+            data_store: An object for storing orderbook&candle data, using orderbook&candle queue in this object.
+            lock_dic: dictionary for avoid race condition, {orderbook: Lock, candle: Lock}
+            recorder: FrameRecorder for received frames
+        """
+        debugger.debug('BithumbSubscriber::: start')
+
+        super(BithumbSubscriber, self).__init__(Urls.Websocket.BASE, on_message=self.on_message,
+                                                on_open=self.on_open, on_close=self.on_close)
+
+        # frame trace is written for every frame, only when debug log is on
+        websocket.enableTrace(debugger.isEnabledFor(logging.DEBUG))
+        self._init_message_handler(data_store, lock_dic, recorder=recorder)
+        self.name = 'bithumb_subscriber'
+        self._default_socket_id = 1
+        self._unsub_id = 2
+        self._stopped = Event()
+
+        self.start_run_forever_thread()
+
+    def _send_with_subscribe_set(self, topic):
+        data = self.subscribe_set[topic]
+        debugger.debug('Bithumb subscribe topic - [{}], subscribe set - [{}]'.format(topic, data))
+        self.send(json.dumps(data))
+
+    def start_run_forever_thread(self):
+        debugger.debug('BithumbSubscriber::: start_run_forever_thread')
+        self.subscribe_thread = threading.Thread(target=self.run_forever, daemon=True)
+        self.subscribe_thread.start()
+
+    def stop(self):
+        self._stopped.set()
+
+    def on_open(self, *args):
+        debugger.debug('BithumbSubscriber::: websocket is opened')
+        self.opened.set()
+
+    def on_close(self, *args):
+        debugger.debug('BithumbSubscriber::: websocket is closed')
+        self.opened.clear()
+
+    def on_message(self, *args):
+        # websocket-client >= 1.0 passes (ws, message) even to bound methods, older one passes (message,)
+        message = args[-1]
+        try:
+            self.handle_message(message)
+
+        except WebSocketConnectionClosedException:
+            debugger.debug('BithumbSubscriber::: Disconnected orderbook websocket.')
+            self.stop()
+            raise WebSocketConnectionClosedException
+
+        except Exception as ex:
+            debugger.exception('BithumbSubscriber::: Unexpected error from Websocket thread.')
+            self.stop()
+            raise ex
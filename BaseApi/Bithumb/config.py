@@ -1,10 +1,14 @@
+import os
+
+
 class Urls(object):
-    BASE = 'https://api.bithumb.com'
+    # overridable by environment variables, ex) local stand-in server for load test
+    BASE = os.environ.get('BITHUMB_BASE_URL', 'https://api.bithumb.com')
 
     TICKERS = '/public/ticker/ALL_{market}'
 
     class Websocket(object):
-        BASE = 'wss://pubwss.bithumb.com/pub/ws'
+        BASE = os.environ.get('BITHUMB_WEBSOCKET_URL', 'wss://pubwss.bithumb.com/pub/ws')
 
 
 class BithumbConsts(object):
@@ -0,0 +1,32 @@
+from util import debugger
+from BaseApi.Bithumb.base_subscriber import BithumbMessageHandler
+from BaseApi.recorder import FrameReplayer
+
+
+class BithumbReplaySubscriber(BithumbMessageHandler):
+    """
+        feeds frames recorded by FrameRecorder into DataStore instead of websocket, no network is used.
+        recorded frames are replayed as they are, subscriptions don't filter them.
+    """
+    def __init__(self, data_store, lock_dic, path, speed=1.0):
+        """
+            path: file written by FrameRecorder
+            speed: 1 is recorded speed, N is N times faster, 0 is as fast as possible
+        """
+        debugger.debug('BithumbReplaySubscriber::: start')
+
+        self._init_message_handler(data_store, lock_dic)
+        self.name = 'bithumb_replay_subscriber'
+        self.keep_running = True
+        self.opened.set()
+
+        self.replayer = FrameReplayer(path, self.handle_message, speed)
+
+    def _send_with_subscribe_set(self, topic):
+        debugger.debug('BithumbReplaySubscriber::: subscribe topic - [{}] is ignored'.format(topic))
+
+    def start(self):
+        self.replayer.start()
+
+    def stop(self):
+        self.replayer.stop()
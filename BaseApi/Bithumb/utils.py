@@ -1,9 +1,14 @@
+from functools import lru_cache
+
+
+@lru_cache(maxsize=None)
 def sai_to_bithumb_converter(pair):
     # BTC_XRP -> XRP_BTC
     market, trade = pair.split('_')
     return '{}_{}'.format(trade, market)
 
 
+@lru_cache(maxsize=None)
 def bithumb_to_sai_converter(pair):
     # XRP_BTC -> BTC_XRP
     trade, market = pair.split('_')
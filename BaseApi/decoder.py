@@ -0,0 +1,51 @@
+"""
+json decoder for websocket frames, the fastest installed one is used.
+orjson > ujson > json
+"""
+import json
+import re
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+
+DECODER_DICT = {'json': json.loads}
+
+if ujson is not None:
+    DECODER_DICT['ujson'] = ujson.loads
+
+if orjson is not None:
+    DECODER_DICT['orjson'] = orjson.loads
+
+DEFAULT_DECODER_NAME = 'orjson' if orjson is not None else 'ujson' if ujson is not None else 'json'
+
+# type is looked up only in the head of the frame, exchanges put it before the payload
+PEEK_LENGTH = 128
+_TYPE_PATTERN = re.compile(r'"type"\s*:\s*"([^"]+)"')
+_TYPE_BYTES_PATTERN = re.compile(rb'"type"\s*:\s*"([^"]+)"')
+
+
+def get_decoder(name=None):
+    """
+        returns loads function, name: one of DECODER_DICT keys, default is the fastest installed one
+    """
+    return DECODER_DICT[name or DEFAULT_DECODER_NAME]
+
+
+def peek_type(message):
+    """
+        returns value of "type" from the head of raw frame without decoding it, None if it's not found
+    """
+    if isinstance(message, str):
+        matched = _TYPE_PATTERN.search(message, 0, PEEK_LENGTH)
+        return matched.group(1) if matched else None
+
+    matched = _TYPE_BYTES_PATTERN.search(message, 0, PEEK_LENGTH)
+    return matched.group(1).decode() if matched else None
@@ -0,0 +1,36 @@
+import asyncio
+import threading
+
+from util import debugger
+
+
+class SharedEventLoop(object):
+    """
+        one asyncio event loop running on a dedicated daemon thread.
+        every asyncio subscriber runs its websocket as a task on this loop instead of its own thread.
+    """
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run_forever, name='shared_event_loop', daemon=True)
+        self._thread.start()
+
+    @classmethod
+    def instance(cls):
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls()
+            return cls._instance
+
+    def _run_forever(self):
+        debugger.debug('SharedEventLoop::: start')
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def run_coroutine(self, coroutine):
+        """
+            schedule coroutine from any thread, returns concurrent.futures.Future
+        """
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop)
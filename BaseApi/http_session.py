@@ -0,0 +1,53 @@
+"""
+process wide pooled http sessions shared by exchange baseapis, connections are kept alive between requests
+"""
+import asyncio
+import threading
+
+import aiohttp
+import requests
+
+from requests.adapters import HTTPAdapter
+
+
+POOL_CONNECTIONS = 10
+POOL_MAXSIZE = 20
+TIMEOUT = 10
+
+_lock = threading.Lock()
+_session = None
+
+# event loop -> aiohttp.ClientSession, aiohttp session can be used only on the loop it's created
+_async_session_dict = dict()
+
+
+def get_session():
+    global _session
+    if _session is None:
+        with _lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                _session = session
+    return _session
+
+
+def get_async_session():
+    """
+        should be called in a coroutine, returns aiohttp session of the running loop
+    """
+    loop = asyncio.get_running_loop()
+    session = _async_session_dict.get(loop)
+    if session is None or session.closed:
+        connector = aiohttp.TCPConnector(limit=POOL_MAXSIZE)
+        session = _async_session_dict[loop] = aiohttp.ClientSession(
+            connector=connector, timeout=aiohttp.ClientTimeout(total=TIMEOUT))
+    return session
+
+
+async def close_async_session():
+    session = _async_session_dict.pop(asyncio.get_running_loop(), None)
+    if session is not None:
+        await session.close()
@@ -1,3 +1,9 @@
+from bisect import bisect_left, insort
+from threading import Lock
+
+from BaseApi.settings import Consts
+
+
 class OrderIdObject(object):
     def __init__(self, price, qty, currency, uuid, is_ask):
         self.price = price
@@ -15,8 +21,18 @@ class ResultObject(object):
         self.wait_time = wait_time
 
 
+class Snapshot(object):
+    """
+        point-in-time view of records staged by writers, neither data nor its records are modified after published.
+        it's published at most once per read, so writers never copy the whole data per frame.
+    """
+    def __init__(self, version, data):
+        self.version = version
+        self.data = data
+
+
 class DataStore(object):
-    def __init__(self):
+    def __init__(self, snapshot_mode=False):
         self.channel_set = dict()
         self.activated_channels = list()
         self.orderbook_queue = dict()
@@ -24,6 +40,150 @@ class DataStore(object):
         self.candle_queue = dict()
         self.trade_queue = dict()
 
+        # symbols updated since the last pop, for incremental consumers
+        self.updated_orderbook_symbols = set()
+        self.updated_trade_symbols = set()
+
+        # increased on every update, for consumers caching snapshots
+        self.orderbook_version = 0
+        self.trade_version = 0
+
+        # epoch seconds of the last update, for quote age
+        self.orderbook_updated_at = None
+        self.trade_updated_at = None
+
+        # copy-on-write snapshots, published only in snapshot mode
+        self.snapshot_mode = snapshot_mode
+        self.orderbook_snapshot = Snapshot(0, dict())
+        self.trade_snapshot = Snapshot(0, dict())
+
+        # records written since the last publish, symbol -> record.
+        # writers only stage changed records, the snapshot is copied once when a reader asks for it
+        self._pending_orderbook_dict = dict()
+        self._pending_trade_dict = dict()
+        self._snapshot_lock = Lock()
+
+    def publish_orderbook_snapshot(self, record_dict):
+        """
+            record_dict: symbol -> new record, it's staged and merged into the next orderbook snapshot
+            should be called by the writer holding orderbook lock
+        """
+        with self._snapshot_lock:
+            self._pending_orderbook_dict.update(record_dict)
+
+    def publish_trade_snapshot(self, record_dict):
+        """
+            record_dict: symbol -> new record, it's staged and merged into the next trade snapshot
+            should be called by the writer holding trade lock
+        """
+        with self._snapshot_lock:
+            self._pending_trade_dict.update(record_dict)
+
+    def get_orderbook_snapshot(self):
+        """
+            returns the current orderbook Snapshot, staged records are merged into a new one first
+        """
+        with self._snapshot_lock:
+            if self._pending_orderbook_dict:
+                data = dict(self.orderbook_snapshot.data)
+                data.update(self._pending_orderbook_dict)
+                self._pending_orderbook_dict = dict()
+                self.orderbook_snapshot = Snapshot(self.orderbook_version, data)
+
+            return self.orderbook_snapshot
+
+    def get_trade_snapshot(self):
+        """
+            returns the current trade Snapshot, staged records are merged into a new one first
+        """
+        with self._snapshot_lock:
+            if self._pending_trade_dict:
+                data = dict(self.trade_snapshot.data)
+                data.update(self._pending_trade_dict)
+                self._pending_trade_dict = dict()
+                self.trade_snapshot = Snapshot(self.trade_version, data)
+
+            return self.trade_snapshot
+
+    def get_trade_record(self, symbol):
+        """
+            returns the latest trade record of the symbol without publishing a new snapshot
+        """
+        with self._snapshot_lock:
+            record = self._pending_trade_dict.get(symbol)
+            if record is None:
+                record = self.trade_snapshot.data.get(symbol)
+
+            return record
+
+
+class OrderBook(object):
+    """
+        price levels of a symbol maintained from depth deltas.
+        both sides are sorted with the best level first and capped at limit, the worst levels are dropped.
+        amount 0 removes the level.
+    """
+    def __init__(self, limit=Consts.ORDERBOOK_LIMITATION):
+        self.limit = limit
+
+        # price -> amount
+        self._bid_dict = dict()
+        self._ask_dict = dict()
+
+        # ascending keys, bids are stored as negative price so the best level is always first
+        self._bid_keys = list()
+        self._ask_keys = list()
+
+    @property
+    def best_bid(self):
+        return -self._bid_keys[0] if self._bid_keys else None
+
+    @property
+    def best_ask(self):
+        return self._ask_keys[0] if self._ask_keys else None
+
+    @property
+    def bids(self):
+        return [(-key, self._bid_dict[-key]) for key in self._bid_keys]
+
+    @property
+    def asks(self):
+        return [(key, self._ask_dict[key]) for key in self._ask_keys]
+
+    def apply(self, order_type, price, amount):
+        """
+            order_type: Consts.BID or Consts.ASK
+            price, amount: float
+        """
+        if order_type == Consts.BID:
+            self._apply(self._bid_dict, self._bid_keys, price, -price, amount)
+        elif order_type == Consts.ASK:
+            self._apply(self._ask_dict, self._ask_keys, price, price, amount)
+
+    def _apply(self, level_dict, keys, price, key, amount):
+        if not amount:
+            if level_dict.pop(price, None) is not None:
+                del keys[bisect_left(keys, key)]
+            return
+
+        if price not in level_dict:
+            if len(keys) >= self.limit and key > keys[-1]:
+                # worse than every level we keep
+                return
+
+            insort(keys, key)
+            if len(keys) > self.limit:
+                worst_key = keys.pop()
+                level_dict.pop(-worst_key if level_dict is self._bid_dict else worst_key)
+
+        level_dict[price] = amount
+
+    def to_dict(self):
+        return {
+            Consts.BIDS: [dict(price=price, amount=amount) for price, amount in self.bids],
+            Consts.ASKS: [dict(price=price, amount=amount) for price, amount in self.asks]
+        }
+
 
 class ExchangeInfo(object):
     """
@@ -0,0 +1,124 @@
+"""
+raw websocket frame recorder & replayer
+file is gzip, one frame per line as "<epoch seconds>\t<frame>", appended by every recorder session
+"""
+import gzip
+import queue
+import threading
+import time
+import zlib
+
+from util import debugger
+
+
+class FrameRecorder(threading.Thread):
+    """
+        append received frames with receipt timestamp, compression and disk writes run in this thread
+        so the websocket thread only puts frames into a queue.
+    """
+    FLUSH_INTERVAL = 1
+
+    def __init__(self, path):
+        super(FrameRecorder, self).__init__(daemon=True)
+        self.path = path
+        self._queue = queue.SimpleQueue()
+        self._stopped = threading.Event()
+
+        self.start()
+
+    def write(self, frame, received_at=None):
+        self._queue.put((received_at or time.time(), frame))
+
+    def _format_line(self, received_at, frame):
+        if isinstance(frame, (bytes, bytearray)):
+            frame = frame.decode()
+
+        # raw newline can't be inside json string, so it's insignificant whitespace
+        return '{:.6f}\t{}\n'.format(received_at, frame.replace('\n', ' '))
+
+    def run(self):
+        with gzip.open(self.path, 'at') as f:
+            last_flushed_at = time.time()
+            while not (self._stopped.is_set() and self._queue.empty()):
+                try:
+                    received_at, frame = self._queue.get(timeout=self.FLUSH_INTERVAL)
+                    f.write(self._format_line(received_at, frame))
+                except queue.Empty:
+                    pass
+                except Exception:
+                    debugger.exception('FrameRecorder::: failed to write frame')
+
+                if time.time() - last_flushed_at >= self.FLUSH_INTERVAL:
+                    f.flush()
+                    last_flushed_at = time.time()
+
+    def stop(self):
+        """
+            write queued frames and close the file
+        """
+        self._stopped.set()
+        self.join()
+
+
+def read_frames(path):
+    """
+        yields (epoch seconds, frame) in recorded order, stops at the truncated tail of an unclosed file
+    """
+    with gzip.open(path, 'rt') as f:
+        try:
+            for line in f:
+                received_at, _, frame = line.rstrip('\n').partition('\t')
+                if frame:
+                    yield float(received_at), frame
+        except (EOFError, zlib.error):
+            debugger.debug('read_frames::: [{}] is truncated'.format(path))
+
+
+class FrameReplayer(threading.Thread):
+    """
+        feed recorded frames into handler(frame) keeping recorded intervals
+        speed: 1 is recorded speed, N is N times faster, 0 is as fast as possible
+    """
+    def __init__(self, path, handler, speed=1.0):
+        super(FrameReplayer, self).__init__(daemon=True)
+        self.path = path
+        self.handler = handler
+        self.speed = speed
+        self._stopped = threading.Event()
+
+        self.frame_count = 0
+        self.elapsed = 0
+
+    def replay(self):
+        """
+            replay in the calling thread, returns number of frames fed
+        """
+        started_at = time.perf_counter()
+        first_received_at = None
+
+        for received_at, frame in read_frames(self.path):
+            if self._stopped.is_set():
+                break
+
+            if self.speed:
+                if first_received_at is None:
+                    first_received_at = received_at
+
+                wait_time = (received_at - first_received_at) / self.speed - (time.perf_counter() - started_at)
+                if wait_time > 0:
+                    self._stopped.wait(wait_time)
+
+            try:
+                self.handler(frame)
+            except Exception:
+                debugger.exception('FrameReplayer::: failed to handle frame')
+            self.frame_count += 1
+
+        self.elapsed = time.perf_counter() - started_at
+        return self.frame_count
+
+    def run(self):
+        self.replay()
+
+    def stop(self):
+        self._stopped.set()
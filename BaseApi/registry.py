@@ -0,0 +1,118 @@
+"""
+exchange -> baseapi class registry, a baseapi module is imported only when its exchange is created
+"""
+import importlib
+import threading
+
+from util import debugger
+
+
+# exchange -> (module path, class name)
+ADAPTER_PATH_DICT = {
+    'binance': ('BaseApi.Binance.base_binance', 'BaseBinance'),
+    'bithumb': ('BaseApi.Bithumb.base_bithumb', 'BaseBithumb'),
+    'huobi': ('BaseApi.Huobi.base_huobi', 'BaseHuobi'),
+    'mexc': ('BaseApi.Mexc.base_mexc', 'BaseMexc'),
+    'upbit': ('BaseApi.Upbit.base_upbit', 'BaseUpbit')
+}
+
+class KwargsIndexes(object):
+    ADAPTER = 0
+    SUBSCRIBER = 1
+
+
+# exchange -> (baseapi kwargs, set_subscriber() kwargs) the baseapi accepts, the others are dropped
+ADAPTER_KWARGS_DICT = {
+    'bithumb': (('snapshot_mode',), ('use_event_loop', 'recorder'))
+}
+
+# exchange -> markets compared on the exchange, an exchange without them is not monitored
+ADAPTER_MARKETS_DICT = {
+    'binance': ('USDT',),
+    'bithumb': ('KRW',),
+    'huobi': ('USDT',),
+    'mexc': ('USDT',),
+    'upbit': ('KRW',)
+}
+
+_lock = threading.Lock()
+# exchange -> imported baseapi class
+_adapter_class_dict = dict()
+
+
+def register_adapter(exchange, module_path, class_name, adapter_kwargs=(), subscriber_kwargs=(), markets=()):
+    """
+        add or replace baseapi of the exchange,
+        ex) register_adapter('gopax', 'BaseApi.Gopax.base_gopax', 'BaseGopax', markets=('KRW',))
+        adapter_kwargs, subscriber_kwargs: names of kwargs the baseapi accepts, ex) ('snapshot_mode',)
+        markets: markets compared on the exchange, ex) ('KRW',)
+    """
+    with _lock:
+        ADAPTER_PATH_DICT[exchange] = (module_path, class_name)
+        ADAPTER_KWARGS_DICT[exchange] = (tuple(adapter_kwargs), tuple(subscriber_kwargs))
+        ADAPTER_MARKETS_DICT[exchange] = tuple(markets)
+        _adapter_class_dict.pop(exchange, None)
+
+
+def _filter_kwargs(exchange, kwargs_index, kwargs):
+    accepted = ADAPTER_KWARGS_DICT.get(exchange, ((), ()))[kwargs_index]
+    return {key: value for key, value in kwargs.items() if key in accepted}
+
+
+def get_adapter_class(exchange):
+    adapter_class = _adapter_class_dict.get(exchange)
+    if adapter_class is not None:
+        return adapter_class
+
+    if exchange not in ADAPTER_PATH_DICT:
+        raise KeyError('exchange [{}] is not registered'.format(exchange))
+
+    with _lock:
+        if exchange not in _adapter_class_dict:
+            module_path, class_name = ADAPTER_PATH_DICT[exchange]
+            debugger.debug('registry::: import [{}] for [{}]'.format(module_path, exchange))
+            _adapter_class_dict[exchange] = getattr(importlib.import_module(module_path), class_name)
+        return _adapter_class_dict[exchange]
+
+
+def create_adapter(exchange, key=None, secret=None, **kwargs):
+    """
+        kwargs: options of every exchange, only ones the baseapi accepts are passed, ex) snapshot_mode of BaseBithumb
+    """
+    return get_adapter_class(exchange)(key, secret, **_filter_kwargs(exchange, KwargsIndexes.ADAPTER, kwargs))
+
+
+def get_subscriber_kwargs(exchange, **kwargs):
+    """
+        kwargs: set_subscriber() options of every exchange, returns only ones the baseapi accepts
+    """
+    return _filter_kwargs(exchange, KwargsIndexes.SUBSCRIBER, kwargs)
+
+
+def get_markets(exchange):
+    """
+        returns markets compared on the exchange, ex) ('KRW',)
+    """
+    return ADAPTER_MARKETS_DICT.get(exchange, ())
+
+
+def parse_exchanges(value):
+    """
+        value: comma separated exchanges, ex) 'upbit, bithumb'
+        returns registered exchanges in the given order, unknown ones and ones without markets are dropped with warning
+    """
+    exchange_list = list()
+    for exchange in value.split(','):
+        exchange = exchange.strip().lower()
+        if not exchange or exchange in exchange_list:
+            continue
+
+        if exchange not in ADAPTER_PATH_DICT:
+            debugger.warning('registry::: exchange [{}] is not registered, ignored'.format(exchange))
+            continue
+
+        if not get_markets(exchange):
+            debugger.warning('registry::: exchange [{}] has no markets to compare, ignored'.format(exchange))
+            continue
+        exchange_list.append(exchange)
+    return exchange_list
@@ -0,0 +1,126 @@
+import multiprocessing
+import queue
+import threading
+
+
+class DeltaKeys(object):
+    IS_DELTA = 'is_delta'
+
+    ADDED = 'added'
+    CHANGED = 'changed'
+    REMOVED = 'removed'
+
+
+def is_delta_section(value):
+    return isinstance(value, dict) and DeltaKeys.REMOVED in value
+
+
+def merge_delta_section(pending, new):
+    """
+        merge two deltas of the same arbitrage type into one, the result is applied as if both were applied in order
+        section: {added: {key: obj}, changed: {key: obj}, removed: set(key)}
+    """
+    added = pending[DeltaKeys.ADDED]
+    changed = pending[DeltaKeys.CHANGED]
+    removed = pending[DeltaKeys.REMOVED]
+
+    for key in new[DeltaKeys.REMOVED]:
+        if added.pop(key, None) is None:
+            changed.pop(key, None)
+            removed.add(key)
+
+    for key, obj in new[DeltaKeys.ADDED].items():
+        if key in removed:
+            removed.discard(key)
+            changed[key] = obj
+        else:
+            added[key] = obj
+
+    for key, obj in new[DeltaKeys.CHANGED].items():
+        if key in added:
+            added[key] = obj
+        else:
+            changed[key] = obj
+
+    return pending
+
+
+def merge_message(pending, new):
+    """
+        coalesce unread message with new one.
+        full message replaces pending one, delta sections are merged and the other values are latest-wins
+    """
+    if pending is None or not new.get(DeltaKeys.IS_DELTA):
+        return new
+
+    for key, value in new.items():
+        if is_delta_section(value) and is_delta_section(pending.get(key)):
+            merge_delta_section(pending[key], value)
+        else:
+            pending[key] = value
+
+    return pending
+
+
+class ArbitrageChannel(object):
+    """
+        latest-wins channel from MultiExchangeCrawler to ArbitrageMonitor, it has the same put(), get() as queue.
+        unread message is replaced (full message) or merged (delta message), so it never grows.
+
+        multi_process=False: producer and consumer are threads in one process, messages are handed over without pickling
+        multi_process=True: messages go through multiprocessing.Queue(maxsize=1)
+        context: multiprocessing context of the queue, ex) multiprocessing.get_context('spawn')
+    """
+    def __init__(self, multi_process=False, delta_mode=False, context=None):
+        self.multi_process = multi_process
+        self.delta_mode = delta_mode
+
+        if multi_process:
+            self._queue = (context or multiprocessing).Queue(maxsize=1)
+        else:
+            self._condition = threading.Condition()
+            self._pending = None
+
+    def put(self, message):
+        if not self.multi_process:
+            with self._condition:
+                self._pending = merge_message(self._pending, message)
+                self._condition.notify()
+            return
+
+        while True:
+            try:
+                self._queue.put_nowait(message)
+                return
+            except queue.Full:
+                pass
+
+            # take unread message back and coalesce, consumer may have taken it already
+            try:
+                pending = self._queue.get_nowait()
+            except queue.Empty:
+                continue
+            message = merge_message(pending, message)
+
+    def get(self, timeout=None):
+        """
+            raises queue.Empty if nothing is published within timeout
+        """
+        if self.multi_process:
+            return self._queue.get(timeout=timeout)
+
+        with self._condition:
+            if self._pending is None:
+                self._condition.wait(timeout)
+
+            if self._pending is None:
+                raise queue.Empty
+
+            message, self._pending = self._pending, None
+            return message
+
+    def qsize(self):
+        if self.multi_process:
+            return 0 if self._queue.empty() else 1
+
+        return 0 if self._pending is None else 1
@@ -0,0 +1,138 @@
+"""
+benchmark of MultiExchangeCrawler crawl cycle over SyntheticMarket, no network is used.
+reports cycles/sec, p50/p99 cycle latency and allocations per symbol count and scan mode as json.
+ticks are seeded, results of different commits are comparable when they are run with the same arguments.
+
+python benchmarks/bench_crawl_cycle.py [--symbols 100 1000 10000] [--scan-modes incremental vectorized]
+                                       [--cycles 200] [--tick-rate 0.05] [--min-percent 1] [--seed 0]
+                                       [--output FILE]
+run it from the directory having config.ini, exclude db is created in a temporary directory
+"""
+import argparse
+import json
+import os
+import platform
+import queue
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_PATH)
+
+import multi_exchange_crawler
+
+from arbitrage_channel import ArbitrageChannel
+from multi_exchange_crawler import MultiExchangeCrawler, ScanModes
+from synthetic_market import SyntheticMarket, KRW_PER_USDT
+
+
+def get_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=ROOT_PATH,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+
+def percentile(sorted_values, q):
+    index = min(int(len(sorted_values) * q), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+def run_case(symbol_count, scan_mode, cycles, warmup, alloc_cycles, tick_rate, seed):
+    market = SyntheticMarket(symbol_count, tick_rate=tick_rate, seed=seed)
+    arbitrage_queue = ArbitrageChannel()
+
+    started_at = time.perf_counter()
+    crawler = MultiExchangeCrawler(arbitrage_queue, queue.Queue(), exchange_api_dict=market.exchange_api_dict,
+                                   scan_mode=scan_mode)
+    # the first cycle is a full rescan
+    crawler.run_cycle()
+    startup_seconds = time.perf_counter() - started_at
+
+    for _ in range(warmup):
+        market.tick()
+        crawler.run_cycle()
+
+    latency_list = list()
+    for _ in range(cycles):
+        market.tick()
+        cycle_started_at = time.perf_counter()
+        crawler.run_cycle()
+        latency_list.append(time.perf_counter() - cycle_started_at)
+
+        try:
+            arbitrage_queue.get(timeout=0)
+        except queue.Empty:
+            pass
+
+    # allocations are measured in separate cycles, tracing slows cycles down
+    tracemalloc.start()
+    baseline, _ = tracemalloc.get_traced_memory()
+    for _ in range(alloc_cycles):
+        market.tick()
+        crawler.run_cycle()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    if crawler.exchange_rate_service is not None:
+        crawler.exchange_rate_service.stop()
+
+    latency_list.sort()
+    return dict(
+        symbols=symbol_count,
+        scan_mode=crawler.scan_mode,
+        pairs=len(crawler.comparison_pair_index),
+        startup_seconds=round(startup_seconds, 4),
+        cycles_per_sec=round(len(latency_list) / sum(latency_list), 2),
+        p50_ms=round(percentile(latency_list, 0.5) * 1000, 4),
+        p99_ms=round(percentile(latency_list, 0.99) * 1000, 4),
+        alloc_peak_kb=round((peak - baseline) / 1024, 1),
+        alloc_retained_kb=round((current - baseline) / 1024, 1),
+        arbitrages=len(crawler._arbitrage_by_orderbook_high_low_list) + len(crawler._arbitrage_by_trade_price_list)
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--symbols', type=int, nargs='+', default=[100, 1000, 10000])
+    parser.add_argument('--scan-modes', nargs='+', default=[ScanModes.INCREMENTAL, ScanModes.VECTORIZED])
+    parser.add_argument('--cycles', type=int, default=200)
+    parser.add_argument('--warmup', type=int, default=20)
+    parser.add_argument('--alloc-cycles', type=int, default=20)
+    parser.add_argument('--tick-rate', type=float, default=0.05, help='ratio of symbols updated per cycle')
+    parser.add_argument('--min-percent', type=float, default=1.0, help='min_arbitrage_percent of the crawler')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='write json result into the file')
+    args = parser.parse_args()
+
+    # KRW_USD is not used by the scan, keep ExchangeRateService offline
+    multi_exchange_crawler.get_current_krw_usd_exchange_rate = lambda: KRW_PER_USDT
+    multi_exchange_crawler.MIN_ARBITRAGE_PERCENT = args.min_percent
+    os.chdir(tempfile.mkdtemp())
+
+    result_list = list()
+    for symbol_count in args.symbols:
+        for scan_mode in args.scan_modes:
+            result = run_case(symbol_count, scan_mode, args.cycles, args.warmup, args.alloc_cycles,
+                              args.tick_rate, args.seed)
+            print(json.dumps(result), file=sys.stderr)
+            result_list.append(result)
+
+    report = dict(
+        meta=dict(commit=get_commit(), python=platform.python_version(), machine=platform.machine(),
+                  args=vars(args)),
+        results=result_list
+    )
+    body = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(body)
+    print(body)
+
+
+if __name__ == '__main__':
+    main()
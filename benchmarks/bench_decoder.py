@@ -0,0 +1,150 @@
+"""
+micro benchmark of bithumb websocket frame handling, messages/sec of json.loads + _dic regrouping (before)
+and BithumbMessageHandler with each installed decoder (after)
+
+python benchmarks/bench_decoder.py [--frames FILE] [--count N]
+FILE: file written by FrameRecorder (.gz) or raw websocket frames, one frame per line.
+synthetic frames are used if it's not given
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from BaseApi.Bithumb.base_subscriber import BithumbMessageHandler
+from BaseApi.Bithumb.config import BithumbConsts
+from BaseApi.decoder import DECODER_DICT
+from BaseApi.recorder import read_frames
+from BaseApi.objects import DataStore, OrderBook
+from BaseApi.settings import Consts
+
+
+SYMBOLS = ['{}_KRW'.format(trade) for trade in ('BTC', 'ETH', 'XRP', 'ADA', 'DOT', 'SOL', 'EOS', 'TRX')]
+
+
+def make_orderbook_frame():
+    level_list = list()
+    for _ in range(random.randint(1, 10)):
+        level_list.append({
+            'symbol': random.choice(SYMBOLS),
+            'orderType': random.choice(['bid', 'ask']),
+            'price': str(random.randint(1000, 1100)),
+            'quantity': '{:.4f}'.format(random.choice([0, random.random() * 10])),
+            'total': str(random.randint(1, 50))
+        })
+    return json.dumps({'type': 'orderbookdepth', 'content': {'list': level_list, 'datetime': '1639000000000000'}})
+
+
+def make_trade_frame():
+    trade_list = list()
+    for _ in range(random.randint(1, 5)):
+        trade_list.append({
+            'symbol': random.choice(SYMBOLS),
+            'buySellGb': random.choice(['1', '2']),
+            'contPrice': str(random.randint(1000, 1100)),
+            'contQty': '{:.4f}'.format(random.random()),
+            'contAmt': '1000.0',
+            'contDtm': '2021-12-09 12:00:00.000000',
+            'updn': 'up'
+        })
+    return json.dumps({'type': 'transaction', 'content': {'list': trade_list}})
+
+
+def make_frames(count):
+    frames = list()
+    for _ in range(count):
+        frames.append(make_orderbook_frame() if random.random() < 0.7 else make_trade_frame())
+    return frames
+
+
+def load_frames(path):
+    if path.endswith('.gz'):
+        return [frame for _, frame in read_frames(path)]
+
+    with open(path) as f:
+        return [line.rstrip('\n') for line in f if line.strip()]
+
+
+class LegacyHandler(object):
+    """
+        handling before the decoder layer, full json.loads and _dic regrouping of every frame
+    """
+    def __init__(self):
+        self.data_store = DataStore()
+        self._lock_dic = {Consts.ORDERBOOK: threading.Lock(), Consts.TRADE: threading.Lock()}
+
+    def handle_message(self, message):
+        data = json.loads(message)
+        type_ = data.get('type', None)
+        if not type_:
+            return
+
+        if type_ == BithumbConsts.ORDERBOOK:
+            self.orderbook_receiver(data)
+        elif type_ == BithumbConsts.TRADE:
+            self.trade_receiver(data)
+
+    def orderbook_receiver(self, data):
+        with self._lock_dic[Consts.ORDERBOOK]:
+            _dic = dict()
+            for each in data['content']['list']:
+                _dic.setdefault(each['symbol'], list()).append(each)
+
+            for symbol in _dic:
+                orderbook = self.data_store.orderbook_queue.setdefault(symbol, OrderBook())
+                for each in _dic[symbol]:
+                    orderbook.apply(each['orderType'], float(each['price']), float(each['quantity']))
+                self.data_store.updated_orderbook_symbols.add(symbol)
+
+    def trade_receiver(self, data):
+        with self._lock_dic[Consts.TRADE]:
+            _dic = dict()
+            for each in data['content']['list']:
+                _dic.setdefault(each['symbol'], list()).append(each)
+
+            for symbol in _dic:
+                trade_dic = self.data_store.trade_queue.setdefault(symbol, dict(buy=None, sell=None, latest=None))
+                for detail in _dic[symbol]:
+                    direction = Consts.SELL if detail['buySellGb'] == '1' else Consts.BUY
+                    trade_ = dict(price=float(detail['contPrice']), amount=float(detail['contQty']))
+                    trade_dic[direction] = trade_
+                    trade_dic['latest'] = trade_
+                self.data_store.updated_trade_symbols.add(symbol)
+
+
+class DecoderHandler(BithumbMessageHandler):
+    def __init__(self, decoder_name):
+        lock_dic = {key: threading.Lock() for key in (Consts.ORDERBOOK, Consts.CANDLE, Consts.TRADE)}
+        self._init_message_handler(DataStore(), lock_dic, decoder_name)
+
+
+def measure(handler, frames):
+    started = time.perf_counter()
+    for frame in frames:
+        handler.handle_message(frame)
+    return len(frames) / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--frames', help='FrameRecorder file or file of raw frames, one frame per line')
+    parser.add_argument('--count', type=int, default=100000, help='number of synthetic frames')
+    args = parser.parse_args()
+
+    frames = load_frames(args.frames) if args.frames else make_frames(args.count)
+
+    result_dict = {'before (json)': measure(LegacyHandler(), frames)}
+    for name in DECODER_DICT:
+        result_dict['after ({})'.format(name)] = measure(DecoderHandler(name), frames)
+
+    for name, rate in result_dict.items():
+        print('{:<16} {:>12,.0f} msg/s'.format(name, rate))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,191 @@
+"""
+local stand-in of bithumb public api for load test, no real market data.
+REST: GET /public/ticker/ALL_{market} (KRW, BTC)
+websocket: /pub/ws, honors {"type": "orderbookdepth"|"transaction"|"ticker", "symbols": [...]} subscribe messages
+and pushes synthetic orderbookdepth/transaction frames of subscribed symbols at the given rate
+
+python benchmarks/bithumb_server.py [--port 8765] [--rate 1000] [--symbols 100]
+point the adapter at it with BITHUMB_BASE_URL=http://127.0.0.1:8765 BITHUMB_WEBSOCKET_URL=ws://127.0.0.1:8765/pub/ws
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+
+from aiohttp import web
+
+
+ORDERBOOK = 'orderbookdepth'
+TRADE = 'transaction'
+CANDLE = 'ticker'
+
+MARKETS = ('KRW', 'BTC')
+
+
+class BithumbStandInServer(object):
+    """
+        rate: frames/sec pushed to each websocket connection, spread over subscribed types and symbols
+        trade_ratio: ratio of transaction frames when both types are subscribed
+        levels: orderbook levels per orderbookdepth frame
+        sent_counter: multiprocessing.Value, increased by sent frames for the other process
+    """
+    PUSH_INTERVAL = 0.01
+
+    def __init__(self, host='127.0.0.1', port=8765, symbol_count=100, rate=1000, trade_ratio=0.3, levels=5,
+                 seed=0, sent_counter=None):
+        self.host = host
+        self.port = port
+        self.rate = rate
+        self.trade_ratio = trade_ratio
+        self.levels = levels
+        self.sent_counter = sent_counter
+        self.sent_count = 0
+
+        self._random = random.Random(seed)
+        self._price_dict = {'T{:04d}'.format(index): self._random.uniform(100, 100000)
+                            for index in range(symbol_count)}
+
+    def make_app(self):
+        app = web.Application()
+        app.router.add_get('/public/ticker/ALL_{market}', self.ticker_handler)
+        app.router.add_get('/pub/ws', self.websocket_handler)
+        return app
+
+    def run(self):
+        web.run_app(self.make_app(), host=self.host, port=self.port, print=None)
+
+    async def ticker_handler(self, request):
+        market = request.match_info['market']
+        if market not in MARKETS:
+            return web.json_response({'status': '5500', 'message': 'Invalid Parameter'})
+
+        data = dict()
+        for trade, price in self._price_dict.items():
+            price = str(round(price, 2))
+            data[trade] = {
+                'opening_price': price, 'closing_price': price, 'min_price': price, 'max_price': price,
+                'units_traded': '1', 'acc_trade_value': price, 'prev_closing_price': price,
+                'units_traded_24H': '1', 'acc_trade_value_24H': price, 'fluctate_24H': '0',
+                'fluctate_rate_24H': '0'
+            }
+        data['date'] = str(int(time.time() * 1000))
+        return web.json_response({'status': '0000', 'data': data})
+
+    async def websocket_handler(self, request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        await ws.send_str(json.dumps({'status': '0000', 'resmsg': 'Connected Successfully'}))
+
+        # type -> subscribed symbols, the latest subscribe message of the type replaces it
+        subscription_dict = dict()
+        push_task = asyncio.ensure_future(self._push(ws, subscription_dict))
+        try:
+            async for message in ws:
+                if message.type != web.WSMsgType.TEXT:
+                    continue
+
+                try:
+                    data = json.loads(message.data)
+                    type_, symbols = data['type'], data['symbols']
+                except (ValueError, KeyError, TypeError):
+                    await ws.send_str(json.dumps({'status': '5100', 'resmsg': 'Invalid Filter Syntax'}))
+                    continue
+
+                if type_ not in (ORDERBOOK, TRADE, CANDLE) or not isinstance(symbols, list):
+                    await ws.send_str(json.dumps({'status': '5100', 'resmsg': 'Invalid Filter Syntax'}))
+                    continue
+
+                subscription_dict[type_] = [symbol for symbol in symbols if isinstance(symbol, str)]
+                await ws.send_str(json.dumps({'status': '0000', 'resmsg': 'Filter Registered Successfully'}))
+        finally:
+            push_task.cancel()
+
+        return ws
+
+    def _make_orderbook_frame(self, symbols):
+        level_list = list()
+        for _ in range(self.levels):
+            symbol = self._random.choice(symbols)
+            price = self._price_dict.get(symbol.split('_')[0], 1000)
+            level_list.append({
+                'symbol': symbol,
+                'orderType': self._random.choice(['bid', 'ask']),
+                'price': str(round(price * self._random.uniform(0.99, 1.01), 2)),
+                'quantity': '{:.4f}'.format(self._random.choice([0, self._random.random() * 10])),
+                'total': str(self._random.randint(1, 10))
+            })
+
+        # send time in microseconds, the same unit as bithumb
+        return json.dumps({'type': ORDERBOOK, 'content': {'list': level_list,
+                                                          'datetime': str(int(time.time() * 1000000))}})
+
+    def _make_trade_frame(self, symbols):
+        trade_list = list()
+        for _ in range(self._random.randint(1, 3)):
+            symbol = self._random.choice(symbols)
+            price = self._price_dict.get(symbol.split('_')[0], 1000) * self._random.uniform(0.99, 1.01)
+            quantity = self._random.random()
+            trade_list.append({
+                'symbol': symbol,
+                'buySellGb': self._random.choice(['1', '2']),
+                'contPrice': str(round(price, 2)),
+                'contQty': '{:.4f}'.format(quantity),
+                'contAmt': str(round(price * quantity, 2)),
+                'contDtm': time.strftime('%Y-%m-%d %H:%M:%S.000000'),
+                'updn': self._random.choice(['up', 'dn'])
+            })
+        return json.dumps({'type': TRADE, 'content': {'list': trade_list}})
+
+    def _make_frame(self, subscription_dict):
+        orderbook_symbols = subscription_dict.get(ORDERBOOK)
+        trade_symbols = subscription_dict.get(TRADE)
+
+        if trade_symbols and (not orderbook_symbols or self._random.random() < self.trade_ratio):
+            return self._make_trade_frame(trade_symbols)
+        if orderbook_symbols:
+            return self._make_orderbook_frame(orderbook_symbols)
+        return None
+
+    async def _push(self, ws, subscription_dict):
+        loop = asyncio.get_event_loop()
+        started_at = loop.time()
+        sent = 0
+
+        while not ws.closed:
+            due = int((loop.time() - started_at) * self.rate)
+            sent_in_tick = 0
+            while sent < due and not ws.closed:
+                frame = self._make_frame(subscription_dict)
+                if frame is None:
+                    # nothing is subscribed, traffic is not accumulated
+                    sent = due
+                    break
+
+                await ws.send_str(frame)
+                sent += 1
+                sent_in_tick += 1
+
+            self.sent_count += sent_in_tick
+            if self.sent_counter is not None and sent_in_tick:
+                with self.sent_counter.get_lock():
+                    self.sent_counter.value += sent_in_tick
+
+            await asyncio.sleep(self.PUSH_INTERVAL)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--symbols', type=int, default=100)
+    parser.add_argument('--rate', type=int, default=1000, help='frames/sec per connection')
+    parser.add_argument('--trade-ratio', type=float, default=0.3)
+    parser.add_argument('--levels', type=int, default=5)
+    args = parser.parse_args()
+
+    BithumbStandInServer(args.host, args.port, args.symbols, args.rate, args.trade_ratio, args.levels).run()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,153 @@
+"""
+ingest load test of BaseBithumb against the local stand-in server (bithumb_server.py)
+for each rate, server pushes frames for --duration seconds and reports
+sustained ingest rate, drop (sent but not handled), receipt lag of orderbook frames, CPU per 1k msgs/sec
+
+python benchmarks/load_test_bithumb.py [--rates 1000 5000 20000] [--duration 10] [--asyncio]
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import re
+import sys
+import time
+import urllib.request
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from BaseApi.Bithumb.base_bithumb import BaseBithumb
+from BaseApi.Bithumb.config import Urls
+from BaseApi.settings import Consts
+from bithumb_server import BithumbStandInServer
+from metrics import metrics
+
+
+_DATETIME_PATTERN = re.compile(r'"datetime"\s*:\s*"(\d+)"')
+
+
+class LagProbe(object):
+    """
+        given to subscriber as a frame recorder, samples receipt lag of orderbookdepth frames from their send time
+    """
+    def __init__(self, sample_every=10):
+        self.sample_every = sample_every
+        self.count = 0
+        self.lag_list = list()
+
+    def write(self, frame, received_at=None):
+        self.count += 1
+        if self.count % self.sample_every:
+            return
+
+        if isinstance(frame, (bytes, bytearray)):
+            frame = frame.decode()
+
+        matched = _DATETIME_PATTERN.search(frame)
+        if matched:
+            self.lag_list.append((received_at or time.time()) - int(matched.group(1)) / 1000000)
+
+
+def run_server(port, symbol_count, rate, sent_counter):
+    BithumbStandInServer(port=port, symbol_count=symbol_count, rate=rate, sent_counter=sent_counter).run()
+
+
+def wait_server(timeout=10):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            urllib.request.urlopen(Urls.BASE + Urls.TICKERS.format(market='KRW'), timeout=1)
+            return True
+        except Exception:
+            time.sleep(0.1)
+    return False
+
+
+def get_received_count():
+    return sum(metrics.counter('messages_total', exchange='bithumb', channel=channel).get()
+               for channel in (Consts.ORDERBOOK, Consts.TRADE))
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(int(len(values) * q), len(values) - 1)]
+
+
+def run_case(port, symbol_count, rate, duration, use_event_loop):
+    sent_counter = multiprocessing.Value('q', 0)
+    server = multiprocessing.Process(target=run_server, args=(port, symbol_count, rate, sent_counter), daemon=True)
+    server.start()
+    if not wait_server():
+        server.kill()
+        raise RuntimeError('stand-in server is not started')
+
+    probe = LagProbe()
+    bithumb = BaseBithumb(None, None)
+    bithumb.set_subscriber(use_event_loop=use_event_loop, recorder=probe)
+
+    symbols = [symbol for symbol in bithumb.get_available() if symbol.startswith('KRW_')]
+    bithumb.set_subscribe_orderbook(symbols)
+    bithumb.set_subscribe_trade(symbols)
+
+    # measured window
+    received_started = get_received_count()
+    sent_started = sent_counter.value
+    cpu_started = time.process_time()
+    started_at = time.time()
+    del probe.lag_list[:]
+
+    time.sleep(duration)
+
+    elapsed = time.time() - started_at
+    cpu_seconds = time.process_time() - cpu_started
+    received = get_received_count() - received_started
+    sent = sent_counter.value - sent_started
+    lag_list = list(probe.lag_list)
+
+    # frames sent in the window but not handled after draining are dropped
+    # SIGKILL, graceful shutdown of aiohttp waits for open websockets
+    server.kill()
+    server.join()
+    time.sleep(1)
+    dropped = max(sent_counter.value - sent_started - (get_received_count() - received_started), 0)
+
+    if use_event_loop:
+        bithumb._subscriber.stop()
+    else:
+        bithumb._subscriber.close()
+
+    ingest_rate = received / elapsed
+    cpu_percent = cpu_seconds / elapsed * 100
+    return dict(
+        target_rate=rate,
+        sent_rate=round(sent / elapsed, 1),
+        ingest_rate=round(ingest_rate, 1),
+        dropped=dropped,
+        lag_p50_ms=round(percentile(lag_list, 0.5) * 1000, 3) if lag_list else None,
+        lag_p99_ms=round(percentile(lag_list, 0.99) * 1000, 3) if lag_list else None,
+        cpu_percent=round(cpu_percent, 1),
+        cpu_percent_per_1k_msgs=round(cpu_percent / (ingest_rate / 1000), 2) if ingest_rate else None,
+        subscriber='asyncio' if use_event_loop else 'thread'
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rates', type=int, nargs='+', default=[1000, 5000, 20000])
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--symbols', type=int, default=100)
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--asyncio', action='store_true', help='use BithumbAsyncSubscriber')
+    args = parser.parse_args()
+
+    Urls.BASE = 'http://127.0.0.1:{}'.format(args.port)
+    Urls.Websocket.BASE = 'ws://127.0.0.1:{}/pub/ws'.format(args.port)
+
+    for rate in args.rates:
+        print(json.dumps(run_case(args.port, args.symbols, rate, args.duration, args.asyncio)))
+
+
+if __name__ == '__main__':
+    main()
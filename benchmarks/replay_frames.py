@@ -0,0 +1,61 @@
+"""
+replay frames recorded by FrameRecorder into bithumb DataStore without network, then read them the way
+MultiExchangeCrawler does on every cycle. prints frames/sec, ingest latency and read latency
+
+python benchmarks/replay_frames.py FILE [--speed N]
+speed: 1 is recorded speed, N is N times faster, 0 (default) is as fast as possible
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from BaseApi.Bithumb.replay_subscriber import BithumbReplaySubscriber
+from BaseApi.Bithumb.base_bithumb import BaseBithumb
+from BaseApi.objects import DataStore
+from BaseApi.settings import Consts
+from metrics import metrics
+
+
+class ReplayBithumb(BaseBithumb):
+    """
+        BaseBithumb fed by BithumbReplaySubscriber, tickers are not fetched
+    """
+    def __init__(self, path, speed, snapshot_mode=False):
+        self.data_store = DataStore(snapshot_mode)
+        self._lock_dic = {key: threading.Lock() for key in (Consts.ORDERBOOK, Consts.CANDLE, Consts.TRADE)}
+        self._latest_trade_snapshot = (None, None)
+        self._subscriber = BithumbReplaySubscriber(self.data_store, self._lock_dic, path, speed)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('path', help='file written by FrameRecorder')
+    parser.add_argument('--speed', type=float, default=0)
+    parser.add_argument('--snapshot-mode', action='store_true')
+    args = parser.parse_args()
+
+    bithumb = ReplayBithumb(args.path, args.speed, args.snapshot_mode)
+    replayer = bithumb._subscriber.replayer
+    read_histogram = metrics.histogram('stage_seconds', stage='replay_read')
+
+    bithumb._subscriber.start()
+    while replayer.is_alive():
+        with read_histogram.time():
+            bithumb.pop_updated_orderbook_symbols()
+            bithumb.pop_updated_trade_symbols()
+            bithumb.get_orderbook_high_low_sync()
+            bithumb.get_latest_trade()
+        time.sleep(0.001)
+
+    print('{:,} frames in {:.2f}s, {:,.0f} frames/s'.format(
+        replayer.frame_count, replayer.elapsed, replayer.frame_count / max(replayer.elapsed, 1e-9)))
+    for key, value in sorted(metrics.summary().items()):
+        print('{:<72} {}'.format(key, value))
+
+
+if __name__ == '__main__':
+    main()
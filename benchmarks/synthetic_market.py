@@ -0,0 +1,137 @@
+"""
+synthetic market for benchmarks, N trade symbols listed on the five exchanges with random walk prices.
+SyntheticExchangeApi has the same contract as baseapi objects used by MultiExchangeCrawler.
+everything is seeded so the same arguments produce the same ticks on every run.
+"""
+import random
+
+from BaseApi.objects import ResultObject
+
+
+KRW_PER_USDT = 1300.0
+
+# exchange -> quote market, same as MultiExchangeCrawler._set_all_availables()
+EXCHANGE_MARKET_DICT = {
+    'binance': 'USDT',
+    'huobi': 'USDT',
+    'mexc': 'USDT',
+    'upbit': 'KRW',
+    'bithumb': 'KRW'
+}
+
+
+class SyntheticExchangeApi(object):
+    def __init__(self, name, market, symbols):
+        self.name = name
+        self.market = market
+        self.symbols = symbols
+
+        self._orderbook_high_low_dict = dict()
+        self._latest_trade_dict = dict()
+        self._updated_orderbook_symbols = set()
+        self._updated_trade_symbols = set()
+
+        # (trade version, ResultObject) like BaseBithumb.get_latest_trade()
+        self._trade_version = 0
+        self._latest_trade_snapshot = (None, None)
+
+    def set_subscriber(self, *args, **kwargs):
+        pass
+
+    def get_available(self):
+        return list(self.symbols)
+
+    def set_subscribe_orderbook(self, coin):
+        return True
+
+    def set_subscribe_trade(self, coin):
+        return True
+
+    def update_orderbook(self, symbol, bid, ask):
+        self._orderbook_high_low_dict[symbol] = dict(bid=bid, ask=ask)
+        self._updated_orderbook_symbols.add(symbol)
+
+    def update_trade(self, symbol, price, amount):
+        self._latest_trade_dict[symbol] = dict(price=price, amount=amount)
+        self._updated_trade_symbols.add(symbol)
+        self._trade_version += 1
+
+    def get_orderbook_high_low_sync(self):
+        return ResultObject(True, self._orderbook_high_low_dict)
+
+    def get_latest_trade(self):
+        version, snapshot = self._latest_trade_snapshot
+        if version != self._trade_version:
+            snapshot = ResultObject(True, dict(self._latest_trade_dict))
+            self._latest_trade_snapshot = (self._trade_version, snapshot)
+        return snapshot
+
+    def get_latest_trade_by_symbol(self, symbol):
+        trade = self._latest_trade_dict.get(symbol)
+        return ResultObject(bool(trade), trade)
+
+    def pop_updated_orderbook_symbols(self):
+        updated, self._updated_orderbook_symbols = self._updated_orderbook_symbols, set()
+        return updated
+
+    def pop_updated_trade_symbols(self):
+        updated, self._updated_trade_symbols = self._updated_trade_symbols, set()
+        return updated
+
+    def get_ticker(self, symbol):
+        trade = self._latest_trade_dict.get(symbol)
+        if not trade:
+            return ResultObject(False, message='{} is not traded yet'.format(symbol))
+        return ResultObject(True, dict(sai_price=trade['price']))
+
+
+class SyntheticMarket(object):
+    """
+        symbol_count: number of trade symbols, BTC and ETH are always included for exchange rates
+        listing_ratio: probability that an exchange lists each trade symbol
+        tick_rate: ratio of listed symbols updated per exchange per tick
+        spread: relative noise of each exchange's price around the fair price
+    """
+    def __init__(self, symbol_count, listing_ratio=0.8, tick_rate=0.05, spread=0.02, seed=0):
+        self._random = random.Random(seed)
+        self.tick_rate = tick_rate
+        self.spread = spread
+
+        trade_symbols = ['BTC', 'ETH'] + ['S{:05d}'.format(index) for index in range(max(symbol_count - 2, 0))]
+
+        # fair price in USDT
+        self._fair_price_dict = {trade: self._random.uniform(0.01, 1000) for trade in trade_symbols}
+        self._fair_price_dict['BTC'] = 50000.0
+        self._fair_price_dict['ETH'] = 4000.0
+
+        self.exchange_api_dict = dict()
+        for exchange, market in EXCHANGE_MARKET_DICT.items():
+            symbols = ['{}_{}'.format(market, trade) for trade in trade_symbols
+                       if trade in ('BTC', 'ETH') or self._random.random() < listing_ratio]
+            self.exchange_api_dict[exchange] = SyntheticExchangeApi(exchange, market, symbols)
+
+        # every listed symbol has a quote and a trade before the first cycle
+        for exchange_api in self.exchange_api_dict.values():
+            for symbol in exchange_api.symbols:
+                self._tick_symbol(exchange_api, symbol)
+
+    def _tick_symbol(self, exchange_api, symbol):
+        trade = symbol.split('_')[1]
+        fair_price = self._fair_price_dict[trade] * (1 + self._random.gauss(0, 0.001))
+        self._fair_price_dict[trade] = fair_price
+
+        price = fair_price * (1 + self._random.uniform(-self.spread, self.spread))
+        if exchange_api.market == 'KRW':
+            price *= KRW_PER_USDT
+
+        exchange_api.update_orderbook(symbol, price * 0.999, price * 1.001)
+        exchange_api.update_trade(symbol, price, self._random.random())
+
+    def tick(self):
+        """
+            update tick_rate of listed symbols on every exchange
+        """
+        for exchange_api in self.exchange_api_dict.values():
+            count = max(int(len(exchange_api.symbols) * self.tick_rate), 1)
+            for symbol in self._random.sample(exchange_api.symbols, count):
+                self._tick_symbol(exchange_api, symbol)
@@ -0,0 +1,156 @@
+import threading
+import time
+
+from util import debugger
+
+
+class CachedRate(object):
+    def __init__(self, value, updated_at, ttl):
+        self.value = value
+        self.updated_at = updated_at
+        self.ttl = ttl
+
+    @property
+    def age(self):
+        return time.time() - self.updated_at
+
+    @property
+    def is_expired(self):
+        return self.age > self.ttl
+
+
+class ExchangeRateSource(object):
+    def __init__(self, fetcher, interval, ttl):
+        """
+            fetcher: callable returns price or None, it's called from ExchangeRateService thread
+                     None is a rate only pushed by set_rate(), ex) fed by the other process
+            interval: seconds between refreshes, skipped while the rate is fresher than interval
+            ttl: seconds after which the cached rate is not served anymore
+        """
+        self.fetcher = fetcher
+        self.interval = interval
+        self.ttl = ttl
+
+
+class ExchangeRateService(threading.Thread):
+    """
+        refresh each exchange rate on its own schedule and serve cached values without blocking.
+        rates can also be pushed from websocket trades by set_rate(), then REST refresh is skipped while it's fresh.
+    """
+    def __init__(self):
+        super(ExchangeRateService, self).__init__(daemon=True)
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+
+        self._source_dict = dict()
+        self._derived_dict = dict()
+        self._rate_dict = dict()
+
+    def register(self, symbol, fetcher, interval, ttl):
+        self._source_dict[symbol] = ExchangeRateSource(fetcher, interval, ttl)
+
+    def register_derived(self, symbol, calculator, dependencies):
+        """
+            calculator: callable gets dependencies' values in order
+            ex) register_derived('KRW_USDT', lambda krw_btc, usdt_btc: krw_btc / usdt_btc, ['KRW_BTC', 'USDT_BTC'])
+        """
+        self._derived_dict[symbol] = (calculator, dependencies)
+
+    def set_rate(self, symbol, value, updated_at=None):
+        source = self._source_dict.get(symbol)
+        ttl = source.ttl if source else float('inf')
+
+        with self._lock:
+            self._rate_dict[symbol] = CachedRate(value, updated_at or time.time(), ttl)
+
+    def get_cached_rate(self, symbol):
+        """
+            returns CachedRate for symbol, derived rate expires with the first of its dependencies
+        """
+        if symbol in self._derived_dict:
+            calculator, dependencies = self._derived_dict[symbol]
+            cached_list = [self.get_cached_rate(dependency) for dependency in dependencies]
+            if None in cached_list:
+                return None
+
+            try:
+                value = calculator(*[cached.value for cached in cached_list])
+            except (ZeroDivisionError, TypeError):
+                return None
+
+            oldest = min(cached_list, key=lambda cached: cached.updated_at + cached.ttl)
+            return CachedRate(value, oldest.updated_at, oldest.ttl)
+
+        with self._lock:
+            return self._rate_dict.get(symbol)
+
+    def get_rate(self, symbol):
+        """
+            returns None if the rate is not fetched yet or its ttl is expired
+        """
+        cached = self.get_cached_rate(symbol)
+        if cached is None or cached.is_expired:
+            return None
+        return cached.value
+
+    def get_source_rates(self):
+        """
+            returns symbol -> (value, updated_at) of cached source rates, they can be fed into set_rate() of the other
+        """
+        rate_dict = dict()
+        for symbol in self._source_dict:
+            cached = self.get_cached_rate(symbol)
+            if cached is not None:
+                rate_dict[symbol] = (cached.value, cached.updated_at)
+        return rate_dict
+
+    def get_rates(self):
+        symbols = list(self._source_dict) + list(self._derived_dict)
+        return {symbol: self.get_rate(symbol) for symbol in symbols}
+
+    def refresh(self, symbol):
+        source = self._source_dict[symbol]
+        try:
+            value = source.fetcher()
+        except Exception:
+            debugger.exception('ExchangeRateService::: failed to fetch [{}]'.format(symbol))
+            return False
+
+        if value is None:
+            debugger.debug('ExchangeRateService::: [{}] is not fetched'.format(symbol))
+            return False
+
+        self.set_rate(symbol, value)
+        return True
+
+    def _get_next_refresh_time(self, symbol):
+        cached = self.get_cached_rate(symbol)
+        if cached is None:
+            return 0
+        return cached.updated_at + self._source_dict[symbol].interval
+
+    def stop(self):
+        self._stopped.set()
+
+    def run(self):
+        while not self._stopped.is_set():
+            now = time.time()
+            next_refresh_list = list()
+
+            for symbol, source in self._source_dict.items():
+                if source.fetcher is None:
+                    continue
+
+                next_refresh_time = self._get_next_refresh_time(symbol)
+                if next_refresh_time <= now:
+                    self.refresh(symbol)
+                    next_refresh_time = self._get_next_refresh_time(symbol)
+
+                    # failed to fetch, retry after a second
+                    if next_refresh_time <= now:
+                        next_refresh_time = now + 1
+
+                next_refresh_list.append(next_refresh_time)
+
+            wait_time = min(next_refresh_list) - time.time() if next_refresh_list else 1
+            self._stopped.wait(max(wait_time, 0))
@@ -0,0 +1,272 @@
+import http.server
+import json
+import threading
+import time
+
+from bisect import bisect_left
+
+from util import debugger
+
+
+# seconds, log scale from 10us to about 10s
+DEFAULT_BUCKETS = tuple(0.00001 * 2 ** exponent for exponent in range(21))
+
+
+class Counter(object):
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 0
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def get(self):
+        return self.value
+
+
+class Gauge(object):
+    """
+        value is set by set() or read from the function given to set_function() when it's exported
+    """
+    def __init__(self):
+        self.value = 0
+        self._function = None
+
+    def set(self, value):
+        self.value = value
+
+    def set_function(self, function):
+        self._function = function
+
+    def get(self):
+        if self._function is None:
+            return self.value
+
+        try:
+            return self._function()
+        except Exception:
+            debugger.exception('Gauge::: failed to read value')
+            return float('nan')
+
+
+class _HistogramTimer(object):
+    def __init__(self, histogram):
+        self._histogram = histogram
+        self._started_at = None
+
+    def __enter__(self):
+        self._started_at = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        self._histogram.observe(time.perf_counter() - self._started_at)
+
+
+class Histogram(object):
+    """
+        fixed log scale buckets, observe() is a bisect and three additions
+    """
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self._lock = threading.Lock()
+        self.buckets = tuple(buckets)
+
+        # the last one is +Inf bucket
+        self.bucket_counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            self.bucket_counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def time(self):
+        """
+            usage: with histogram.time(): ...
+        """
+        return _HistogramTimer(self)
+
+    def quantile(self, q):
+        """
+            returns upper bound of the bucket where q quantile falls, None if nothing is observed
+        """
+        if not self.count:
+            return None
+
+        rank = q * self.count
+        accumulated = 0
+        for index, bucket_count in enumerate(self.bucket_counts):
+            accumulated += bucket_count
+            if accumulated >= rank:
+                return self.buckets[index] if index < len(self.buckets) else float('inf')
+        return float('inf')
+
+
+class MetricTypes(object):
+    COUNTER = 'counter'
+    GAUGE = 'gauge'
+    HISTOGRAM = 'histogram'
+
+
+class MetricsRegistry(object):
+    """
+        metrics keyed by name and labels, the same object is returned for the same name and labels.
+        hot paths should keep the returned object instead of looking it up every time.
+    """
+    METRIC_CLASS_DICT = {
+        MetricTypes.COUNTER: Counter,
+        MetricTypes.GAUGE: Gauge,
+        MetricTypes.HISTOGRAM: Histogram
+    }
+
+    def __init__(self, prefix='arbitrage_monitor_'):
+        self.prefix = prefix
+        self._lock = threading.Lock()
+
+        # name -> (metric type, {labels: metric})
+        self._metric_dict = dict()
+
+    def _get(self, metric_type, name, labels):
+        label_key = tuple(sorted(labels.items()))
+        with self._lock:
+            registered_type, labeled_dict = self._metric_dict.setdefault(name, (metric_type, dict()))
+            if registered_type != metric_type:
+                raise ValueError('metric [{}] is already registered as {}'.format(name, registered_type))
+
+            metric = labeled_dict.get(label_key)
+            if metric is None:
+                metric = labeled_dict[label_key] = self.METRIC_CLASS_DICT[metric_type]()
+            return metric
+
+    def counter(self, name, **labels):
+        return self._get(MetricTypes.COUNTER, name, labels)
+
+    def gauge(self, name, **labels):
+        return self._get(MetricTypes.GAUGE, name, labels)
+
+    def histogram(self, name, **labels):
+        return self._get(MetricTypes.HISTOGRAM, name, labels)
+
+    def _items(self):
+        with self._lock:
+            return [(name, metric_type, list(labeled_dict.items()))
+                    for name, (metric_type, labeled_dict) in sorted(self._metric_dict.items())]
+
+    @staticmethod
+    def _format_labels(label_key, extra=()):
+        label_list = list(label_key) + list(extra)
+        if not label_list:
+            return ''
+        return '{' + ','.join('{}="{}"'.format(key, value) for key, value in label_list) + '}'
+
+    def render_prometheus(self):
+        """
+            returns metrics in prometheus text exposition format
+        """
+        line_list = list()
+        for name, metric_type, labeled_list in self._items():
+            full_name = self.prefix + name
+            line_list.append('# TYPE {} {}'.format(full_name, metric_type))
+
+            for label_key, metric in labeled_list:
+                if metric_type != MetricTypes.HISTOGRAM:
+                    line_list.append('{}{} {}'.format(full_name, self._format_labels(label_key), metric.get()))
+                    continue
+
+                accumulated = 0
+                for bound, bucket_count in zip(metric.buckets + ('+Inf',), metric.bucket_counts):
+                    accumulated += bucket_count
+                    line_list.append('{}_bucket{} {}'.format(
+                        full_name, self._format_labels(label_key, [('le', bound)]), accumulated))
+                line_list.append('{}_sum{} {}'.format(full_name, self._format_labels(label_key), metric.sum))
+                line_list.append('{}_count{} {}'.format(full_name, self._format_labels(label_key), metric.count))
+
+        return '\n'.join(line_list) + '\n'
+
+    def summary(self):
+        """
+            returns flat dict for a log line, histograms are reduced to count, p50, p99
+        """
+        summary_dict = dict()
+        for name, metric_type, labeled_list in self._items():
+            for label_key, metric in labeled_list:
+                key = name + self._format_labels(label_key).replace('"', '')
+                if metric_type == MetricTypes.HISTOGRAM:
+                    summary_dict[key] = dict(count=metric.count, p50=metric.quantile(0.5), p99=metric.quantile(0.99))
+                else:
+                    summary_dict[key] = metric.get()
+        return summary_dict
+
+
+class MetricsHttpServer(threading.Thread):
+    """
+        serves registry as prometheus text on http://host:port/metrics
+    """
+    def __init__(self, registry, port, host='127.0.0.1'):
+        super(MetricsHttpServer, self).__init__(daemon=True)
+
+        class _Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+
+                body = registry.render_prometheus().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = http.server.ThreadingHTTPServer((host, port), _Handler)
+
+    def run(self):
+        self.server.serve_forever()
+
+    def stop(self):
+        self.server.shutdown()
+
+
+class MetricsLogger(threading.Thread):
+    """
+        writes registry summary as one json log line every interval seconds
+    """
+    def __init__(self, registry, interval):
+        super(MetricsLogger, self).__init__(daemon=True)
+        self.registry = registry
+        self.interval = interval
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            debugger.info('metrics {}'.format(json.dumps(self.registry.summary(), sort_keys=True)))
+
+    def stop(self):
+        self._stopped.set()
+
+
+# process wide registry
+metrics = MetricsRegistry()
+
+
+def start_metrics_exporters(port=0, log_interval=0, registry=metrics):
+    """
+        port: serve /metrics on the port if it's not 0
+        log_interval: write summary log line every log_interval seconds if it's not 0
+        returns started exporter threads
+    """
+    exporter_list = list()
+    if port:
+        exporter_list.append(MetricsHttpServer(registry, port))
+    if log_interval:
+        exporter_list.append(MetricsLogger(registry, log_interval))
+
+    for exporter in exporter_list:
+        exporter.start()
+    return exporter_list
@@ -1,66 +1,195 @@
 import sqlite3
 import threading
+import queue
+import time
 
 from util import debugger
+from metrics import metrics
 
 
 DB_NAME = 'arbitrage_monitor'
+HISTORY_DB_NAME = 'arbitrage_history'
 
 
-class ArbitrageMonitorModel(object):
+class ExcludeColumns(object):
+    # same order as exclude key of the crawler, see get_exclude_key()
+    ALL = ('arbitrage_type', 'trade_symbol', 'base_exchange', 'base_exchange_market', 'target_exchange',
+           'target_exchange_market')
+
+
+class SqliteModel(object):
+    """
+        sqlite with WAL, each thread has its own connection so readers never wait for the writer
+    """
+    db_name = None
+    # seconds, waiting for the lock of the other connection
+    BUSY_TIMEOUT = 5
+
     def __init__(self):
-        self.conn = None
-        self.cursor = None
-        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _get_connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect('{}.db'.format(self.db_name), timeout=self.BUSY_TIMEOUT)
+            conn.row_factory = sqlite3.Row  # for dict
+            conn.execute('PRAGMA journal_mode=WAL')
+            # WAL keeps the db consistent with NORMAL, the latest transactions can be lost on power failure only
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _close_connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            self._local.conn = None
+            conn.close()
+
+
+class ArbitrageMonitorModel(SqliteModel):
+    """
+        exclude set on sqlite, see SqliteModel.
+        exclude set is cached in memory and read again only when exclude version is changed,
+        writes of this process increase the change counter and writes of the other processes change data_version.
+    """
+    db_name = DB_NAME
+    RETRY_COUNT = 3
 
-        self._connect()
+    # writes from every model of this process
+    _change_counter = 0
+    _change_lock = threading.Lock()
+
+    def __init__(self):
+        super(ArbitrageMonitorModel, self).__init__()
+
+        # (exclude version, frozenset of exclude keys)
+        self._exclude_cache = None
+        self._cache_lock = threading.Lock()
+
+    def _execute_many(self, name, sql, rows):
+        """
+            execute sql for rows in one transaction, returns True on success
+        """
+        for _ in range(self.RETRY_COUNT):
+            conn = self._get_connection()
+            try:
+                with conn:
+                    conn.executemany(sql, rows)
+                break
+            except sqlite3.OperationalError:
+                # locked or busy, transaction is rolled back by the context manager
+                debugger.exception('{}() ::: Error occurred while executing, retry again'.format(name))
+            except sqlite3.DatabaseError:
+                self._close_connection()
+                debugger.exception('{}() ::: Error occurred while executing, reconnect and retry'.format(name))
+        else:
+            debugger.warning('{}() ::: tried several times but failed'.format(name))
+            return False
+
+        with ArbitrageMonitorModel._change_lock:
+            ArbitrageMonitorModel._change_counter += 1
+        return True
 
     def migrate(self):
         self._create_excludes_table()
 
     def _create_excludes_table(self):
-        with self._lock:
-            sql = """
-                CREATE TABLE IF NOT EXISTS exclude_set (
-                arbitrage_type         VARCHAR(255) NOT NULL,
-                trade_symbol           VARCHAR(255) NOT NULL,
-                base_exchange          VARCHAR(255) NOT NULL,
-                base_exchange_market   VARCHAR(255) NOT NULL,
-                target_exchange        VARCHAR(255) NOT NULL,
-                target_exchange_market VARCHAR(255) NOT NULL,
-                PRIMARY KEY(arbitrage_type, trade_symbol, base_exchange, base_exchange_market, target_exchange, target_exchange_market)
-            )
-            """
-            self.cursor.execute(sql)
-            self.conn.commit()
+        sql = """
+            CREATE TABLE IF NOT EXISTS exclude_set (
+            arbitrage_type         VARCHAR(255) NOT NULL,
+            trade_symbol           VARCHAR(255) NOT NULL,
+            base_exchange          VARCHAR(255) NOT NULL,
+            base_exchange_market   VARCHAR(255) NOT NULL,
+            target_exchange        VARCHAR(255) NOT NULL,
+            target_exchange_market VARCHAR(255) NOT NULL,
+            PRIMARY KEY(arbitrage_type, trade_symbol, base_exchange, base_exchange_market, target_exchange, target_exchange_market)
+        )
+        """
+        with self._get_connection() as conn:
+            conn.execute(sql)
+
+    def get_exclude_version(self):
+        """
+            changes when exclude set is written by any model of this process or by the other processes.
+            it's cheap enough to be checked every cycle, one pragma on the connection of the thread.
+        """
+        conn = self._get_connection()
+        data_version = conn.execute('PRAGMA data_version').fetchone()[0]
+        return ArbitrageMonitorModel._change_counter, id(conn), data_version
 
-    def _connect(self):
-        self.conn = sqlite3.connect('{}.db'.format(DB_NAME), check_same_thread=False)
-        self.conn.row_factory = sqlite3.Row  # for dict
+    def get_exclude_key_set(self):
+        """
+            returns frozenset of (arbitrage_type, trade_symbol, base_exchange, base_exchange_market,
+            target_exchange, target_exchange_market), cached until exclude version is changed
+            returns False if it can't be read
+        """
+        version = self.get_exclude_version()
+        with self._cache_lock:
+            if self._exclude_cache is not None and self._exclude_cache[0] == version:
+                return self._exclude_cache[1]
+
+        sql = """
+            SELECT {} FROM exclude_set
+        """.format(', '.join(ExcludeColumns.ALL))
+
+        for _ in range(self.RETRY_COUNT):
+            try:
+                rows = self._get_connection().execute(sql).fetchall()
+                break
+            except sqlite3.DatabaseError:
+                self._close_connection()
+                debugger.exception('get_exclude_key_set() ::: Error occurred while executing')
+        else:
+            debugger.warning('get_exclude_key_set() ::: tried several times but failed')
+            return False
 
-        self.cursor = self.conn.cursor()
+        exclude_key_set = frozenset(tuple(row) for row in rows)
+        with self._cache_lock:
+            self._exclude_cache = (version, exclude_key_set)
+        return exclude_key_set
 
     def get_excludes_list(self):
-        with self._lock:
-            sql = """
-                SELECT * FROM exclude_set
-            """
-
-            for _ in range(3):
-                try:
-                    self.cursor.execute(sql)
-                    break
-                except Exception:
-                    self.conn.close()
-                    self._connect()
-                    debugger.exception('get_excludes_list() ::: Error occurred while executing')
-            else:
-                debugger.warning('get_excludes_list() ::: tried several times but failed')
-                return False
-
-            _results = self.cursor.fetchall()
-            results = [dict(result) for result in _results]
-            return results
+        exclude_key_set = self.get_exclude_key_set()
+        if exclude_key_set is False:
+            return False
+
+        return [dict(zip(ExcludeColumns.ALL, key)) for key in exclude_key_set]
+
+    def register_excludes(self, rows):
+        """
+            rows: [(arbitrage_type, trade_symbol, base_exchange, base_exchange_market, target_exchange,
+                    target_exchange_market), ...], registered in one transaction
+        """
+        sql = """
+            INSERT OR IGNORE
+            INTO exclude_set (arbitrage_type, trade_symbol, base_exchange, base_exchange_market, target_exchange, target_exchange_market)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """
+        if not self._execute_many('register_excludes', sql, rows):
+            return False
+
+        debugger.info('exclude set registered success ::: {} rows'.format(len(rows)))
+        return True
+
+    def revert_excludes(self, rows):
+        """
+            rows: same as register_excludes(), reverted in one transaction
+        """
+        sql = """
+               DELETE FROM exclude_set
+               WHERE 
+                arbitrage_type = ? AND
+                trade_symbol = ? AND
+                base_exchange = ? AND
+                base_exchange_market = ? AND
+                target_exchange = ? AND
+                target_exchange_market = ?
+           """
+        if not self._execute_many('revert_excludes', sql, rows):
+            return False
+
+        debugger.info('exclude set reverted success ::: {} rows'.format(len(rows)))
+        return True
 
     def register_exclude(self, arbitrage_type, trade_symbol, base_exchange, base_exchange_market, target_exchange, target_exchange_market):
         """
@@ -71,37 +200,8 @@ class ArbitrageMonitorModel(object):
             target_exchange: target exchange
             target_exchange_market: target exchange market
         """
-        with self._lock:
-            sql = """
-                INSERT OR IGNORE
-                INTO exclude_set (arbitrage_type, trade_symbol, base_exchange, base_exchange_market, target_exchange, target_exchange_market)
-                VALUES (?, ?, ?, ?, ?, ?)
-            """
-
-            values = (
-                arbitrage_type,
-                trade_symbol,
-                base_exchange,
-                base_exchange_market,
-                target_exchange,
-                target_exchange_market
-            )
-
-            for _ in range(3):
-                try:
-                    self.cursor.execute(sql, values)
-                    self.conn.commit()
-                    break
-                except Exception:
-                    self.conn.close()
-                    self._connect()
-                    debugger.exception('register_exclude() ::: Error occurred while executing, retry again')
-            else:
-                debugger.warning('register_exclude() ::: tried several times but failed')
-                return False
-
-            debugger.info('exclude set registered success ::: {}'.format(values))
-            return True
+        return self.register_excludes([(arbitrage_type, trade_symbol, base_exchange, base_exchange_market,
+                                        target_exchange, target_exchange_market)])
 
     def revert_exclude(self, arbitrage_type, trade_symbol, base_exchange, base_exchange_market, target_exchange,
                          target_exchange_market):
@@ -113,42 +213,279 @@ class ArbitrageMonitorModel(object):
             target_exchange: target exchange
             target_exchange_market: target exchange market
         """
-        with self._lock:
-            sql = """
-                   DELETE FROM exclude_set
-                   WHERE 
-                    arbitrage_type = ? AND
-                    trade_symbol = ? AND
-                    base_exchange = ? AND
-                    base_exchange_market = ? AND
-                    target_exchange = ? AND
-                    target_exchange_market = ?
-               """
-
-            values = (
-                arbitrage_type,
-                trade_symbol,
-                base_exchange,
-                base_exchange_market,
-                target_exchange,
-                target_exchange_market
+        return self.revert_excludes([(arbitrage_type, trade_symbol, base_exchange, base_exchange_market,
+                                      target_exchange, target_exchange_market)])
+
+
+class HistoryTables(object):
+    RAW = 'opportunity_raw'
+    SECOND = 'opportunity_1s'
+    MINUTE = 'opportunity_1m'
+
+    # downsampled table -> (source table, bucket seconds)
+    DOWNSAMPLE_DICT = {
+        SECOND: (RAW, 1),
+        MINUTE: (SECOND, 60)
+    }
+
+    KEY_COLUMNS = ('arbitrage_type', 'trade_symbol', 'base_exchange', 'base_exchange_market', 'target_exchange',
+                   'target_exchange_market')
+
+
+class OpportunityHistoryModel(SqliteModel):
+    """
+        history of published arbitrages in its own sqlite db, see SqliteModel.
+        raw rows are downsampled into 1s and 1min buckets keeping max/min percent, each table has its own retention.
+        buckets are closed once, downsampling continues from the last bucket of the table.
+    """
+    db_name = HISTORY_DB_NAME
+
+    # seconds, raw rows of a batch still being written can be late by this much
+    CLOSE_DELAY = 2
+
+    def __init__(self, raw_retention=600, second_retention=7200, minute_retention=2592000):
+        """
+            raw_retention, second_retention, minute_retention: seconds
+        """
+        super(OpportunityHistoryModel, self).__init__()
+
+        self.retention_dict = {
+            HistoryTables.RAW: raw_retention,
+            HistoryTables.SECOND: second_retention,
+            HistoryTables.MINUTE: minute_retention
+        }
+
+    def migrate(self):
+        with self._get_connection() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS {} (
+                ts                     REAL         NOT NULL,
+                arbitrage_type         VARCHAR(255) NOT NULL,
+                trade_symbol           VARCHAR(255) NOT NULL,
+                base_exchange          VARCHAR(255) NOT NULL,
+                base_exchange_market   VARCHAR(255) NOT NULL,
+                target_exchange        VARCHAR(255) NOT NULL,
+                target_exchange_market VARCHAR(255) NOT NULL,
+                arbitrage_percent      REAL         NOT NULL
+            )
+            """.format(HistoryTables.RAW))
+
+            for table in (HistoryTables.SECOND, HistoryTables.MINUTE):
+                conn.execute("""
+                    CREATE TABLE IF NOT EXISTS {} (
+                    ts                     INTEGER      NOT NULL,
+                    arbitrage_type         VARCHAR(255) NOT NULL,
+                    trade_symbol           VARCHAR(255) NOT NULL,
+                    base_exchange          VARCHAR(255) NOT NULL,
+                    base_exchange_market   VARCHAR(255) NOT NULL,
+                    target_exchange        VARCHAR(255) NOT NULL,
+                    target_exchange_market VARCHAR(255) NOT NULL,
+                    max_percent            REAL         NOT NULL,
+                    min_percent            REAL         NOT NULL,
+                    samples                INTEGER      NOT NULL
+                )
+                """.format(table))
+
+            for table in (HistoryTables.RAW, HistoryTables.SECOND, HistoryTables.MINUTE):
+                # pair queries, and ts range for downsampling & retention
+                conn.execute("""
+                    CREATE INDEX IF NOT EXISTS {0}_pair_ts
+                    ON {0} (trade_symbol, base_exchange, target_exchange, ts)
+                """.format(table))
+                conn.execute('CREATE INDEX IF NOT EXISTS {0}_ts ON {0} (ts)'.format(table))
+
+    def insert_opportunities(self, rows):
+        """
+            rows: [(ts, arbitrage_type, trade_symbol, base_exchange, base_exchange_market, target_exchange,
+                    target_exchange_market, arbitrage_percent), ...], inserted in one transaction
+        """
+        sql = """
+            INSERT INTO {} (ts, arbitrage_type, trade_symbol, base_exchange, base_exchange_market,
+                            target_exchange, target_exchange_market, arbitrage_percent)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """.format(HistoryTables.RAW)
+
+        try:
+            with self._get_connection() as conn:
+                conn.executemany(sql, rows)
+        except sqlite3.Error:
+            debugger.exception('insert_opportunities() ::: Error occurred while executing')
+            return False
+        return True
+
+    @staticmethod
+    def _get_next_bucket(conn, table, bucket_seconds):
+        last_bucket = conn.execute('SELECT MAX(ts) FROM {}'.format(table)).fetchone()[0]
+        return None if last_bucket is None else last_bucket + bucket_seconds
+
+    def downsample(self, now=None):
+        """
+            close buckets older than the current one, raw -> 1s -> 1min.
+            last bucket is read in the same write transaction, so concurrent downsampling never closes it twice
+        """
+        now = now or time.time()
+        key_columns = ', '.join(HistoryTables.KEY_COLUMNS)
+
+        conn = self._get_connection()
+        try:
+            with conn:
+                # write lock is taken before reading the last bucket
+                conn.execute('BEGIN IMMEDIATE')
+                closed_until = now - self.CLOSE_DELAY
+                for table in (HistoryTables.SECOND, HistoryTables.MINUTE):
+                    source_table, bucket_seconds = HistoryTables.DOWNSAMPLE_DICT[table]
+                    # buckets of the source table are complete only until its own closed time
+                    closed_until = int(closed_until // bucket_seconds * bucket_seconds)
+                    next_bucket = self._get_next_bucket(conn, table, bucket_seconds) or 0
+
+                    if source_table == HistoryTables.RAW:
+                        value_columns = 'MAX(arbitrage_percent), MIN(arbitrage_percent), COUNT(*)'
+                    else:
+                        value_columns = 'MAX(max_percent), MIN(min_percent), SUM(samples)'
+
+                    conn.execute("""
+                        INSERT INTO {table} (ts, {key_columns}, max_percent, min_percent, samples)
+                        SELECT CAST(ts / {bucket} AS INTEGER) * {bucket} AS bucket, {key_columns}, {value_columns}
+                        FROM {source_table}
+                        WHERE ts >= ? AND ts < ?
+                        GROUP BY bucket, {key_columns}
+                    """.format(table=table, key_columns=key_columns, bucket=bucket_seconds,
+                               value_columns=value_columns, source_table=source_table),
+                        (next_bucket, closed_until))
+        except sqlite3.Error:
+            debugger.exception('downsample() ::: Error occurred while executing')
+            return False
+        return True
+
+    def apply_retention(self, now=None):
+        now = now or time.time()
+        try:
+            with self._get_connection() as conn:
+                for table, retention in self.retention_dict.items():
+                    conn.execute('DELETE FROM {} WHERE ts < ?'.format(table), (now - retention,))
+        except sqlite3.Error:
+            debugger.exception('apply_retention() ::: Error occurred while executing')
+            return False
+        return True
+
+    def get_max_spread(self, arbitrage_type, trade_symbol, base_exchange, target_exchange, seconds=3600):
+        """
+            usage: get_max_spread('orderbook_high_low', 'BTC', 'upbit', 'binance')
+            returns the highest arbitrage percent of the pair in the last seconds, None if it's not recorded.
+            every table covering the range is read, buckets are max of their rows so overlaps don't matter.
+        """
+        since = time.time() - seconds
+        sql = """
+            SELECT MAX(value) AS max_percent FROM (
+                SELECT MAX(arbitrage_percent) AS value FROM {raw}
+                WHERE trade_symbol = ? AND base_exchange = ? AND target_exchange = ? AND ts >= ?
+                AND arbitrage_type = ?
+                UNION ALL
+                SELECT MAX(max_percent) FROM {second}
+                WHERE trade_symbol = ? AND base_exchange = ? AND target_exchange = ? AND ts >= ?
+                AND arbitrage_type = ?
+                UNION ALL
+                SELECT MAX(max_percent) FROM {minute}
+                WHERE trade_symbol = ? AND base_exchange = ? AND target_exchange = ? AND ts >= ?
+                AND arbitrage_type = ?
             )
+        """.format(raw=HistoryTables.RAW, second=HistoryTables.SECOND, minute=HistoryTables.MINUTE)
+        values = (trade_symbol, base_exchange, target_exchange, since, arbitrage_type) * 3
+
+        return self._get_connection().execute(sql, values).fetchone()['max_percent']
+
+    def get_spread_series(self, arbitrage_type, trade_symbol, base_exchange, target_exchange, seconds=3600,
+                          table=HistoryTables.SECOND):
+        """
+            returns [dict(ts, max_percent, min_percent, samples), ...] of the pair in the last seconds from table
+        """
+        if table == HistoryTables.RAW:
+            value_columns = 'arbitrage_percent AS max_percent, arbitrage_percent AS min_percent, 1 AS samples'
+        else:
+            value_columns = 'max_percent, min_percent, samples'
+
+        sql = """
+            SELECT ts, base_exchange_market, target_exchange_market, {} FROM {}
+            WHERE trade_symbol = ? AND base_exchange = ? AND target_exchange = ? AND ts >= ? AND arbitrage_type = ?
+            ORDER BY ts
+        """.format(value_columns, table)
+
+        rows = self._get_connection().execute(sql, (trade_symbol, base_exchange, target_exchange,
+                                                    time.time() - seconds, arbitrage_type)).fetchall()
+        return [dict(row) for row in rows]
+
+
+class OpportunityHistoryWriter(threading.Thread):
+    """
+        takes batches of arbitrage objects from the crawler without blocking it and writes them in one transaction.
+        downsampling & retention run on the same thread every MAINTENANCE_INTERVAL seconds,
+        only by one writer of the db, ex) writer of the first shard worker.
+        batches are dropped when the writer falls behind by MAX_PENDING_BATCHES, scan is never slowed down.
+    """
+    MAX_PENDING_BATCHES = 1000
+    MAINTENANCE_INTERVAL = 5
+
+    def __init__(self, history_model, is_maintenance=True):
+        """
+            is_maintenance: False if the other writer downsamples and applies retention to the same db
+        """
+        super(OpportunityHistoryWriter, self).__init__(daemon=True)
+        self.history_model = history_model
+        self.is_maintenance = is_maintenance
+        self._queue = queue.Queue(maxsize=self.MAX_PENDING_BATCHES)
+        self._stopped = threading.Event()
+
+        self._written_counter = metrics.counter('history_rows_written_total')
+        self._dropped_counter = metrics.counter('history_batches_dropped_total')
+        self._write_histogram = metrics.histogram('stage_seconds', stage='history_write')
+
+    def record(self, arbitrage_list, ts=None):
+        """
+            arbitrage_list: arbitrage objects having exclude_key & arbitrage_percent, they are not modified later
+        """
+        if not arbitrage_list:
+            return
+
+        try:
+            self._queue.put_nowait((ts or time.time(), arbitrage_list))
+        except queue.Full:
+            self._dropped_counter.inc()
+
+    def stop(self):
+        self._stopped.set()
+
+    def _write_pending(self, batch):
+        rows = list()
+        while batch is not None:
+            ts, arbitrage_list = batch
+            for obj in arbitrage_list:
+                # exclude key is (arbitrage type, trade symbol, exchanges & markets), same order as the columns
+                rows.append((ts, *obj.exclude_key, obj.arbitrage_percent))
+
+            try:
+                batch = self._queue.get_nowait()
+            except queue.Empty:
+                batch = None
+
+        with self._write_histogram.time():
+            if self.history_model.insert_opportunities(rows):
+                self._written_counter.inc(len(rows))
+
+    def run(self):
+        maintained_at = time.time()
+        while not self._stopped.is_set():
+            try:
+                batch = self._queue.get(timeout=1)
+            except queue.Empty:
+                batch = None
+
+            if batch is not None:
+                self._write_pending(batch)
 
-            for _ in range(3):
-                try:
-                    self.cursor.execute(sql, values)
-                    self.conn.commit()
-                    break
-                except Exception:
-                    self.conn.close()
-                    self._connect()
-                    debugger.exception('register_exclude() ::: Error occurred while executing, retry again')
-            else:
-                debugger.warning('register_exclude() ::: tried several times but failed')
-                return False
-
-            debugger.info('exclude set reverted success ::: {}'.format(values))
-            return True
+            if self.is_maintenance and time.time() - maintained_at >= self.MAINTENANCE_INTERVAL:
+                self.history_model.downsample()
+                self.history_model.apply_retention()
+                maintained_at = time.time()
 
 
 if __name__ == '__main__':
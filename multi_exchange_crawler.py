@@ -1,19 +1,33 @@
+import os
+import sys
+import time
 import threading
 import multiprocessing
 import asyncio
 import queue
 import configparser
 
+from concurrent.futures import ThreadPoolExecutor
 from enum import Enum
-from BaseApi.Binance.base_binance import BaseBinance
-from BaseApi.Bithumb.base_bithumb import BaseBithumb
-from BaseApi.Huobi.base_huobi import BaseHuobi
-from BaseApi.Upbit.base_upbit import BaseUpbit
-from BaseApi.Mexc.base_mexc import BaseMexc
-from util import (get_exchange_combinations, filter_market, format_comma,
+from functools import partial
+from BaseApi.registry import create_adapter, get_subscriber_kwargs, get_markets, parse_exchanges
+from BaseApi.recorder import FrameRecorder
+from BaseApi.objects import ResultObject
+from util import (get_exchange_combinations, filter_market, filter_shard, format_comma,
                 send_telegram, get_current_krw_usd_exchange_rate, debugger)
-from models import ArbitrageMonitorModel
+from models import ArbitrageMonitorModel, OpportunityHistoryModel, OpportunityHistoryWriter
+from exchange_rate_service import ExchangeRateService
+from arbitrage_channel import ArbitrageChannel, DeltaKeys, merge_delta_section
+from metrics import metrics, start_metrics_exporters
+from orderbook_depth import walk_orderbook_depth
+from route_costs import RouteCostTable, get_exchange_info_dict
+from ranking import OpportunityRanking
 
+try:
+    from spread_matrix import SpreadMatrix
+except ImportError:
+    # numpy is optional, only needed for ScanModes.VECTORIZED
+    SpreadMatrix = None
 
 
 config = configparser.ConfigParser()
@@ -21,10 +35,39 @@ config.read('config.ini')
 
 TELEGRAM_ORDERBOOK_HIGH_LOW = float(config['telegram']['orderbook_high_low'])
 TELEGRAM_TRADE_PRICE = float(config['telegram']['trade_price'])
+TELEGRAM_ORDERBOOK_DEPTH = config.getfloat('telegram', 'orderbook_depth', fallback=float('inf'))
+
+SCAN_MODE = config.get('crawler', 'scan_mode', fallback='incremental')
+MIN_ARBITRAGE_PERCENT = config.getfloat('crawler', 'min_arbitrage_percent', fallback=0)
+EXCHANGE_RATE_TOLERANCE = config.getfloat('crawler', 'exchange_rate_tolerance', fallback=0.0005)
+SNAPSHOT_MODE = config.getboolean('crawler', 'snapshot_mode', fallback=False)
+PUBLISH_DELTA = config.getboolean('crawler', 'publish_delta', fallback=False)
+ASYNCIO_SUBSCRIBER = config.getboolean('crawler', 'asyncio_subscriber', fallback=False)
+METRICS_PORT = config.getint('crawler', 'metrics_port', fallback=0)
+METRICS_LOG_INTERVAL = config.getfloat('crawler', 'metrics_log_interval', fallback=0)
+RECORD_FRAMES_DIR = config.get('crawler', 'record_frames_dir', fallback='')
+DEPTH_ARBITRAGE = config.getboolean('crawler', 'depth_arbitrage', fallback=False)
+DEPTH_MIN_PERCENT = config.getfloat('crawler', 'depth_min_percent', fallback=0.5)
+DEPTH_MIN_PROFIT = config.getfloat('crawler', 'depth_min_profit', fallback=10000)
+ROUTE_COSTS = config.getboolean('crawler', 'route_costs', fallback=False)
+ROUTE_COST_REFRESH_INTERVAL = config.getfloat('crawler', 'route_cost_refresh_interval', fallback=600)
+TRANSFER_REFERENCE_KRW = config.getfloat('crawler', 'transfer_reference_krw', fallback=1000000)
+HISTORY = config.getboolean('crawler', 'history', fallback=False)
+HISTORY_RAW_RETENTION = config.getfloat('crawler', 'history_raw_retention', fallback=600)
+HISTORY_1S_RETENTION = config.getfloat('crawler', 'history_1s_retention', fallback=7200)
+HISTORY_1M_RETENTION = config.getfloat('crawler', 'history_1m_retention', fallback=2592000)
+RANKING_SIZE = config.getint('crawler', 'ranking_size', fallback=0)
+RANKING_KEY = config.get('crawler', 'ranking_key', fallback='percent')
+# parsed when a crawler is created, so exchanges registered after import are recognized
+EXCHANGES = config.get('crawler', 'exchanges', fallback='binance,huobi,mexc,upbit,bithumb')
 
 MAX_ZERO = 2
 
 
+def round_price(value):
+    return round(value, MAX_ZERO) if value else value
+
+
 class Markets(object):
     KRW = 'KRW'
     USDT = 'USDT'
@@ -33,8 +76,13 @@ class Markets(object):
 class Consts(object):
     ASK = 'ask'
     BID = 'bid'
+    ASKS = 'asks'
+    BIDS = 'bids'
 
     EXCHANGE_RATES = 'exchange_rates'
+    PUBLISHED_AT = 'published_at'
+    # arbitrage type -> top ranking_size arbitrage objects, highest first
+    TOP_ARBITRAGES = 'top_arbitrages'
 
 
 class ExchangeRateSymbols(object):
@@ -44,6 +92,21 @@ class ExchangeRateSymbols(object):
     KRW_ETH = 'KRW_ETH'
     KRW_USD = 'KRW_USD'
 
+    # seconds, (refresh interval, ttl)
+    REFRESH_SCHEDULE = {
+        KRW_BTC: (5, 60),
+        KRW_ETH: (5, 60),
+        USDT_BTC: (5, 60),
+        KRW_USD: (600, 3600)
+    }
+
+    # (exchange, symbol) fetched by ticker and taken from subscribed trades
+    SOURCE_LIST = [
+        ('upbit', KRW_BTC),
+        ('upbit', KRW_ETH),
+        ('binance', USDT_BTC)
+    ]
+
 
 class Exchanges(Enum):
     BINANCE = 'binance'
@@ -53,28 +116,111 @@ class Exchanges(Enum):
     BITHUMB = 'bithumb'
 
 
+class ScanModes(object):
+    # recompute only pairs touching updated symbols
+    INCREMENTAL = 'incremental'
+    # recompute every pair at once with numpy spread matrix
+    VECTORIZED = 'vectorized'
+
+
+class StartupSteps(object):
+    SUBSCRIBER = 'subscriber'
+    AVAILABLE = 'available'
+    SUBSCRIBED = 'subscribed'
+
+
+class MetricStages(object):
+    UPDATE_ORDERBOOK_HIGH_LOW = 'update_orderbook_high_low'
+    UPDATE_LATEST_TRADE = 'update_latest_trade'
+    SCAN = 'scan'
+    PUBLISH = 'publish'
+    DISPLAY = 'display'
+    # crawler publish to monitor display
+    PUBLISH_TO_DISPLAY = 'publish_to_display'
+
+
 class ArbitrageTypes(object):
     ORDERBOOK_HIGH_LOW = 'orderbook_high_low'
     TRADE_PRICE = 'trade_price'
+    ORDERBOOK_DEPTH = 'orderbook_depth'
 
 
 class ExchangeSymbol(object):
+    __slots__ = ('exchange', 'symbol', 'market', 'trade')
+
     def __init__(self, exchange, symbol):
-        self.exchange = exchange
-        self.symbol = symbol
+        # interned once here, every arbitrage object of this symbol shares the same strings
+        self.exchange = sys.intern(exchange)
+        self.symbol = sys.intern(symbol)
 
-    @property
-    def market(self):
-        market, _ = self.symbol.split('_')
-        return market
+        market, trade = symbol.split('_')
+        self.market = sys.intern(market)
+        self.trade = sys.intern(trade)
 
-    @property
-    def trade(self):
-        _, trade = self.symbol.split('_')
-        return trade
+
+class ComparisonPairIndex(object):
+    """
+        comparison pairs with reverse indexes for looking up affected pairs in O(1)
+        pairs_by_trade_symbol: trade symbol -> pairs, ex) 'BTC' -> [(ExchangeSymbol('binance', 'USDT_BTC'), ...), ...]
+        pairs_by_exchange_symbol: (exchange, symbol) -> pairs, ex) ('upbit', 'KRW_BTC') -> [...]
+        exchange_rate_converted_pairs: pairs that have USDT market on any side
+    """
+    def __init__(self):
+        self.pairs = list()
+        self.pairs_by_trade_symbol = dict()
+        self.pairs_by_exchange_symbol = dict()
+        self.exchange_rate_converted_pairs = set()
+
+    def __len__(self):
+        return len(self.pairs)
+
+    def add(self, base_exchange_symbol, target_exchange_symbol):
+        pair_tuple = (base_exchange_symbol, target_exchange_symbol)
+        self.pairs.append(pair_tuple)
+
+        self.pairs_by_trade_symbol.setdefault(base_exchange_symbol.trade, list()).append(pair_tuple)
+        self.pairs_by_exchange_symbol.setdefault(
+            (base_exchange_symbol.exchange, base_exchange_symbol.symbol), list()).append(pair_tuple)
+        self.pairs_by_exchange_symbol.setdefault(
+            (target_exchange_symbol.exchange, target_exchange_symbol.symbol), list()).append(pair_tuple)
+
+        if Markets.USDT in (base_exchange_symbol.market, target_exchange_symbol.market):
+            self.exchange_rate_converted_pairs.add(pair_tuple)
+
+        return pair_tuple
+
+    def get_pairs_by_trade_symbol(self, trade_symbol):
+        return self.pairs_by_trade_symbol.get(trade_symbol, ())
+
+    def get_pairs_by_exchange_symbol(self, exchange, symbol):
+        return self.pairs_by_exchange_symbol.get((exchange, symbol), ())
+
+
+def get_exclude_key(arbitrage_type, base_exchange_symbol_obj, target_exchange_symbol_obj):
+    """
+        normalized exclude key, same order as exclude_set table columns
+    """
+    return (
+        arbitrage_type,
+        base_exchange_symbol_obj.trade,
+        base_exchange_symbol_obj.exchange,
+        base_exchange_symbol_obj.market,
+        target_exchange_symbol_obj.exchange,
+        target_exchange_symbol_obj.market
+    )
 
 
 class ArbitrageByOrderBookHighLowPrice(object):
+    """
+        compact record, prices are kept as they are and rounded only when they are read
+    """
+    __slots__ = (
+        'trade_symbol', 'base_exchange', 'base_exchange_market', 'target_exchange', 'target_exchange_market',
+        '_base_high_bid_price', '_target_low_ask_price', '_arbitrage_percent'
+    )
+
+    arbitrage_type = ArbitrageTypes.ORDERBOOK_HIGH_LOW
+
     def __init__(
             self, trade_symbol, base_exchange,
             base_exchange_market, target_exchange, target_exchange_market,
@@ -88,11 +234,22 @@ class ArbitrageByOrderBookHighLowPrice(object):
         self.target_exchange = target_exchange
         self.target_exchange_market = target_exchange_market
 
-        self.base_high_bid_price = round(base_high_bid_price, MAX_ZERO) if base_high_bid_price else base_high_bid_price
-        self.target_low_ask_price = round(target_low_ask_price,
-                                          MAX_ZERO) if target_low_ask_price else target_low_ask_price
+        self._base_high_bid_price = base_high_bid_price
+        self._target_low_ask_price = target_low_ask_price
+
+        self._arbitrage_percent = arbitrage_percent
+
+    @property
+    def base_high_bid_price(self):
+        return round_price(self._base_high_bid_price)
+
+    @property
+    def target_low_ask_price(self):
+        return round_price(self._target_low_ask_price)
 
-        self.arbitrage_percent = round(arbitrage_percent, MAX_ZERO) if arbitrage_percent else arbitrage_percent
+    @property
+    def arbitrage_percent(self):
+        return round_price(self._arbitrage_percent)
 
     @property
     def base_high_bid_price_with_comma(self):
@@ -120,14 +277,44 @@ class ArbitrageByOrderBookHighLowPrice(object):
             self.target_low_ask_price, self.arbitrage_percent
         )
 
+    def __reduce__(self):
+        return self.__class__, (
+            self.trade_symbol, self.base_exchange, self.base_exchange_market, self.target_exchange,
+            self.target_exchange_market, self._base_high_bid_price, self._target_low_ask_price,
+            self._arbitrage_percent
+        )
+
+    @property
+    def exclude_key(self):
+        return (
+            self.arbitrage_type, self.trade_symbol, self.base_exchange, self.base_exchange_market,
+            self.target_exchange, self.target_exchange_market
+        )
+
+    @property
+    def raw_values(self):
+        # unrounded values, the same raw values of a pair are not published again
+        return self._base_high_bid_price, self._target_low_ask_price, self._arbitrage_percent
+
     def __eq__(self, other):
         if isinstance(other, ArbitrageByOrderBookHighLowPrice):
-            return self.trade_symbol == other.trade_symbol and \
-                   self.base_exchange == other.base_exchange and self.base_exchange_market == other.base_exchange_market and \
-                   self.target_exchange == other.target_exchange and self.target_exchange_market == other.target_exchange_market
+            return self.exclude_key == other.exclude_key
+
+    def __hash__(self):
+        return hash(self.exclude_key)
 
 
 class ArbitrageByLastTradePrice(object):
+    """
+        compact record, prices are kept as they are and rounded only when they are read
+    """
+    __slots__ = (
+        'trade_symbol', 'base_exchange', 'base_exchange_market', 'target_exchange', 'target_exchange_market',
+        '_base_trade_price', '_target_trade_price', '_arbitrage_percent'
+    )
+
+    arbitrage_type = ArbitrageTypes.TRADE_PRICE
+
     def __init__(
             self, trade_symbol, base_exchange,
             base_exchange_market, target_exchange, target_exchange_market,
@@ -141,10 +328,22 @@ class ArbitrageByLastTradePrice(object):
         self.target_exchange = target_exchange
         self.target_exchange_market = target_exchange_market
 
-        self.base_trade_price = round(base_trade_price, MAX_ZERO) if base_trade_price else base_trade_price
-        self.target_trade_price = round(target_trade_price, MAX_ZERO) if target_trade_price else target_trade_price
+        self._base_trade_price = base_trade_price
+        self._target_trade_price = target_trade_price
+
+        self._arbitrage_percent = arbitrage_percent
+
+    @property
+    def base_trade_price(self):
+        return round_price(self._base_trade_price)
+
+    @property
+    def target_trade_price(self):
+        return round_price(self._target_trade_price)
 
-        self.arbitrage_percent = round(arbitrage_percent, MAX_ZERO) if arbitrage_percent else arbitrage_percent
+    @property
+    def arbitrage_percent(self):
+        return round_price(self._arbitrage_percent)
 
     @property
     def base_trade_price_with_comma(self):
@@ -172,335 +371,1234 @@ class ArbitrageByLastTradePrice(object):
             self.target_trade_price, self.arbitrage_percent
         )
 
+    def __reduce__(self):
+        return self.__class__, (
+            self.trade_symbol, self.base_exchange, self.base_exchange_market, self.target_exchange,
+            self.target_exchange_market, self._base_trade_price, self._target_trade_price,
+            self._arbitrage_percent
+        )
+
+    @property
+    def exclude_key(self):
+        return (
+            self.arbitrage_type, self.trade_symbol, self.base_exchange, self.base_exchange_market,
+            self.target_exchange, self.target_exchange_market
+        )
+
+    @property
+    def raw_values(self):
+        return self._base_trade_price, self._target_trade_price, self._arbitrage_percent
+
     def __eq__(self, other):
         if isinstance(other, ArbitrageByLastTradePrice):
-            return self.trade_symbol == other.trade_symbol and \
-                   self.base_exchange == other.base_exchange and self.base_exchange_market == other.base_exchange_market and \
-                   self.target_exchange == other.target_exchange and self.target_exchange_market == other.target_exchange_market
+            return self.exclude_key == other.exclude_key
+
+    def __hash__(self):
+        return hash(self.exclude_key)
+
+
+class ArbitrageByOrderBookDepth(object):
+    """
+        executable arbitrage, selling into base exchange bids and buying target exchange asks level by level
+        while the spread of the levels is at least depth_min_percent.
+        quantity: fillable quantity of trade symbol
+        base_vwap_price, target_vwap_price: volume weighted prices of the filled levels in KRW
+        expected_profit: KRW, (base_vwap_price - target_vwap_price) * quantity
+    """
+    __slots__ = (
+        'trade_symbol', 'base_exchange', 'base_exchange_market', 'target_exchange', 'target_exchange_market',
+        '_quantity', '_base_vwap_price', '_target_vwap_price', '_expected_profit', '_arbitrage_percent'
+    )
+
+    arbitrage_type = ArbitrageTypes.ORDERBOOK_DEPTH
+
+    def __init__(
+            self, trade_symbol, base_exchange,
+            base_exchange_market, target_exchange, target_exchange_market,
+            quantity=None, base_vwap_price=None, target_vwap_price=None, expected_profit=None, arbitrage_percent=None
+    ):
+        self.trade_symbol = trade_symbol
+
+        self.base_exchange = base_exchange
+        self.base_exchange_market = base_exchange_market
+
+        self.target_exchange = target_exchange
+        self.target_exchange_market = target_exchange_market
+
+        self._quantity = quantity
+        self._base_vwap_price = base_vwap_price
+        self._target_vwap_price = target_vwap_price
+        self._expected_profit = expected_profit
+
+        self._arbitrage_percent = arbitrage_percent
+
+    @property
+    def quantity(self):
+        return self._quantity
+
+    @property
+    def base_vwap_price(self):
+        return round_price(self._base_vwap_price)
+
+    @property
+    def target_vwap_price(self):
+        return round_price(self._target_vwap_price)
+
+    @property
+    def expected_profit(self):
+        return round_price(self._expected_profit)
+
+    @property
+    def arbitrage_percent(self):
+        return round_price(self._arbitrage_percent)
+
+    @property
+    def base_vwap_price_with_comma(self):
+        return format_comma(self.base_vwap_price)
+
+    @property
+    def target_vwap_price_with_comma(self):
+        return format_comma(self.target_vwap_price)
+
+    @property
+    def expected_profit_with_comma(self):
+        return format_comma(self.expected_profit)
+
+    @property
+    def arbitrage_percent_with_comma(self):
+        return format_comma(self.arbitrage_percent)
+
+    def __str__(self):
+        return """
+         arbitrage type : orderbook depth
+         trade symbol : [{}]
+         base exchange: [{}] base exchange market: [{}]
+         target exchange: [{}] target exchange market: [{}]
+         quantity: [{}] base vwap price: [{}] target vwap price: [{}]
+         expected profit: [{}] arbitrage percent: [{}]
+         """.format(
+            self.trade_symbol, self.base_exchange, self.base_exchange_market,
+            self.target_exchange, self.target_exchange_market, self.quantity, self.base_vwap_price,
+            self.target_vwap_price, self.expected_profit, self.arbitrage_percent
+        )
+
+    def __reduce__(self):
+        return self.__class__, (
+            self.trade_symbol, self.base_exchange, self.base_exchange_market, self.target_exchange,
+            self.target_exchange_market, self._quantity, self._base_vwap_price, self._target_vwap_price,
+            self._expected_profit, self._arbitrage_percent
+        )
+
+    @property
+    def exclude_key(self):
+        return (
+            self.arbitrage_type, self.trade_symbol, self.base_exchange, self.base_exchange_market,
+            self.target_exchange, self.target_exchange_market
+        )
+
+    @property
+    def raw_values(self):
+        return (self._quantity, self._base_vwap_price, self._target_vwap_price, self._expected_profit,
+                self._arbitrage_percent)
+
+    def __eq__(self, other):
+        if isinstance(other, ArbitrageByOrderBookDepth):
+            return self.exclude_key == other.exclude_key
+
+    def __hash__(self):
+        return hash(self.exclude_key)
+
+
+def fetch_ticker_price(exchange_api, symbol):
+    result = exchange_api.get_ticker(symbol)
+    if result.success:
+        return float(result.data['sai_price'])
+    return None
+
+
+def get_enabled_exchanges():
+    """
+        exchanges of config.ini which are registered with markets, at least two are needed for comparison
+    """
+    exchange_list = parse_exchanges(EXCHANGES)
+    if len(exchange_list) < 2:
+        raise ValueError('at least two registered exchanges are needed, exchanges - [{}]'.format(EXCHANGES))
+    return exchange_list
+
+
+def is_exchange_rate_required(exchanges):
+    """
+        only USDT prices are converted, KRW markets are compared as they are
+    """
+    return any(Markets.USDT in get_markets(exchange) for exchange in exchanges)
+
+
+def create_exchange_rate_service(exchanges, exchange_api_dict=None, is_fed=False):
+    """
+        ExchangeRateService of ExchangeRateSymbols.SOURCE_LIST, KRW_USDT and KRW_USD, it's not started yet.
+        returns None if no market of the exchanges needs exchange rate
+        exchanges: enabled exchanges
+        exchange_api_dict: exchange -> baseapi, source exchanges not in it are created only for REST tickers,
+                           nothing is subscribed
+        is_fed: rates are only pushed by set_rate(), ex) shard workers fed by ShardedCrawler
+    """
+    if not is_exchange_rate_required(exchanges):
+        return None
+
+    service = ExchangeRateService()
+
+    rate_source_api_dict = dict(exchange_api_dict or dict())
+    for exchange, symbol in ExchangeRateSymbols.SOURCE_LIST:
+        fetcher = None
+        if not is_fed:
+            exchange_api = rate_source_api_dict.get(exchange)
+            if exchange_api is None:
+                try:
+                    exchange_api = create_adapter(exchange, snapshot_mode=SNAPSHOT_MODE)
+                except (KeyError, ImportError) as ex:
+                    debugger.warning('failed to create {} for exchange rate [{}], {}'.format(exchange, symbol, ex))
+                    continue
+                rate_source_api_dict[exchange] = exchange_api
+            fetcher = partial(fetch_ticker_price, exchange_api, symbol)
+
+        interval, ttl = ExchangeRateSymbols.REFRESH_SCHEDULE[symbol]
+        service.register(symbol, fetcher, interval, ttl)
+
+    # 테더값은 업비트의 비트코인 원화가격을 바이낸스의 비트코인 테더로 나눈다
+    service.register_derived(
+        ExchangeRateSymbols.KRW_USDT,
+        lambda upbit_btc_to_krw, binance_btc_to_usdt: upbit_btc_to_krw / binance_btc_to_usdt,
+        [ExchangeRateSymbols.KRW_BTC, ExchangeRateSymbols.USDT_BTC]
+    )
+
+    # 원달러 환율
+    interval, ttl = ExchangeRateSymbols.REFRESH_SCHEDULE[ExchangeRateSymbols.KRW_USD]
+    service.register(ExchangeRateSymbols.KRW_USD, None if is_fed else get_current_krw_usd_exchange_rate,
+                     interval, ttl)
+    return service
 
 
 class MultiExchangeCrawler(threading.Thread):
-    def __init__(self, arbitrage_queue, exclude_trigger_queue):
+    # seconds, route costs are refreshed again soon while coin prices for withdrawal fees are not known
+    ROUTE_COST_RETRY_INTERVAL = 10
+
+    def __init__(self, arbitrage_queue, exclude_trigger_queue, exchange_api_dict=None, scan_mode=None, shard=None,
+                 exchange_rate_queue=None, ranking_size=None, history_maintenance=True):
+        """
+            exchange_api_dict: exchange -> baseapi object used instead of the default one, ex) benchmark adapters
+            scan_mode: ScanModes, default is scan_mode of config.ini
+            shard: (shard index, shard count), only trade symbols of the shard are subscribed and compared
+            exchange_rate_queue: queue of get_source_rates() of the other ExchangeRateService, rates are not fetched
+            ranking_size: default is ranking_size of config.ini, 0 is off
+            history_maintenance: False if the other process downsamples the history db, ex) shard workers but one
+        """
         super(MultiExchangeCrawler, self).__init__()
-        self.base_binance = BaseBinance(None, None)
-        self.base_bithumb = BaseBithumb(None, None)
-        self.base_huobi = BaseHuobi(None, None)
-        self.base_upbit = BaseUpbit(None, None)
-        self.base_mexc = BaseMexc(None, None)
-
-        self.binance_orderbook_high_low = None
-        self.bithumb_orderbook_high_low = None
-        self.huobi_orderbook_high_low = None
-        self.upbit_orderbook_high_low = None
-        self.mexc_orderbook_high_low = None
+        # only enabled exchanges are created, baseapi modules of the others are never imported
+        exchange_api_dict = exchange_api_dict or dict()
+        self.exchange_api_dict = {
+            exchange: exchange_api_dict.get(exchange) or self._create_exchange_api(exchange)
+            for exchange in get_enabled_exchanges()
+        }
+
+        # exchange -> ResultObject of this cycle, reused for every pair
+        self._orderbook_high_low_dict = dict()
+        self._latest_trade_dict = dict()
+        # exchange -> sai symbol -> dict(bids, asks), only dirty symbols are fetched again
+        self._orderbook_depth_dict = dict()
 
         self.arbitrage_monitor_model = ArbitrageMonitorModel()
         self.arbitrage_monitor_model.migrate()
 
-        self._exclude_arbitrage_by_orderbook_high_low_obj_list = list()
-        self._exclude_arbitrage_by_trade_price_obj_list = list()
+        # depth arbitrage walks orderbook levels of dirty pairs, it's computed in both scan modes
+        self.is_depth_arbitrage = DEPTH_ARBITRAGE
+        self.arbitrage_types = [ArbitrageTypes.ORDERBOOK_HIGH_LOW, ArbitrageTypes.TRADE_PRICE]
+        if self.is_depth_arbitrage:
+            self.arbitrage_types.append(ArbitrageTypes.ORDERBOOK_DEPTH)
+
+        # exclude keys from get_exclude_key(), and comparison pairs excluded per arbitrage type
+        # exclude version of ArbitrageMonitorModel the exclude keys are read at
+        self._exclude_key_set = None
+        self._exclude_version = None
+        self._excluded_pairs_dict = {arbitrage_type: set() for arbitrage_type in self.arbitrage_types}
+        # comparison pairs except pairs excluded for both arbitrage types
+        self.active_comparison_pairs = list()
 
         self.available_symbols_dict = dict()
+        self.exchange_rate_queue = exchange_rate_queue
         self.exchange_rate_dict = dict()
+        # KRW_USDT applied to USDT prices, it's moved only past exchange_rate_tolerance
+        self._usdt_in_krw = None
         self.subscribe_symbols_dict = dict()
-        self.comparison_pairs = list()
+        self.comparison_pair_index = ComparisonPairIndex()
+        self.comparison_pairs = self.comparison_pair_index.pairs
+
+        self._is_full_rescan_required = True
+        # arbitrages are removed outside the scan, ex) by exclude list
+        self._is_publish_required = False
+
+        self.scan_mode = scan_mode or SCAN_MODE
+        self.shard = shard
+        self._spread_matrix = None
+
+        # comparison pair -> (mul, add) of its route, net percent = gross percent * mul + add
+        self._route_cost_table = None
+        self._route_cost_dict = dict()
+        self._route_costs_refresh_at = None
+
+        # comparison pair -> latest arbitrage object
+        self._arbitrage_by_orderbook_high_low_dict = dict()
+        self._arbitrage_by_trade_price_dict = dict()
+
+        self._arbitrage_by_orderbook_depth_dict = dict()
+
+        # arbitrage type -> exclude key -> latest arbitrage object of vectorized scan
+        self._vectorized_arbitrage_dict = {
+            ArbitrageTypes.ORDERBOOK_HIGH_LOW: dict(),
+            ArbitrageTypes.TRADE_PRICE: dict()
+        }
 
         self._arbitrage_by_orderbook_high_low_list = list()
         self._arbitrage_by_trade_price_list = list()
+        self._arbitrage_by_orderbook_depth_list = list()
         self._arbitrage_dict = dict()
 
         self.arbitrage_queue = arbitrage_queue
         self.exclude_trigger_queue = exclude_trigger_queue
 
+        # ArbitrageChannel in delta mode gets only added/changed/removed arbitrages keyed by exclude key
+        self._is_delta_publish = getattr(arbitrage_queue, 'delta_mode', False)
+        self._arbitrage_delta_dict = self._get_empty_arbitrage_delta_dict()
+
+        # added/changed arbitrages of this cycle are handed to history writer thread
+        self._history_writer = self._get_history_writer(history_maintenance)
+        self._history_list = list()
+
+        # arbitrage type -> OpportunityRanking, updated with each added/changed/removed arbitrage
+        self.ranking_size = RANKING_SIZE if ranking_size is None else ranking_size
+        self._ranking_dict = None
+        if self.ranking_size:
+            self._ranking_dict = {
+                arbitrage_type: OpportunityRanking(RANKING_KEY) for arbitrage_type in self.arbitrage_types
+            }
+
         self.loop = asyncio.get_event_loop()
 
+        # exchange -> [(startup step, seconds from start), ...]
+        self.startup_timeline_dict = dict()
+        self._started_at = time.time()
+        self._first_published_at = None
+
         self._set_all_subscribe()
         self._set_all_availables()
+        self._set_exchange_rate_service()
         self._set_comparison_pairs()
+        self._set_spread_matrix()
+        self._set_route_cost_table()
         self._subscribe_symbols()
+        self._set_metrics()
 
         self._update_exclude_list()
+        self._log_startup_timeline()
 
-    def _set_all_subscribe(self):
-        self.base_binance.set_subscriber()
-        self.base_bithumb.set_subscriber()
-        self.base_upbit.set_subscriber()
-        self.base_huobi.set_subscriber()
-        self.base_mexc.set_subscriber()
+    @staticmethod
+    def _get_history_writer(is_maintenance):
+        if not HISTORY:
+            return None
 
-    def _set_all_availables(self):
-        """
-            upbit, bithumb -> KRW market
-            binance, huobi, mexc -> USDT market
-        """
+        history_model = OpportunityHistoryModel(HISTORY_RAW_RETENTION, HISTORY_1S_RETENTION, HISTORY_1M_RETENTION)
+        history_model.migrate()
 
-        binance_symbol_list = self.base_binance.get_available()
-        filtered_binance_symbol_list = filter_market([Markets.USDT], binance_symbol_list)
+        history_writer = OpportunityHistoryWriter(history_model, is_maintenance)
+        history_writer.start()
+        return history_writer
 
-        huobi_symbol_list = self.base_huobi.get_available()
-        filtered_huobi_symbol_list = filter_market([Markets.USDT], huobi_symbol_list)
+    @staticmethod
+    def _create_exchange_api(exchange):
+        return create_adapter(exchange, snapshot_mode=SNAPSHOT_MODE)
 
-        mexc_symbol_list = self.base_mexc.get_available()
-        filtered_mexc_symbol_list = filter_market([Markets.USDT], mexc_symbol_list)
+    def _get_frame_recorder(self, exchange):
+        if not RECORD_FRAMES_DIR:
+            return None
 
-        upbit_symbol_list = self.base_upbit.get_available()
-        filtered_upbit_symbol_list = filter_market([Markets.KRW], upbit_symbol_list)
+        os.makedirs(RECORD_FRAMES_DIR, exist_ok=True)
+        return FrameRecorder(os.path.join(RECORD_FRAMES_DIR, '{}.frames.gz'.format(exchange)))
 
-        bithumb_symbol_list = self.base_bithumb.get_available()
-        filtered_bithumb_symbol_list = filter_market([Markets.KRW], bithumb_symbol_list)
+    def _run_per_exchange(self, step, function, exchanges=None):
+        """
+            run function(exchange, exchange_api) for exchanges concurrently, finish time is recorded as startup step
+            exchanges: default is every exchange
+            returns exchange -> result, exception of an exchange is raised after every exchange is finished
+        """
+        exchange_api_list = [(exchange, exchange_api) for exchange, exchange_api in self._exchange_api_list()
+                             if exchanges is None or exchange in exchanges]
+        if not exchange_api_list:
+            return dict()
+
+        with ThreadPoolExecutor(max_workers=len(exchange_api_list), thread_name_prefix='startup') as executor:
+            future_dict = {
+                exchange: executor.submit(self._run_startup_step, step, function, exchange, exchange_api)
+                for exchange, exchange_api in exchange_api_list
+            }
+        return {exchange: future.result() for exchange, future in future_dict.items()}
+
+    def _run_startup_step(self, step, function, exchange, exchange_api):
+        result = function(exchange, exchange_api)
+        self.startup_timeline_dict.setdefault(exchange, list()).append((step, time.time() - self._started_at))
+        return result
+
+    def _log_startup_timeline(self):
+        for exchange, step_list in self.startup_timeline_dict.items():
+            debugger.info('startup timeline {} - {}'.format(
+                exchange, ', '.join('{} {:.2f}s'.format(step, seconds) for step, seconds in step_list)))
+        debugger.info('startup finished in {:.2f}s'.format(time.time() - self._started_at))
+
+    def _set_subscriber(self, exchange, exchange_api):
+        subscriber_kwargs = get_subscriber_kwargs(exchange, use_event_loop=ASYNCIO_SUBSCRIBER, recorder=None)
+        # recorder file is opened only for exchanges which record frames
+        if 'recorder' in subscriber_kwargs:
+            subscriber_kwargs['recorder'] = self._get_frame_recorder(exchange)
+        exchange_api.set_subscriber(**subscriber_kwargs)
 
-        self.available_symbols_dict[Exchanges.BINANCE.value] = filtered_binance_symbol_list
-        self.available_symbols_dict[Exchanges.HUOBI.value] = filtered_huobi_symbol_list
-        self.available_symbols_dict[Exchanges.MEXC.value] = filtered_mexc_symbol_list
-        self.available_symbols_dict[Exchanges.UPBIT.value] = filtered_upbit_symbol_list
-        self.available_symbols_dict[Exchanges.BITHUMB.value] = filtered_bithumb_symbol_list
+    def _set_all_subscribe(self):
+        self._run_per_exchange(StartupSteps.SUBSCRIBER, self._set_subscriber)
 
-    def update_market_exchange_rates(self):
-        upbit_support_symbols = [ExchangeRateSymbols.KRW_BTC, ExchangeRateSymbols.KRW_ETH]
+    def _get_available(self, exchange, exchange_api):
+        symbol_list = filter_market(get_markets(exchange), exchange_api.get_available())
+        if self.shard is not None:
+            symbol_list = filter_shard(*self.shard, symbol_list)
+        return symbol_list
 
-        for symbol in upbit_support_symbols:
-            result = self.base_upbit.get_ticker(symbol)
-            if result.success:
-                current_price = result.data['sai_price']
-                self.exchange_rate_dict[symbol] = current_price
+    def _set_all_availables(self):
+        """
+            upbit, bithumb -> KRW market
+            binance, huobi, mexc -> USDT market
+        """
+        self.available_symbols_dict.update(self._run_per_exchange(StartupSteps.AVAILABLE, self._get_available))
 
-        binance_support_symbols = [ExchangeRateSymbols.USDT_BTC]
+    def _set_exchange_rate_service(self):
+        """
+            exchange rates are refreshed by ExchangeRateService thread so scan loop never blocks on REST calls.
+            KRW_BTC, KRW_ETH, USDT_BTC are also taken from subscribed trades when they are updated.
+            with exchange_rate_queue, rates are fed by the other process and nothing is fetched here.
+            it's None when only KRW markets are compared
+        """
+        is_fed = self.exchange_rate_queue is not None
+        self.exchange_rate_service = create_exchange_rate_service(list(self.exchange_api_dict), self.exchange_api_dict,
+                                                                  is_fed=is_fed)
+        if self.exchange_rate_service is not None and not is_fed:
+            self.exchange_rate_service.start()
 
-        for symbol in binance_support_symbols:
-            result = self.base_binance.get_ticker(symbol)
-            if result.success:
-                current_price = float(result.data['sai_price'])
-                self.exchange_rate_dict[symbol] = current_price
+    def _receive_exchange_rates(self):
+        """
+            feed rates from exchange_rate_queue, see ShardedCrawler
+        """
+        while True:
+            try:
+                rate_dict = self.exchange_rate_queue.get_nowait()
+            except queue.Empty:
+                return
 
-        # 테더값은 업비트의 비트코인 원화가격을 바이낸스의 비트코인 테더로 나눈다
-        upbit_btc_to_krw = self.exchange_rate_dict[ExchangeRateSymbols.KRW_BTC]
-        binance_btc_to_usdt = self.exchange_rate_dict[ExchangeRateSymbols.USDT_BTC]
+            for symbol, (value, updated_at) in rate_dict.items():
+                self.exchange_rate_service.set_rate(symbol, value, updated_at)
 
-        usdt_in_krw = upbit_btc_to_krw / binance_btc_to_usdt
-        self.exchange_rate_dict[ExchangeRateSymbols.KRW_USDT] = usdt_in_krw
+    def _update_exchange_rates_from_trades(self, updated_symbols_dict):
+        """
+            push exchange rates from already subscribed trades instead of waiting for REST refresh
+        """
+        for exchange, symbol in ExchangeRateSymbols.SOURCE_LIST:
+            _, trade_symbols = updated_symbols_dict.get(exchange, (set(), set()))
+            if symbol not in trade_symbols:
+                continue
 
-        # 원달러 환율
-        usd_in_krw = get_current_krw_usd_exchange_rate()
-        self.exchange_rate_dict[ExchangeRateSymbols.KRW_USD] = usd_in_krw
+            result = self._get_latest_trade_by_symbol(self.exchange_api_dict[exchange], symbol)
+            if result.success and result.data:
+                self.exchange_rate_service.set_rate(symbol, float(result.data['price']))
+
+    def update_market_exchange_rates(self):
+        """
+            read cached exchange rates, it doesn't block. expired or not fetched rates are None
+        """
+        self.exchange_rate_dict.update(self.exchange_rate_service.get_rates())
 
     def _set_comparison_pairs(self):
         """
             set comparison pairs from exchange combinations
-            it makes pairs from two lists
+            it joins two exchanges' symbol lists on trade symbol
             ex) binance: ['USDT_BTC', 'USDT_DOGE', ...], upbit: ['KRW_BTC', 'USDT_XRP', ...]
 
-            -> self.comparison_pairs : [(ExchangeSymbol('binance', 'BTC'), ExchangeSymbol('upbit', 'BTC')), ...]
+            -> self.comparison_pairs : [(ExchangeSymbol('binance', 'USDT_BTC'), ExchangeSymbol('upbit', 'KRW_BTC')), ...]
+            -> self.comparison_pair_index : trade symbol, (exchange, symbol) -> pairs
         """
-        exchanges = [exchange.value for exchange in Exchanges]
+        exchanges = list(self.exchange_api_dict)
         exchange_combinations = get_exchange_combinations(exchanges)
 
-        for base_exchange, target_exchange in exchange_combinations:
-            base_available_list = self.available_symbols_dict[Exchanges(base_exchange).value]
-            target_available_list = self.available_symbols_dict[Exchanges(target_exchange).value]
+        # exchange -> trade symbol -> [ExchangeSymbol, ...], built once so the join below is linear
+        exchange_symbols_by_trade_dict = dict()
+        for exchange in exchanges:
+            symbols_by_trade = exchange_symbols_by_trade_dict.setdefault(exchange, dict())
+            for symbol in self.available_symbols_dict.get(exchange, list()):
+                exchange_symbol = ExchangeSymbol(exchange, symbol)
+                symbols_by_trade.setdefault(exchange_symbol.trade, list()).append(exchange_symbol)
 
-            for base_symbol in base_available_list:
-                _, base_trade = base_symbol.split('_')
-                for target_symbol in target_available_list:
-                    _, target_trade = target_symbol.split('_')
+        comparison_pair_index = ComparisonPairIndex()
+        subscribe_symbols_dict = dict()
 
-                    if base_trade == target_trade:
-                        base_exchange_symbol = ExchangeSymbol(base_exchange, base_symbol)
-                        target_exchange_symbol = ExchangeSymbol(target_exchange, target_symbol)
-                        pair_tuple = (base_exchange_symbol, target_exchange_symbol)
+        for base_exchange, target_exchange in exchange_combinations:
+            base_symbols_by_trade = exchange_symbols_by_trade_dict[base_exchange]
+            target_symbols_by_trade = exchange_symbols_by_trade_dict[target_exchange]
+
+            for trade, base_exchange_symbols in base_symbols_by_trade.items():
+                target_exchange_symbols = target_symbols_by_trade.get(trade)
+                if not target_exchange_symbols:
+                    continue
 
-                        self.comparison_pairs.append(pair_tuple)
+                for base_exchange_symbol in base_exchange_symbols:
+                    for target_exchange_symbol in target_exchange_symbols:
+                        comparison_pair_index.add(base_exchange_symbol, target_exchange_symbol)
 
                         # add symbols that are actually going to be subscribed
-                        self.subscribe_symbols_dict.setdefault(base_exchange, set())
-                        self.subscribe_symbols_dict.setdefault(target_exchange, set())
+                        subscribe_symbols_dict.setdefault(base_exchange, set()).add(base_exchange_symbol.symbol)
+                        subscribe_symbols_dict.setdefault(target_exchange, set()).add(target_exchange_symbol.symbol)
+
+        self.comparison_pair_index = comparison_pair_index
+        self.comparison_pairs = comparison_pair_index.pairs
+        self.subscribe_symbols_dict = subscribe_symbols_dict
+
+    def _set_spread_matrix(self):
+        if self.scan_mode != ScanModes.VECTORIZED:
+            return
+
+        if SpreadMatrix is None:
+            debugger.warning('numpy is not installed, scan mode falls back to [{}]'.format(ScanModes.INCREMENTAL))
+            self.scan_mode = ScanModes.INCREMENTAL
+            return
+
+        self._spread_matrix = SpreadMatrix(self.subscribe_symbols_dict)
+
+    def _set_route_cost_table(self):
+        if not ROUTE_COSTS:
+            return
+
+        exchange_info_dict = get_exchange_info_dict(config, self.exchange_api_dict)
+        self._route_cost_table = RouteCostTable(exchange_info_dict, TRANSFER_REFERENCE_KRW)
+        self._refresh_route_costs()
+
+    def _get_reference_price(self, trade_symbol):
+        """
+            KRW price of trade symbol from the latest trade of any exchange, None if no trade is stored
+        """
+        for exchange, exchange_api in self.exchange_api_dict.items():
+            subscribe_symbols = self.subscribe_symbols_dict.get(exchange, ())
+            for market in get_markets(exchange):
+                symbol = '{}_{}'.format(market, trade_symbol)
+                if symbol not in subscribe_symbols:
+                    continue
+
+                result = self._get_latest_trade_by_symbol(exchange_api, symbol)
+                if result.success and result.data:
+                    price = self._convert_exchange_rate(symbol, result.data['price'])
+                    if price:
+                        return price
+        return None
 
-                        self.subscribe_symbols_dict[base_exchange].add(base_symbol)
-                        self.subscribe_symbols_dict[target_exchange].add(target_symbol)
+    def _refresh_route_costs(self):
+        """
+            costs are applied to every pair on the next cycle by full rescan
+        """
+        route_dict = {
+            pair: (pair[0].exchange, pair[1].exchange, pair[0].trade) for pair in self.comparison_pairs
+        }
+        unpriced_count = self._route_cost_table.refresh(set(route_dict.values()), self._get_reference_price)
+        cost_dict = self._route_cost_table.cost_dict
+
+        self._route_cost_dict = {pair: cost_dict[route] for pair, route in route_dict.items()}
+        if self._spread_matrix is not None:
+            self._spread_matrix.set_route_costs([
+                (base.trade, (base.exchange, base.market), (target.exchange, target.market), mul, add)
+                for (base, target), (mul, add) in self._route_cost_dict.items()
+            ])
+        self._is_full_rescan_required = True
+
+        interval = self.ROUTE_COST_RETRY_INTERVAL if unpriced_count else ROUTE_COST_REFRESH_INTERVAL
+        self._route_costs_refresh_at = time.time() + interval
+        debugger.info('route costs of {} pairs are refreshed, {} routes wait for coin price'.format(
+            len(self._route_cost_dict), unpriced_count))
+
+    def _apply_route_cost(self, base_exchange_symbol_obj, target_exchange_symbol_obj, percent):
+        route_cost = self._route_cost_dict.get((base_exchange_symbol_obj, target_exchange_symbol_obj))
+        if route_cost is None:
+            return percent
+        return percent * route_cost[0] + route_cost[1]
+
+    def _subscribe_exchange_symbols(self, exchange, exchange_api):
+        subscribe_symbol_list = list(self.subscribe_symbols_dict[exchange])
+
+        # both wait for the websocket of the exchange to open
+        exchange_api.set_subscribe_orderbook(subscribe_symbol_list)
+        exchange_api.set_subscribe_trade(subscribe_symbol_list)
+        debugger.info('subscribe {}'.format(exchange))
 
     def _subscribe_symbols(self):
-        for exchange in self.subscribe_symbols_dict:
-            subscribe_symbol_list = list(self.subscribe_symbols_dict[exchange])
-
-            if exchange == Exchanges.BINANCE.value:
-                self.base_binance.set_subscribe_orderbook(subscribe_symbol_list)
-                self.base_binance.set_subscribe_trade(subscribe_symbol_list)
-                debugger.info('subscribe {}'.format(Exchanges.BINANCE.value))
-
-            elif exchange == Exchanges.BITHUMB.value:
-                self.base_bithumb.set_subscribe_orderbook(subscribe_symbol_list)
-                self.base_bithumb.set_subscribe_trade(subscribe_symbol_list)
-                debugger.info('subscribe {}'.format(Exchanges.BITHUMB.value))
-
-            elif exchange == Exchanges.UPBIT.value:
-                self.base_upbit.set_subscribe_orderbook(subscribe_symbol_list)
-                self.base_upbit.set_subscribe_trade(subscribe_symbol_list)
-                debugger.info('subscribe {}'.format(Exchanges.UPBIT.value))
-
-            elif exchange == Exchanges.HUOBI.value:
-                self.base_huobi.set_subscribe_orderbook(subscribe_symbol_list)
-                self.base_huobi.set_subscribe_trade(subscribe_symbol_list)
-                debugger.info('subscribe {}'.format(Exchanges.HUOBI.value))
-
-            elif exchange == Exchanges.MEXC.value:
-                self.base_mexc.set_subscribe_orderbook(subscribe_symbol_list)
-                self.base_mexc.set_subscribe_trade(subscribe_symbol_list)
-                debugger.info('subscribe {}'.format(Exchanges.MEXC.value))
+        self._run_per_exchange(StartupSteps.SUBSCRIBED, self._subscribe_exchange_symbols,
+                               exchanges=self.subscribe_symbols_dict)
+
+    def _set_metrics(self):
+        self._cycle_histogram = metrics.histogram('scan_cycle_seconds', scan_mode=self.scan_mode)
+        self._stage_histogram_dict = {
+            stage: metrics.histogram('stage_seconds', stage=stage)
+            for stage in (MetricStages.UPDATE_ORDERBOOK_HIGH_LOW, MetricStages.UPDATE_LATEST_TRADE,
+                          MetricStages.SCAN, MetricStages.PUBLISH)
+        }
+        self._published_counter = metrics.counter('published_messages_total')
+
+        metrics.gauge('arbitrage_queue_depth').set_function(self.arbitrage_queue.qsize)
+
+        # exchanges keeping DataStore report how old their latest orderbook/trade is
+        for exchange, exchange_api in self._exchange_api_list():
+            data_store = getattr(exchange_api, 'data_store', None)
+            if data_store is None:
+                continue
 
-    def _convert_exchange_rate(self, symbol, price):
+            for channel in ('orderbook', 'trade'):
+                metrics.gauge('quote_age_seconds', exchange=exchange, channel=channel).set_function(
+                    partial(self._get_quote_age, data_store, '{}_updated_at'.format(channel)))
+
+    @staticmethod
+    def _get_quote_age(data_store, attribute):
+        updated_at = getattr(data_store, attribute, None)
+        return time.time() - updated_at if updated_at else float('nan')
+
+    def _get_exchange_rate(self, symbol):
+        """
+            KRW price of the market of the symbol, None if exchange rate is not fetched yet or expired
+        """
         market, trade = symbol.split('_')
         if market == Markets.USDT:
-            usdt_in_krw = self.exchange_rate_dict[ExchangeRateSymbols.KRW_USDT]
-            return price * usdt_in_krw
-        return price
+            return self._usdt_in_krw
+        return 1
+
+    def _update_usdt_in_krw(self):
+        """
+            KRW_USDT is derived from BTC prices, so it moves on every BTC trade.
+            every USDT pair is re-priced with it only when it moves past exchange_rate_tolerance (relative),
+            gets expired or is fetched again. returns True if the applied rate is changed
+        """
+        usdt_in_krw = self.exchange_rate_dict.get(ExchangeRateSymbols.KRW_USDT)
+        if usdt_in_krw is None or self._usdt_in_krw is None:
+            is_changed = usdt_in_krw != self._usdt_in_krw
+        else:
+            is_changed = abs(usdt_in_krw - self._usdt_in_krw) > self._usdt_in_krw * EXCHANGE_RATE_TOLERANCE
+
+        if is_changed:
+            self._usdt_in_krw = usdt_in_krw
+        return is_changed
+
+    def _convert_exchange_rate(self, symbol, price):
+        rate = self._get_exchange_rate(symbol)
+        if not rate:
+            return None
+        return price * rate
+
+    def _is_exclude_changed(self):
+        return self.arbitrage_monitor_model.get_exclude_version() != self._exclude_version
 
     def _update_exclude_list(self):
-        self._exclude_arbitrage_by_orderbook_high_low_obj_list = list()
-        self._exclude_arbitrage_by_trade_price_obj_list = list()
-
-        exclude_list = self.arbitrage_monitor_model.get_excludes_list()
-        for each in exclude_list:
-            if each['arbitrage_type'] == ArbitrageTypes.ORDERBOOK_HIGH_LOW:
-                obj = ArbitrageByOrderBookHighLowPrice(
-                    each['trade_symbol'],
-                    each['base_exchange'],
-                    each['base_exchange_market'],
-                    each['target_exchange'],
-                    each['target_exchange_market']
-                )
-                self._exclude_arbitrage_by_orderbook_high_low_obj_list.append(obj)
-
-            elif each['arbitrage_type'] == ArbitrageTypes.TRADE_PRICE:
-                obj = ArbitrageByLastTradePrice(
-                    each['trade_symbol'],
-                    each['base_exchange'],
-                    each['base_exchange_market'],
-                    each['target_exchange'],
-                    each['target_exchange_market']
-                )
-                self._exclude_arbitrage_by_trade_price_obj_list.append(obj)
+        # version is taken first, changes while reading are picked up on the next check
+        exclude_version = self.arbitrage_monitor_model.get_exclude_version()
+        exclude_key_set = self.arbitrage_monitor_model.get_exclude_key_set()
+        if exclude_key_set is False:
+            debugger.warning('_update_exclude_list() ::: failed to read exclude list, keep the previous one')
+            return
+
+        self._exclude_version = exclude_version
+        if exclude_key_set == self._exclude_key_set:
+            return
+
+        self._is_full_rescan_required = True
+        self._exclude_key_set = exclude_key_set
+
+        for arbitrage_type, excluded_pairs in self._excluded_pairs_dict.items():
+            excluded_pairs.clear()
+            for pair in self.comparison_pairs:
+                if get_exclude_key(arbitrage_type, *pair) in self._exclude_key_set:
+                    excluded_pairs.add(pair)
+
+        # removed here, the following rescan finds nothing changed for them, so lists are rebuilt right away
+        # and the next cycle publishes regardless of the scan
+        is_orderbook_high_low_removed = False
+        for pair in self._excluded_pairs_dict[ArbitrageTypes.ORDERBOOK_HIGH_LOW]:
+            if self._store_arbitrage(ArbitrageTypes.ORDERBOOK_HIGH_LOW, self._arbitrage_by_orderbook_high_low_dict,
+                                     pair, None):
+                is_orderbook_high_low_removed = True
+
+        is_trade_price_removed = False
+        for pair in self._excluded_pairs_dict[ArbitrageTypes.TRADE_PRICE]:
+            if self._store_arbitrage(ArbitrageTypes.TRADE_PRICE, self._arbitrage_by_trade_price_dict, pair, None):
+                is_trade_price_removed = True
+
+        is_orderbook_depth_removed = False
+        for pair in self._excluded_pairs_dict.get(ArbitrageTypes.ORDERBOOK_DEPTH, ()):
+            if self._store_arbitrage(ArbitrageTypes.ORDERBOOK_DEPTH, self._arbitrage_by_orderbook_depth_dict,
+                                     pair, None):
+                is_orderbook_depth_removed = True
+
+        if is_orderbook_high_low_removed:
+            self._arbitrage_by_orderbook_high_low_list = list(self._arbitrage_by_orderbook_high_low_dict.values())
+        if is_trade_price_removed:
+            self._arbitrage_by_trade_price_list = list(self._arbitrage_by_trade_price_dict.values())
+        if is_orderbook_depth_removed:
+            self._arbitrage_by_orderbook_depth_list = list(self._arbitrage_by_orderbook_depth_dict.values())
+        if is_orderbook_high_low_removed or is_trade_price_removed or is_orderbook_depth_removed:
+            self._is_publish_required = True
+
+        # pairs excluded for both orderbook high low & trade price are dropped from their scan entirely,
+        # depth scan checks its own excludes
+        fully_excluded_pairs = (self._excluded_pairs_dict[ArbitrageTypes.ORDERBOOK_HIGH_LOW]
+                                & self._excluded_pairs_dict[ArbitrageTypes.TRADE_PRICE])
+        self.active_comparison_pairs = [pair for pair in self.comparison_pairs if pair not in fully_excluded_pairs]
+
+        if self._spread_matrix is not None:
+            self._spread_matrix.reset_excludes()
+            for exclude_key in exclude_key_set:
+                self._spread_matrix.set_exclude(*exclude_key)
+
+    def _exchange_api_list(self):
+        return list(self.exchange_api_dict.items())
+
+    def _collect_updated_symbols(self):
+        """
+            returns exchange -> (orderbook updated symbols, trade updated symbols) since the last cycle
+        """
+        updated_symbols_dict = dict()
+        for exchange, exchange_api in self._exchange_api_list():
+            updated_symbols_dict[exchange] = (
+                self._pop_updated_symbols(exchange, exchange_api, 'pop_updated_orderbook_symbols'),
+                self._pop_updated_symbols(exchange, exchange_api, 'pop_updated_trade_symbols')
+            )
+        return updated_symbols_dict
+
+    def _pop_updated_symbols(self, exchange, exchange_api, method_name):
+        pop_updated_symbols = getattr(exchange_api, method_name, None)
+        if pop_updated_symbols is None:
+            # baseapi doesn't track updated symbols, every subscribed symbol is dirty
+            return set(self.subscribe_symbols_dict.get(exchange, ()))
+        return pop_updated_symbols()
+
+    @staticmethod
+    def _get_latest_trade_by_symbol(exchange_api, symbol):
+        get_latest_trade_by_symbol = getattr(exchange_api, 'get_latest_trade_by_symbol', None)
+        if get_latest_trade_by_symbol is not None:
+            return get_latest_trade_by_symbol(symbol)
+
+        # baseapi has only the whole snapshot
+        result = exchange_api.get_latest_trade()
+        if not result.success:
+            return result
+        return ResultObject(True, result.data.get(symbol))
+
+    def _collect_dirty_pairs(self, updated_symbols_dict):
+        """
+            collect comparison pairs touching (exchange, symbol) updated since the last cycle
+            returns (orderbook dirty pairs, trade dirty pairs)
+        """
+        orderbook_dirty_pairs = set()
+        trade_dirty_pairs = set()
+
+        for exchange, (orderbook_symbols, trade_symbols) in updated_symbols_dict.items():
+            for symbol in orderbook_symbols:
+                orderbook_dirty_pairs.update(self.comparison_pair_index.get_pairs_by_exchange_symbol(exchange, symbol))
+
+            for symbol in trade_symbols:
+                trade_dirty_pairs.update(self.comparison_pair_index.get_pairs_by_exchange_symbol(exchange, symbol))
+
+        return orderbook_dirty_pairs, trade_dirty_pairs
+
+    def _get_arbitrage_by_orderbook_high_low(self, base_exchange_symbol_obj, target_exchange_symbol_obj):
+        # get orderbook high bid price for base & orderbook low ask price for target
+        base_high_bid_price = self._get_orderbook_high_low(
+            base_exchange_symbol_obj.exchange,
+            base_exchange_symbol_obj.symbol,
+            Consts.BID
+        )
+        target_low_ask_price = self._get_orderbook_high_low(
+            target_exchange_symbol_obj.exchange,
+            target_exchange_symbol_obj.symbol,
+            Consts.ASK
+        )
+
+        if not (base_high_bid_price and target_low_ask_price):
+            return None
+
+        base_high_bid_price = self._convert_exchange_rate(base_exchange_symbol_obj.symbol, base_high_bid_price)
+        target_low_ask_price = self._convert_exchange_rate(target_exchange_symbol_obj.symbol, target_low_ask_price)
+
+        if not (base_high_bid_price and target_low_ask_price):
+            return None
+
+        arbitrage_by_orderbook_high_low_percent = self._apply_route_cost(
+            base_exchange_symbol_obj, target_exchange_symbol_obj,
+            ((base_high_bid_price - target_low_ask_price) / base_high_bid_price) * 100
+        )
+
+        return ArbitrageByOrderBookHighLowPrice(
+            base_exchange_symbol_obj.trade,
+            base_exchange_symbol_obj.exchange,
+            base_exchange_symbol_obj.market,
+            target_exchange_symbol_obj.exchange,
+            target_exchange_symbol_obj.market,
+            base_high_bid_price,
+            target_low_ask_price,
+            arbitrage_by_orderbook_high_low_percent
+        )
+
+    def _get_arbitrage_by_trade_price(self, base_exchange_symbol_obj, target_exchange_symbol_obj):
+        # get trade price for base & trade price for target
+        base_trade_price = self._get_last_trade(
+            base_exchange_symbol_obj.exchange,
+            base_exchange_symbol_obj.symbol
+        )
+        target_trade_price = self._get_last_trade(
+            target_exchange_symbol_obj.exchange,
+            target_exchange_symbol_obj.symbol
+        )
+
+        if not (base_trade_price and target_trade_price):
+            return None
+
+        base_trade_price = self._convert_exchange_rate(base_exchange_symbol_obj.symbol, base_trade_price)
+        target_trade_price = self._convert_exchange_rate(target_exchange_symbol_obj.symbol, target_trade_price)
+
+        if not (base_trade_price and target_trade_price):
+            return None
+
+        arbitrage_by_trade_price_percent = self._apply_route_cost(
+            base_exchange_symbol_obj, target_exchange_symbol_obj,
+            ((base_trade_price - target_trade_price) / base_trade_price) * 100
+        )
+
+        return ArbitrageByLastTradePrice(
+            base_exchange_symbol_obj.trade,
+            base_exchange_symbol_obj.exchange,
+            base_exchange_symbol_obj.market,
+            target_exchange_symbol_obj.exchange,
+            target_exchange_symbol_obj.market,
+            base_trade_price,
+            target_trade_price,
+            arbitrage_by_trade_price_percent
+        )
+
+    def _update_orderbook_depth(self, dirty_symbols_dict):
+        """
+            dirty_symbols_dict: exchange -> sai symbols whose depth is fetched again
+        """
+        for exchange, symbols in dirty_symbols_dict.items():
+            get_orderbook_depth_sync = getattr(self.exchange_api_dict[exchange], 'get_orderbook_depth_sync', None)
+            if get_orderbook_depth_sync is None or not symbols:
+                # baseapi keeps only best levels, depth arbitrages of the exchange are not computed
+                continue
+
+            result = get_orderbook_depth_sync(list(symbols))
+            if result.success:
+                self._orderbook_depth_dict.setdefault(exchange, dict()).update(result.data)
+
+    def _get_arbitrage_by_orderbook_depth(self, base_exchange_symbol_obj, target_exchange_symbol_obj):
+        base_depth = self._orderbook_depth_dict.get(base_exchange_symbol_obj.exchange, {}).get(
+            base_exchange_symbol_obj.symbol)
+        target_depth = self._orderbook_depth_dict.get(target_exchange_symbol_obj.exchange, {}).get(
+            target_exchange_symbol_obj.symbol)
+
+        if not (base_depth and target_depth):
+            return None
+
+        base_rate = self._get_exchange_rate(base_exchange_symbol_obj.symbol)
+        target_rate = self._get_exchange_rate(target_exchange_symbol_obj.symbol)
+
+        if not (base_rate and target_rate):
+            return None
+
+        # sell into base bids, buy from target asks
+        filled = walk_orderbook_depth(base_depth[Consts.BIDS], target_depth[Consts.ASKS], DEPTH_MIN_PERCENT,
+                                      base_rate, target_rate)
+        if filled is None:
+            return None
+
+        quantity, base_vwap_price, target_vwap_price, expected_profit = filled
+        arbitrage_percent = self._apply_route_cost(
+            base_exchange_symbol_obj, target_exchange_symbol_obj,
+            (base_vwap_price - target_vwap_price) / base_vwap_price * 100
+        )
+        if self._route_cost_table is not None:
+            # net percent is relative to base notional
+            expected_profit = base_vwap_price * quantity * arbitrage_percent / 100
+
+        if expected_profit < DEPTH_MIN_PROFIT:
+            return None
+
+        return ArbitrageByOrderBookDepth(
+            base_exchange_symbol_obj.trade,
+            base_exchange_symbol_obj.exchange,
+            base_exchange_symbol_obj.market,
+            target_exchange_symbol_obj.exchange,
+            target_exchange_symbol_obj.market,
+            quantity,
+            base_vwap_price,
+            target_vwap_price,
+            expected_profit,
+            arbitrage_percent
+        )
+
+    def _get_empty_arbitrage_delta_dict(self):
+        return {
+            arbitrage_type: {DeltaKeys.ADDED: dict(), DeltaKeys.CHANGED: dict(), DeltaKeys.REMOVED: set()}
+            for arbitrage_type in self.arbitrage_types
+        }
+
+    def _record_arbitrage_delta(self, arbitrage_type, key, obj, is_existing):
+        if obj is not None and self._history_writer is not None:
+            self._history_list.append(obj)
+
+        if self._ranking_dict is not None:
+            self._ranking_dict[arbitrage_type].update(key, obj)
+
+        if not self._is_delta_publish:
+            return
+
+        section = {DeltaKeys.ADDED: dict(), DeltaKeys.CHANGED: dict(), DeltaKeys.REMOVED: set()}
+        if obj is None:
+            section[DeltaKeys.REMOVED].add(key)
+        elif is_existing:
+            section[DeltaKeys.CHANGED][key] = obj
+        else:
+            section[DeltaKeys.ADDED][key] = obj
+
+        merge_delta_section(self._arbitrage_delta_dict[arbitrage_type], section)
+
+    def _apply_spread_changes(self, arbitrage_type, arbitrage_class, changes):
+        """
+            changes: (changed, removed) of SpreadMatrix, objects are created only for changed cells
+            returns True if any arbitrage is added, changed or removed
+        """
+        changed, removed = changes
+        arbitrage_dict = self._vectorized_arbitrage_dict[arbitrage_type]
+
+        for trade_symbol, (base_exchange, base_exchange_market), (target_exchange, target_exchange_market) in removed:
+            key = (arbitrage_type, trade_symbol, base_exchange, base_exchange_market, target_exchange,
+                   target_exchange_market)
+            if arbitrage_dict.pop(key, None) is not None:
+                self._record_arbitrage_delta(arbitrage_type, key, None, True)
+
+        for trade_symbol, (base_exchange, base_exchange_market), (target_exchange, target_exchange_market), \
+                base_price, target_price, percent in changed:
+            obj = arbitrage_class(trade_symbol, base_exchange, base_exchange_market, target_exchange,
+                                  target_exchange_market, base_price, target_price, percent)
+            key = obj.exclude_key
+            is_existing = key in arbitrage_dict
+            arbitrage_dict[key] = obj
+            self._record_arbitrage_delta(arbitrage_type, key, obj, is_existing)
+
+        return bool(changed or removed)
+
+    def _store_arbitrage(self, arbitrage_type, arbitrage_dict, pair, obj):
+        """
+            store latest arbitrage obj of the pair or remove it if obj is None, returns True if it's changed
+            recomputed obj with the same raw values as the stored one is not recorded, ex) repeated trade price
+        """
+        if obj is None:
+            if arbitrage_dict.pop(pair, None) is None:
+                return False
+            is_existing = True
+        else:
+            previous = arbitrage_dict.get(pair)
+            if previous is not None and previous.raw_values == obj.raw_values:
+                return False
+
+            is_existing = previous is not None
+            arbitrage_dict[pair] = obj
+
+        self._record_arbitrage_delta(arbitrage_type, get_exclude_key(arbitrage_type, *pair), obj, is_existing)
+        return True
+
+    def _refresh_arbitrage_by_orderbook_high_low(self, pairs):
+        """
+            recompute only given pairs, returns True if published list is changed
+        """
+        is_changed = False
+        for pair in pairs:
+            # exclude user's exclude list for arbitrage by orderbook high low
+            if pair in self._excluded_pairs_dict[ArbitrageTypes.ORDERBOOK_HIGH_LOW]:
+                obj = None
+            else:
+                obj = self._get_arbitrage_by_orderbook_high_low(*pair)
+
+            # raw percent like SpreadMatrix, rounding must not let 0.995 pass 1.0
+            if obj is not None and abs(obj._arbitrage_percent) < MIN_ARBITRAGE_PERCENT:
+                obj = None
+
+            if self._store_arbitrage(ArbitrageTypes.ORDERBOOK_HIGH_LOW, self._arbitrage_by_orderbook_high_low_dict,
+                                     pair, obj):
+                is_changed = True
+
+        return is_changed
+
+    def _refresh_arbitrage_by_trade_price(self, pairs):
+        """
+            recompute only given pairs, returns True if published list is changed
+        """
+        is_changed = False
+        for pair in pairs:
+            # exclude user's exclude list for arbitrage by trade price
+            if pair in self._excluded_pairs_dict[ArbitrageTypes.TRADE_PRICE]:
+                obj = None
+            else:
+                obj = self._get_arbitrage_by_trade_price(*pair)
+
+            if obj is not None and abs(obj._arbitrage_percent) < MIN_ARBITRAGE_PERCENT:
+                obj = None
+
+            if self._store_arbitrage(ArbitrageTypes.TRADE_PRICE, self._arbitrage_by_trade_price_dict, pair, obj):
+                is_changed = True
+
+        return is_changed
+
+    def _refresh_arbitrage_by_orderbook_depth(self, pairs):
+        """
+            recompute only given pairs, returns True if published list is changed
+        """
+        is_changed = False
+        for pair in pairs:
+            if pair in self._excluded_pairs_dict[ArbitrageTypes.ORDERBOOK_DEPTH]:
+                obj = None
+            else:
+                obj = self._get_arbitrage_by_orderbook_depth(*pair)
+
+            if self._store_arbitrage(ArbitrageTypes.ORDERBOOK_DEPTH, self._arbitrage_by_orderbook_depth_dict,
+                                     pair, obj):
+                is_changed = True
+
+        return is_changed
+
+    def _scan_orderbook_depth(self, updated_symbols_dict, is_full_rescan, is_exchange_rate_changed):
+        """
+            depth of orderbook updated symbols is fetched and only pairs touching them are walked again
+            returns True if depth arbitrage list is changed
+        """
+        if is_full_rescan:
+            dirty_symbols_dict = self.subscribe_symbols_dict
+            dirty_pairs = self.comparison_pairs
+        else:
+            dirty_symbols_dict = {
+                exchange: orderbook_symbols for exchange, (orderbook_symbols, _) in updated_symbols_dict.items()
+            }
+            dirty_pairs, _ = self._collect_dirty_pairs(updated_symbols_dict)
+            if is_exchange_rate_changed:
+                dirty_pairs.update(self.comparison_pair_index.exchange_rate_converted_pairs)
+
+        self._update_orderbook_depth(dirty_symbols_dict)
+        if not self._refresh_arbitrage_by_orderbook_depth(dirty_pairs):
+            return False
+
+        self._arbitrage_by_orderbook_depth_list = list(self._arbitrage_by_orderbook_depth_dict.values())
+        return True
+
+    def _scan_incremental(self, updated_symbols_dict, is_full_rescan, is_exchange_rate_changed):
+        """
+            returns True if arbitrage lists are changed
+        """
+        orderbook_dirty_pairs, trade_dirty_pairs = self._collect_dirty_pairs(updated_symbols_dict)
+
+        if is_full_rescan:
+            orderbook_dirty_pairs = trade_dirty_pairs = self.active_comparison_pairs
+
+        elif is_exchange_rate_changed:
+            # every price from USDT market is converted with exchange rate
+            orderbook_dirty_pairs.update(self.comparison_pair_index.exchange_rate_converted_pairs)
+            trade_dirty_pairs.update(self.comparison_pair_index.exchange_rate_converted_pairs)
+
+        if orderbook_dirty_pairs:
+            # update orderbook for all exchanges
+            self._update_orderbook_high_low()
+
+        if trade_dirty_pairs:
+            # update latest trade for all exchanges
+            self._update_latest_trade()
+
+        is_orderbook_high_low_changed = self._refresh_arbitrage_by_orderbook_high_low(orderbook_dirty_pairs)
+        is_trade_price_changed = self._refresh_arbitrage_by_trade_price(trade_dirty_pairs)
+
+        if not (is_orderbook_high_low_changed or is_trade_price_changed):
+            return False
+
+        self._arbitrage_by_orderbook_high_low_list = list(self._arbitrage_by_orderbook_high_low_dict.values())
+        self._arbitrage_by_trade_price_list = list(self._arbitrage_by_trade_price_dict.values())
+        return True
+
+    def _scan_vectorized(self, updated_symbols_dict, is_full_rescan, is_exchange_rate_changed):
+        """
+            feed updated prices into spread matrix and compute every pair at once
+            returns True if arbitrage lists are changed
+        """
+        is_updated = False
+        for exchange, exchange_api in self._exchange_api_list():
+            orderbook_symbols, trade_symbols = updated_symbols_dict[exchange]
+            if is_full_rescan:
+                orderbook_symbols = trade_symbols = self.subscribe_symbols_dict.get(exchange, set())
+
+            if orderbook_symbols:
+                result = exchange_api.get_orderbook_high_low_sync()
+                if result.success:
+                    self._spread_matrix.update_orderbook_high_low(exchange, orderbook_symbols, result.data)
+                    is_updated = True
+
+            if trade_symbols:
+                result = exchange_api.get_latest_trade()
+                if result.success:
+                    self._spread_matrix.update_trade(exchange, trade_symbols, result.data)
+                    is_updated = True
+
+        if not (is_updated or is_full_rescan or is_exchange_rate_changed):
+            return False
+
+        # not fetched yet or expired exchange rate makes every USDT cell nan
+        usdt_in_krw = self._usdt_in_krw or float('nan')
+        market_exchange_rate_dict = {Markets.USDT: usdt_in_krw}
+
+        is_orderbook_high_low_changed = self._apply_spread_changes(
+            ArbitrageTypes.ORDERBOOK_HIGH_LOW, ArbitrageByOrderBookHighLowPrice,
+            self._spread_matrix.compute_orderbook_high_low(
+                ArbitrageTypes.ORDERBOOK_HIGH_LOW, market_exchange_rate_dict, MIN_ARBITRAGE_PERCENT))
+        is_trade_price_changed = self._apply_spread_changes(
+            ArbitrageTypes.TRADE_PRICE, ArbitrageByLastTradePrice,
+            self._spread_matrix.compute_trade_price(
+                ArbitrageTypes.TRADE_PRICE, market_exchange_rate_dict, MIN_ARBITRAGE_PERCENT))
+
+        if not (is_orderbook_high_low_changed or is_trade_price_changed):
+            return False
+
+        self._arbitrage_by_orderbook_high_low_list = list(
+            self._vectorized_arbitrage_dict[ArbitrageTypes.ORDERBOOK_HIGH_LOW].values())
+        self._arbitrage_by_trade_price_list = list(
+            self._vectorized_arbitrage_dict[ArbitrageTypes.TRADE_PRICE].values())
+        return True
 
     def run(self):
         while True:
             try:
                 is_exclude_update_triggered = self.exclude_trigger_queue.get(timeout=0.1)
-                if is_exclude_update_triggered:
-                    self._update_exclude_list()
             except queue.Empty:
-                pass
+                is_exclude_update_triggered = False
 
-            self.update_market_exchange_rates()
+            # exclude set written without trigger, ex) by the other process, is found by its version
+            if is_exclude_update_triggered or self._is_exclude_changed():
+                self._update_exclude_list()
 
-            self._arbitrage_by_orderbook_high_low_list = list()
-            self._arbitrage_by_trade_price_list = list()
+            self.run_cycle()
 
-            # update orderbook for all exchanges
-            self._update_orderbook_high_low()
+    def run_cycle(self):
+        """
+            one crawl cycle, collect updates, scan and publish if anything is changed
+            returns True if a message is published
+        """
+        cycle_started_at = time.perf_counter()
+        updated_symbols_dict = self._collect_updated_symbols()
+        is_exchange_rate_changed = False
+        if self.exchange_rate_service is not None:
+            if self.exchange_rate_queue is not None:
+                self._receive_exchange_rates()
+            self._update_exchange_rates_from_trades(updated_symbols_dict)
 
-            for base_exchange_symbol_obj, target_exchange_symbol_obj in self.comparison_pairs:
-                trade_symbol = base_exchange_symbol_obj.trade
-
-                # get orderbook high bid price for base & orderbook low ask price for target
-                base_high_bid_price = self._get_orderbook_high_low(
-                    base_exchange_symbol_obj.exchange,
-                    base_exchange_symbol_obj.symbol,
-                    Consts.BID
-                )
-                target_low_ask_price = self._get_orderbook_high_low(
-                    target_exchange_symbol_obj.exchange,
-                    target_exchange_symbol_obj.symbol,
-                    Consts.ASK
-                )
-
-                if base_high_bid_price and target_low_ask_price:
-                    base_high_bid_price = self._convert_exchange_rate(base_exchange_symbol_obj.symbol,
-                                                                      base_high_bid_price)
-                    target_low_ask_price = self._convert_exchange_rate(target_exchange_symbol_obj.symbol,
-                                                                       target_low_ask_price)
-
-                    arbitrage_by_orderbook_high_low_percent = ((
-                                                                           base_high_bid_price - target_low_ask_price) / base_high_bid_price) * 100
-
-                    arbitrage_by_orderbook_high_low_obj = ArbitrageByOrderBookHighLowPrice(
-                        trade_symbol,
-                        base_exchange_symbol_obj.exchange,
-                        base_exchange_symbol_obj.market,
-                        target_exchange_symbol_obj.exchange,
-                        target_exchange_symbol_obj.market,
-                        base_high_bid_price,
-                        target_low_ask_price,
-                        arbitrage_by_orderbook_high_low_percent
-                    )
-
-                    # exclude user's exclude list for arbitrage by orderbook high low
-                    if arbitrage_by_orderbook_high_low_obj not in self._exclude_arbitrage_by_orderbook_high_low_obj_list:
-                        self._arbitrage_by_orderbook_high_low_list.append(arbitrage_by_orderbook_high_low_obj)
-                        # debugger.info(str(arbitrage_by_orderbook_high_low_obj))
-
-                # get trade price for base & trade price for target
-                base_trade_price = self._get_last_trade(
-                    base_exchange_symbol_obj.exchange,
-                    base_exchange_symbol_obj.symbol
-                )
-                target_trade_price = self._get_last_trade(
-                    target_exchange_symbol_obj.exchange,
-                    target_exchange_symbol_obj.symbol
-                )
-
-                if base_trade_price and target_trade_price:
-                    base_trade_price = self._convert_exchange_rate(base_exchange_symbol_obj.symbol, base_trade_price)
-                    target_trade_price = self._convert_exchange_rate(target_exchange_symbol_obj.symbol,
-                                                                     target_trade_price)
-
-                    arbitrage_by_trade_price_percent = ((
-                                                                    base_trade_price - target_trade_price) / base_trade_price) * 100
-                    arbitrage_by_trade_price_obj = ArbitrageByLastTradePrice(
-                        trade_symbol,
-                        base_exchange_symbol_obj.exchange,
-                        base_exchange_symbol_obj.market,
-                        target_exchange_symbol_obj.exchange,
-                        target_exchange_symbol_obj.market,
-                        base_trade_price,
-                        target_trade_price,
-                        arbitrage_by_trade_price_percent
-                    )
-
-                    # exclude user's exclude list for arbitrage by trade price
-                    if arbitrage_by_trade_price_obj not in self._exclude_arbitrage_by_trade_price_obj_list:
-                        self._arbitrage_by_trade_price_list.append(arbitrage_by_trade_price_obj)
-                        # debugger.info(str(arbitrage_by_trade_price_obj))
-
-            self._arbitrage_dict = {
-                ArbitrageTypes.ORDERBOOK_HIGH_LOW: self._arbitrage_by_orderbook_high_low_list,
-                ArbitrageTypes.TRADE_PRICE: self._arbitrage_by_trade_price_list,
-                Consts.EXCHANGE_RATES: self.exchange_rate_dict
+            self.update_market_exchange_rates()
+            is_exchange_rate_changed = self._update_usdt_in_krw()
+
+        if self._route_cost_table is not None and time.time() >= self._route_costs_refresh_at:
+            self._refresh_route_costs()
+
+        is_full_rescan = self._is_full_rescan_required
+        self._is_full_rescan_required = False
+
+        with self._stage_histogram_dict[MetricStages.SCAN].time():
+            if self.scan_mode == ScanModes.VECTORIZED:
+                is_changed = self._scan_vectorized(updated_symbols_dict, is_full_rescan, is_exchange_rate_changed)
+            else:
+                is_changed = self._scan_incremental(updated_symbols_dict, is_full_rescan, is_exchange_rate_changed)
+
+            if self.is_depth_arbitrage and self._scan_orderbook_depth(updated_symbols_dict, is_full_rescan,
+                                                                      is_exchange_rate_changed):
+                is_changed = True
+
+        is_published = is_changed or is_exchange_rate_changed or self._is_publish_required
+        self._is_publish_required = False
+        if is_published:
+            with self._stage_histogram_dict[MetricStages.PUBLISH].time():
+                self.arbitrage_queue.put(self._get_arbitrage_message())
+            self._published_counter.inc()
+
+            if self._first_published_at is None:
+                self._first_published_at = time.time()
+                time_to_first_publish = self._first_published_at - self._started_at
+                metrics.gauge('time_to_first_publish_seconds').set(time_to_first_publish)
+                debugger.info('first arbitrages are published {:.2f}s after startup'.format(time_to_first_publish))
+
+        if self._history_list:
+            self._history_writer.record(self._history_list)
+            self._history_list = list()
+
+        self._cycle_histogram.observe(time.perf_counter() - cycle_started_at)
+        return is_published
+
+    def _get_arbitrage_message(self):
+        if self._is_delta_publish:
+            message = {
+                DeltaKeys.IS_DELTA: True,
+                ArbitrageTypes.ORDERBOOK_HIGH_LOW: self._arbitrage_delta_dict[ArbitrageTypes.ORDERBOOK_HIGH_LOW],
+                ArbitrageTypes.TRADE_PRICE: self._arbitrage_delta_dict[ArbitrageTypes.TRADE_PRICE],
+                Consts.EXCHANGE_RATES: dict(self.exchange_rate_dict),
+                Consts.PUBLISHED_AT: time.time()
             }
+            if self.is_depth_arbitrage:
+                message[ArbitrageTypes.ORDERBOOK_DEPTH] = self._arbitrage_delta_dict[ArbitrageTypes.ORDERBOOK_DEPTH]
+            if self._ranking_dict is not None:
+                message[Consts.TOP_ARBITRAGES] = self.get_top_arbitrage_dict()
+            self._arbitrage_delta_dict = self._get_empty_arbitrage_delta_dict()
+            return message
+
+        self._arbitrage_dict = {
+            ArbitrageTypes.ORDERBOOK_HIGH_LOW: self._arbitrage_by_orderbook_high_low_list,
+            ArbitrageTypes.TRADE_PRICE: self._arbitrage_by_trade_price_list,
+            Consts.EXCHANGE_RATES: dict(self.exchange_rate_dict),
+            Consts.PUBLISHED_AT: time.time()
+        }
+        if self.is_depth_arbitrage:
+            self._arbitrage_dict[ArbitrageTypes.ORDERBOOK_DEPTH] = self._arbitrage_by_orderbook_depth_list
+        if self._ranking_dict is not None:
+            self._arbitrage_dict[Consts.TOP_ARBITRAGES] = self.get_top_arbitrage_dict()
+        return self._arbitrage_dict
+
+    def top(self, arbitrage_type, k):
+        """
+            k arbitrage objects of the arbitrage type with the highest ranking_key, call it in crawler thread,
+            the other threads read published Consts.TOP_ARBITRAGES, ex) ArbitrageMonitor.top()
+        """
+        if self._ranking_dict is None or arbitrage_type not in self._ranking_dict:
+            return list()
+        return self._ranking_dict[arbitrage_type].top(k)
 
-            self.arbitrage_queue.put(self._arbitrage_dict)
+    def get_top_arbitrage_dict(self):
+        return {arbitrage_type: self.top(arbitrage_type, self.ranking_size) for arbitrage_type in self._ranking_dict}
 
     def _update_orderbook_high_low(self):
-        self.binance_orderbook_high_low = self.base_binance.get_orderbook_high_low_sync()
-        self.bithumb_orderbook_high_low = self.base_bithumb.get_orderbook_high_low_sync()
-        self.upbit_orderbook_high_low = self.base_upbit.get_orderbook_high_low_sync()
-        self.huobi_orderbook_high_low = self.base_huobi.get_orderbook_high_low_sync()
-        self.mexc_orderbook_high_low = self.base_mexc.get_orderbook_high_low_sync()
-
-    def _get_orderbook_high_low(self, exchange, symbol, ask_or_bid):
-        if exchange == Exchanges.BINANCE.value:
-            result = self.binance_orderbook_high_low
-
-        elif exchange == Exchanges.BITHUMB.value:
-            result = self.bithumb_orderbook_high_low
-
-        elif exchange == Exchanges.UPBIT.value:
-            result = self.upbit_orderbook_high_low
-
-        elif exchange == Exchanges.HUOBI.value:
-            result = self.huobi_orderbook_high_low
+        with self._stage_histogram_dict[MetricStages.UPDATE_ORDERBOOK_HIGH_LOW].time():
+            for exchange, exchange_api in self.exchange_api_dict.items():
+                self._orderbook_high_low_dict[exchange] = exchange_api.get_orderbook_high_low_sync()
 
-        elif exchange == Exchanges.MEXC.value:
-            result = self.mexc_orderbook_high_low
+    def _update_latest_trade(self):
+        # snapshots are reused for every pair in this cycle
+        with self._stage_histogram_dict[MetricStages.UPDATE_LATEST_TRADE].time():
+            for exchange, exchange_api in self.exchange_api_dict.items():
+                self._latest_trade_dict[exchange] = exchange_api.get_latest_trade()
 
-        else:
+    def _get_orderbook_high_low(self, exchange, symbol, ask_or_bid):
+        result = self._orderbook_high_low_dict.get(exchange)
+        if result is None:
             debugger.info('exchange [{}] does not exist'.format(exchange))
             return None
 
@@ -514,22 +1612,8 @@ class MultiExchangeCrawler(threading.Thread):
         return None
 
     def _get_last_trade(self, exchange, symbol):
-        if exchange == Exchanges.BINANCE.value:
-            result = self.base_binance.get_latest_trade()
-
-        elif exchange == Exchanges.BITHUMB.value:
-            result = self.base_bithumb.get_latest_trade()
-
-        elif exchange == Exchanges.UPBIT.value:
-            result = self.base_upbit.get_latest_trade()
-
-        elif exchange == Exchanges.HUOBI.value:
-            result = self.base_huobi.get_latest_trade()
-
-        elif exchange == Exchanges.MEXC.value:
-            result = self.base_mexc.get_latest_trade()
-
-        else:
+        result = self._latest_trade_dict.get(exchange)
+        if result is None:
             debugger.info('exchange [{}] does not exist'.format(exchange))
             return None
 
@@ -556,13 +1640,63 @@ class ArbitrageMonitor(threading.Thread):
         self.arbitrage_monitor_model = ArbitrageMonitorModel()
         self.arbitrage_monitor_model.migrate()
 
+        # reader of the history written by the crawler
+        self.opportunity_history_model = None
+        if HISTORY:
+            self.opportunity_history_model = OpportunityHistoryModel()
+            self.opportunity_history_model.migrate()
+
+        # exclude key -> arbitrage obj, maintained from delta messages
+        self._arbitrage_state_dict = {
+            ArbitrageTypes.ORDERBOOK_HIGH_LOW: dict(),
+            ArbitrageTypes.TRADE_PRICE: dict(),
+            ArbitrageTypes.ORDERBOOK_DEPTH: dict()
+        }
+
+        # arbitrage type -> top arbitrage objects of the latest message, published when ranking_size is set
+        self._top_arbitrage_dict = dict()
+
+        self._display_histogram = metrics.histogram('stage_seconds', stage=MetricStages.DISPLAY)
+        self._publish_to_display_histogram = metrics.histogram('stage_seconds',
+                                                               stage=MetricStages.PUBLISH_TO_DISPLAY)
+
+    def _apply_message(self, message):
+        """
+            returns message with whole arbitrage lists, delta message is applied to the current state
+        """
+        if not message.get(DeltaKeys.IS_DELTA):
+            return message
+
+        data = {
+            Consts.EXCHANGE_RATES: message[Consts.EXCHANGE_RATES],
+            Consts.PUBLISHED_AT: message.get(Consts.PUBLISHED_AT),
+            Consts.TOP_ARBITRAGES: message.get(Consts.TOP_ARBITRAGES)
+        }
+        for arbitrage_type, state_dict in self._arbitrage_state_dict.items():
+            # depth section is published only when depth arbitrage is on
+            section = message.get(arbitrage_type)
+            if section is None:
+                continue
+
+            for key in section[DeltaKeys.REMOVED]:
+                state_dict.pop(key, None)
+            state_dict.update(section[DeltaKeys.ADDED])
+            state_dict.update(section[DeltaKeys.CHANGED])
+
+            data[arbitrage_type] = list(state_dict.values())
+        return data
+
     def run(self):
         while True:
             try:
-                data = self.arbitrage_queue.get(timeout=10)
+                message = self.arbitrage_queue.get(timeout=10)
             except queue.Empty:
                 continue
 
+            display_started_at = time.perf_counter()
+            data = self._apply_message(message)
+            self._top_arbitrage_dict = data.get(Consts.TOP_ARBITRAGES) or dict()
+
             arbitrage_by_orderbook_high_low_obj_list = data[ArbitrageTypes.ORDERBOOK_HIGH_LOW]
             for obj in arbitrage_by_orderbook_high_low_obj_list:
                 # display obj attributes, use comma formatted value
@@ -601,21 +1735,42 @@ class ArbitrageMonitor(threading.Thread):
                     message = obj
                     send_telegram(message)
 
+            arbitrage_by_orderbook_depth_list = data.get(ArbitrageTypes.ORDERBOOK_DEPTH, list())
+            for obj in arbitrage_by_orderbook_depth_list:
+                # display obj attributes
+                print(obj.trade_symbol)
+                print(obj.base_exchange)
+                print(obj.base_exchange_market)
+                print(obj.target_exchange)
+                print(obj.target_exchange_market)
+
+                # fillable quantity, vwap of filled levels and expected profit in KRW
+                print(obj.quantity)
+                print(obj.base_vwap_price_with_comma)
+                print(obj.target_vwap_price_with_comma)
+                print(obj.expected_profit_with_comma)
+                print(obj.arbitrage_percent_with_comma)
+
+                # telegram send logic, threshold is expected profit in KRW
+                if obj.expected_profit >= TELEGRAM_ORDERBOOK_DEPTH:
+                    message = obj
+                    send_telegram(message)
+
             # display KRW_BTC, KRW_ETH, KRW_USDT
             exchange_rates = data[Consts.EXCHANGE_RATES]
-            krw_btc = exchange_rates[ExchangeRateSymbols.KRW_BTC]
+            krw_btc = exchange_rates.get(ExchangeRateSymbols.KRW_BTC)
             if krw_btc:
                 krw_btc = format_comma(round(krw_btc, MAX_ZERO))
 
-            krw_eth = exchange_rates[ExchangeRateSymbols.KRW_ETH]
+            krw_eth = exchange_rates.get(ExchangeRateSymbols.KRW_ETH)
             if krw_eth:
                 krw_eth = format_comma(round(krw_eth, MAX_ZERO))
 
-            krw_usdt = exchange_rates[ExchangeRateSymbols.KRW_USDT]
+            krw_usdt = exchange_rates.get(ExchangeRateSymbols.KRW_USDT)
             if krw_usdt:
                 krw_usdt = format_comma(round(krw_usdt, MAX_ZERO))
 
-            krw_usd = exchange_rates[ExchangeRateSymbols.KRW_USD]
+            krw_usd = exchange_rates.get(ExchangeRateSymbols.KRW_USD)
             if krw_usd:
                 krw_usd = format_comma(round(krw_usd, MAX_ZERO))
 
@@ -623,6 +1778,30 @@ class ArbitrageMonitor(threading.Thread):
                 krw_btc, krw_eth, krw_usdt, krw_usd)
             )
 
+            self._display_histogram.observe(time.perf_counter() - display_started_at)
+            published_at = data.get(Consts.PUBLISHED_AT)
+            if published_at:
+                self._publish_to_display_histogram.observe(time.time() - published_at)
+
+    def top(self, arbitrage_type, k=None):
+        """
+            usage: top('orderbook_high_low', 10), ex) rows of UI table
+            returns up to k (at most ranking_size) arbitrage objects with the highest ranking_key, highest first
+        """
+        top_list = self._top_arbitrage_dict.get(arbitrage_type, list())
+        return top_list if k is None else top_list[:k]
+
+    def get_max_spread(self, arbitrage_type, trade_symbol, base_exchange, target_exchange, seconds=3600):
+        """
+            usage: get_max_spread('orderbook_high_low', 'BTC', 'upbit', 'binance', seconds=3600)
+            returns None if history is off or nothing is recorded
+        """
+        if self.opportunity_history_model is None:
+            return None
+
+        return self.opportunity_history_model.get_max_spread(
+            arbitrage_type, trade_symbol, base_exchange, target_exchange, seconds)
+
     def trigger_exclude_queue(self):
         trigger_flag = True
         self.exclude_trigger_queue.put(trigger_flag)
@@ -659,7 +1838,9 @@ class ArbitrageMonitor(threading.Thread):
 
 
 if __name__ == '__main__':
-    arbitrage_q = multiprocessing.Queue()
+    start_metrics_exporters(METRICS_PORT, METRICS_LOG_INTERVAL)
+
+    arbitrage_q = ArbitrageChannel(delta_mode=PUBLISH_DELTA)
     exclude_q = multiprocessing.Queue()
 
     multi_exchange = MultiExchangeCrawler(arbitrage_q, exclude_q)
@@ -0,0 +1,49 @@
+def walk_orderbook_depth(bids, asks, min_percent, bid_rate=1.0, ask_rate=1.0):
+    """
+        walk bids of the selling exchange and asks of the buying exchange from the best levels with cumulative sums,
+        and fill while the spread of the next levels is at least min_percent.
+        books are bounded (Consts.ORDERBOOK_LIMITATION), so it's O(levels of both sides).
+
+        bids: [(price, amount), ...] best first, ex) base exchange
+        asks: [(price, amount), ...] best first, ex) target exchange
+        min_percent: (bid - ask) / bid * 100 of the levels being filled
+        bid_rate, ask_rate: multiplied to prices, ex) KRW per USDT for USDT market
+
+        returns (fillable quantity, bid vwap, ask vwap, profit) in converted prices, None if nothing is fillable
+    """
+    quantity = 0.0
+    bid_notional = 0.0
+    ask_notional = 0.0
+
+    bid_index = ask_index = 0
+    bid_remaining = ask_remaining = 0.0
+    bid_price = ask_price = None
+    while True:
+        if not bid_remaining:
+            if bid_index >= len(bids):
+                break
+            bid_price, bid_remaining = bids[bid_index]
+            bid_price *= bid_rate
+            bid_index += 1
+
+        if not ask_remaining:
+            if ask_index >= len(asks):
+                break
+            ask_price, ask_remaining = asks[ask_index]
+            ask_price *= ask_rate
+            ask_index += 1
+
+        if not (bid_price > 0 and ask_price > 0) or (bid_price - ask_price) / bid_price * 100 < min_percent:
+            break
+
+        filled = min(bid_remaining, ask_remaining)
+        quantity += filled
+        bid_notional += bid_price * filled
+        ask_notional += ask_price * filled
+        bid_remaining -= filled
+        ask_remaining -= filled
+
+    if quantity <= 0:
+        return None
+
+    return quantity, bid_notional / quantity, ask_notional / quantity, bid_notional - ask_notional
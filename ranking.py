@@ -0,0 +1,127 @@
+import heapq
+
+
+class RankKeys(object):
+    # highest arbitrage_percent first, it's net spread when route_costs is on
+    PERCENT = 'percent'
+    # highest abs(arbitrage_percent) first, reverse direction spreads are ranked together
+    ABSOLUTE = 'absolute'
+
+
+class OpportunityRanking(object):
+    """
+        indexed max heap of arbitrage objects of one arbitrage type, keyed by exclude key.
+        position of every key is kept, so a pair is moved or removed in O(log n) only when its score is changed,
+        and top(k) reads the k highest in O(k log k) without sorting the others.
+    """
+    def __init__(self, rank_key=RankKeys.PERCENT):
+        self.rank_key = rank_key
+
+        # heap of [score, key, obj], parent score is higher or equal
+        self._heap = list()
+        # key -> index in heap
+        self._index_dict = dict()
+
+    def __len__(self):
+        return len(self._heap)
+
+    def __contains__(self, key):
+        return key in self._index_dict
+
+    def _get_score(self, obj):
+        if self.rank_key == RankKeys.ABSOLUTE:
+            return abs(obj.arbitrage_percent)
+        return obj.arbitrage_percent
+
+    def _swap(self, i, j):
+        heap = self._heap
+        heap[i], heap[j] = heap[j], heap[i]
+        self._index_dict[heap[i][1]] = i
+        self._index_dict[heap[j][1]] = j
+
+    def _sift_up(self, index):
+        heap = self._heap
+        while index > 0:
+            parent = (index - 1) // 2
+            if heap[parent][0] >= heap[index][0]:
+                break
+            self._swap(index, parent)
+            index = parent
+
+    def _sift_down(self, index):
+        heap = self._heap
+        size = len(heap)
+        while True:
+            largest = index
+            for child in (2 * index + 1, 2 * index + 2):
+                if child < size and heap[child][0] > heap[largest][0]:
+                    largest = child
+
+            if largest == index:
+                break
+            self._swap(index, largest)
+            index = largest
+
+    def update(self, key, obj):
+        """
+            add or replace arbitrage obj of the key, obj None removes it
+        """
+        if obj is None:
+            self.remove(key)
+            return
+
+        score = self._get_score(obj)
+        index = self._index_dict.get(key)
+        if index is None:
+            self._heap.append([score, key, obj])
+            self._index_dict[key] = len(self._heap) - 1
+            self._sift_up(len(self._heap) - 1)
+            return
+
+        entry = self._heap[index]
+        previous_score = entry[0]
+        entry[0] = score
+        entry[2] = obj
+        if score > previous_score:
+            self._sift_up(index)
+        elif score < previous_score:
+            self._sift_down(index)
+
+    def remove(self, key):
+        index = self._index_dict.pop(key, None)
+        if index is None:
+            return
+
+        last = self._heap.pop()
+        if index == len(self._heap):
+            return
+
+        # last entry fills the hole and moves whichever way its score needs
+        self._heap[index] = last
+        self._index_dict[last[1]] = index
+        self._sift_up(index)
+        self._sift_down(self._index_dict[last[1]])
+
+    def clear(self):
+        self._heap = list()
+        self._index_dict = dict()
+
+    def top(self, k):
+        """
+            returns k arbitrage objects with the highest score, highest first
+        """
+        heap = self._heap
+        top_list = list()
+        if not heap or k <= 0:
+            return top_list
+
+        # children of taken entries are the only candidates for the next one
+        candidates = [(-heap[0][0], 0)]
+        while candidates and len(top_list) < k:
+            _, index = heapq.heappop(candidates)
+            top_list.append(heap[index][2])
+            for child in (2 * index + 1, 2 * index + 2):
+                if child < len(heap):
+                    heapq.heappush(candidates, (-heap[child][0], child))
+
+        return top_list
@@ -0,0 +1,104 @@
+from BaseApi.objects import ExchangeInfo
+from util import debugger
+
+
+class FeeKeys(object):
+    SECTION = 'fees'
+    WITHDRAWAL_PREFIX = 'withdrawal_'
+
+
+def get_exchange_info_dict(config, exchanges):
+    """
+        build ExchangeInfo of exchanges from [fees] section of config.ini
+        trading_fee: taker fee percent, ex) binance = 0.1
+        transaction_fee: trade symbol -> withdrawal fee in coins, ex) withdrawal_upbit_btc = 0.0005
+    """
+    exchange_info_dict = dict()
+    for exchange in exchanges:
+        exchange_info = ExchangeInfo(exchange, debugger)
+        exchange_info.trading_fee = config.getfloat(FeeKeys.SECTION, exchange, fallback=0)
+        exchange_info.transaction_fee = dict()
+        exchange_info_dict[exchange] = exchange_info
+
+    if not config.has_section(FeeKeys.SECTION):
+        return exchange_info_dict
+
+    for key, value in config.items(FeeKeys.SECTION):
+        if not key.startswith(FeeKeys.WITHDRAWAL_PREFIX):
+            continue
+
+        exchange, _, trade = key[len(FeeKeys.WITHDRAWAL_PREFIX):].partition('_')
+        if exchange in exchange_info_dict and trade:
+            exchange_info_dict[exchange].transaction_fee[trade.upper()] = float(value)
+
+    return exchange_info_dict
+
+
+class RouteCostTable(object):
+    """
+        precomputed cost of each route (base exchange, target exchange, trade symbol) as net = gross * mul + add
+        coin is bought on target exchange, withdrawn to base exchange and sold there.
+
+        gross: (base price - target price) / base price * 100
+        mul: 1 + target taker fee
+        add: -(base taker fee + target taker fee) * 100 - withdrawal fee of target exchange
+             withdrawal fee is amortized over reference_krw of coin, priced when the table is refreshed
+    """
+    def __init__(self, exchange_info_dict, reference_krw):
+        """
+            exchange_info_dict: exchange -> ExchangeInfo from get_exchange_info_dict()
+            reference_krw: KRW amount of one transfer the withdrawal fee is amortized over
+        """
+        self.exchange_info_dict = exchange_info_dict
+        self.reference_krw = reference_krw
+
+        # (base exchange, target exchange, trade symbol) -> (mul, add)
+        self.cost_dict = dict()
+
+    def get_route_cost(self, base_exchange, target_exchange, trade_symbol, price_krw=None):
+        """
+            price_krw: KRW price of trade symbol, withdrawal fee is left out if it's None
+            returns (mul, add), (1, 0) is no cost
+        """
+        base_info = self.exchange_info_dict.get(base_exchange)
+        target_info = self.exchange_info_dict.get(target_exchange)
+        if base_info is None or target_info is None:
+            return 1.0, 0.0
+
+        base_fee = base_info.trading_fee / 100
+        target_fee = target_info.trading_fee / 100
+
+        add = -(base_fee + target_fee) * 100
+        withdrawal_fee = target_info.transaction_fee.get(trade_symbol)
+        if withdrawal_fee and price_krw and self.reference_krw:
+            add -= withdrawal_fee * price_krw / self.reference_krw * 100
+
+        return 1 + target_fee, add
+
+    def refresh(self, routes, price_getter):
+        """
+            routes: [(base exchange, target exchange, trade symbol), ...]
+            price_getter: trade symbol -> KRW price or None
+            returns number of routes whose withdrawal fee is not priced yet
+        """
+        cost_dict = dict()
+        price_dict = dict()
+        unpriced_count = 0
+        for route in routes:
+            base_exchange, target_exchange, trade_symbol = route
+
+            # coin price is needed only for withdrawal fee
+            price_krw = None
+            target_info = self.exchange_info_dict.get(target_exchange)
+            if target_info is not None and target_info.transaction_fee.get(trade_symbol):
+                if trade_symbol not in price_dict:
+                    price_dict[trade_symbol] = price_getter(trade_symbol)
+
+                price_krw = price_dict[trade_symbol]
+                if price_krw is None:
+                    unpriced_count += 1
+
+            cost_dict[route] = self.get_route_cost(base_exchange, target_exchange, trade_symbol, price_krw)
+
+        self.cost_dict = cost_dict
+        return unpriced_count
@@ -0,0 +1,274 @@
+import time
+import threading
+import multiprocessing
+import queue
+import configparser
+
+from util import get_shard_index, debugger
+from arbitrage_channel import ArbitrageChannel, DeltaKeys
+from metrics import metrics, start_metrics_exporters
+from models import ArbitrageMonitorModel
+from ranking import OpportunityRanking
+from multi_exchange_crawler import (MultiExchangeCrawler, ArbitrageMonitor, ArbitrageTypes, Consts,
+                                    create_exchange_rate_service, get_enabled_exchanges, PUBLISH_DELTA, METRICS_PORT,
+                                    METRICS_LOG_INTERVAL, DEPTH_ARBITRAGE, RANKING_SIZE, RANKING_KEY)
+
+
+config = configparser.ConfigParser()
+config.read('config.ini')
+
+SHARD_COUNT = config.getint('crawler', 'shard_count', fallback=0)
+
+
+class ExcludeKeyIndexes(object):
+    # index of trade symbol in exclude key, see get_exclude_key()
+    TRADE_SYMBOL = 1
+
+
+def run_shard_worker(shard_index, shard_count, shard_channel, exclude_trigger_queue, exchange_rate_queue,
+                     scan_mode):
+    """
+        process target, runs MultiExchangeCrawler of one shard in this process until it's terminated.
+        exchange rates are fed by ShardedCrawler and ranking is done over every shard there, so both are off here.
+        history db is downsampled only by the first shard
+    """
+    debugger.info('shard worker [{}/{}] start'.format(shard_index, shard_count))
+    crawler = MultiExchangeCrawler(shard_channel, exclude_trigger_queue, scan_mode=scan_mode,
+                                   shard=(shard_index, shard_count), exchange_rate_queue=exchange_rate_queue,
+                                   ranking_size=0, history_maintenance=shard_index == 0)
+    crawler.run()
+
+
+class ShardedCrawler(threading.Thread):
+    """
+        drop-in replacement of MultiExchangeCrawler for ArbitrageMonitor, it has the same arguments and queues.
+        trade symbols are partitioned over shard_count worker processes by get_shard_index(),
+        each worker subscribes and scans its own symbols with MultiExchangeCrawler and publishes deltas
+        into one shared channel. this thread merges them into arbitrage_queue and broadcasts exclude triggers.
+
+        arbitrages of a pair never move between shards, so deltas of workers never touch the same exclude key.
+        exchange rates are fetched only by this process and fed to every worker.
+        metrics of workers stay in worker processes.
+
+        workers are spawned, not forked, a forked child could inherit a lock held by a thread of this process
+        (logging, metrics exporters, ArbitrageMonitor) and deadlock.
+    """
+    WORKER_CHECK_INTERVAL = 5
+    # seconds, changed source rates are fed to workers on this schedule
+    EXCHANGE_RATE_FEED_INTERVAL = 1
+
+    def __init__(self, arbitrage_queue, exclude_trigger_queue, shard_count=None, scan_mode=None):
+        """
+            shard_count: number of worker processes, default is shard_count of config.ini or cpu count
+        """
+        super(ShardedCrawler, self).__init__()
+        self.arbitrage_queue = arbitrage_queue
+        self.exclude_trigger_queue = exclude_trigger_queue
+        self.shard_count = shard_count or SHARD_COUNT or multiprocessing.cpu_count()
+        self.scan_mode = scan_mode
+
+        self._context = multiprocessing.get_context('spawn')
+
+        # latest-wins, unread deltas of workers are merged while this thread is busy
+        self._shard_channel = ArbitrageChannel(multi_process=True, delta_mode=True, context=self._context)
+        self._worker_exclude_queue_list = [self._context.Queue() for _ in range(self.shard_count)]
+        self._worker_exchange_rate_queue_list = [self._context.Queue() for _ in range(self.shard_count)]
+        self._worker_list = [None] * self.shard_count
+
+        # REST pollers of exchange rates run once here instead of in every worker, None for KRW markets only
+        self.exchange_rate_service = create_exchange_rate_service(get_enabled_exchanges())
+        self._fed_rate_dict = dict()
+        self._is_delta_publish = getattr(arbitrage_queue, 'delta_mode', False)
+
+        # exclude key -> arbitrage obj over every shard
+        self._arbitrage_state_dict = {
+            ArbitrageTypes.ORDERBOOK_HIGH_LOW: dict(),
+            ArbitrageTypes.TRADE_PRICE: dict(),
+            ArbitrageTypes.ORDERBOOK_DEPTH: dict()
+        }
+        self._exchange_rate_dict = dict()
+
+        # top arbitrages of workers are per shard, they're ranked again over every shard
+        self._ranking_dict = None
+        if RANKING_SIZE:
+            self._ranking_dict = {
+                arbitrage_type: OpportunityRanking(RANKING_KEY) for arbitrage_type in self._arbitrage_state_dict
+            }
+
+        self._published_counter = metrics.counter('published_messages_total')
+        self._restart_counter = metrics.counter('shard_worker_restarts_total')
+        metrics.gauge('arbitrage_queue_depth').set_function(self.arbitrage_queue.qsize)
+
+    def _start_worker(self, shard_index):
+        # restarted worker gets every known rate again
+        if self.exchange_rate_service is not None:
+            self._worker_exchange_rate_queue_list[shard_index].put(self.exchange_rate_service.get_source_rates())
+
+        worker = self._context.Process(
+            target=run_shard_worker,
+            args=(shard_index, self.shard_count, self._shard_channel, self._worker_exclude_queue_list[shard_index],
+                  self._worker_exchange_rate_queue_list[shard_index], self.scan_mode),
+            name='shard-{}'.format(shard_index),
+            daemon=True
+        )
+        worker.start()
+        self._worker_list[shard_index] = worker
+
+    def start_workers(self):
+        # table is created once here, concurrent migrations of workers on a new db fail with 'database is locked'
+        ArbitrageMonitorModel().migrate()
+
+        for shard_index in range(self.shard_count):
+            self._start_worker(shard_index)
+        debugger.info('{} shard workers are started'.format(self.shard_count))
+
+    def stop_workers(self):
+        for worker in self._worker_list:
+            if worker is not None and worker.is_alive():
+                worker.terminate()
+                worker.join()
+
+    def _restart_dead_workers(self):
+        """
+            restarted worker publishes its arbitrages from scratch, arbitrages of its previous run are removed
+        """
+        for shard_index, worker in enumerate(self._worker_list):
+            if worker.is_alive():
+                continue
+
+            debugger.warning('shard worker [{}] exited with [{}], restart'.format(shard_index, worker.exitcode))
+            self._publish(self._get_shard_removal_message(shard_index))
+            self._start_worker(shard_index)
+            self._restart_counter.inc()
+
+    def _get_shard_removal_message(self, shard_index):
+        message = {
+            DeltaKeys.IS_DELTA: True,
+            Consts.EXCHANGE_RATES: dict(self._exchange_rate_dict),
+            Consts.PUBLISHED_AT: time.time()
+        }
+        for arbitrage_type, state_dict in self._arbitrage_state_dict.items():
+            message[arbitrage_type] = {
+                DeltaKeys.ADDED: dict(),
+                DeltaKeys.CHANGED: dict(),
+                DeltaKeys.REMOVED: {
+                    key for key in state_dict
+                    if get_shard_index(key[ExcludeKeyIndexes.TRADE_SYMBOL], self.shard_count) == shard_index
+                }
+            }
+        return message
+
+    def _feed_exchange_rates(self):
+        if self.exchange_rate_service is None:
+            return
+
+        rate_dict = self.exchange_rate_service.get_source_rates()
+        changed_rate_dict = {
+            symbol: rate for symbol, rate in rate_dict.items() if self._fed_rate_dict.get(symbol) != rate
+        }
+        if not changed_rate_dict:
+            return
+
+        self._fed_rate_dict = rate_dict
+        for exchange_rate_queue in self._worker_exchange_rate_queue_list:
+            exchange_rate_queue.put(changed_rate_dict)
+
+    def _broadcast_exclude_trigger(self):
+        try:
+            is_exclude_update_triggered = self.exclude_trigger_queue.get_nowait()
+        except queue.Empty:
+            return
+
+        if is_exclude_update_triggered:
+            for exclude_queue in self._worker_exclude_queue_list:
+                exclude_queue.put(True)
+
+    def _apply_message(self, message):
+        for arbitrage_type, state_dict in self._arbitrage_state_dict.items():
+            section = message.get(arbitrage_type)
+            if section is None:
+                continue
+
+            for key in section[DeltaKeys.REMOVED]:
+                state_dict.pop(key, None)
+            state_dict.update(section[DeltaKeys.ADDED])
+            state_dict.update(section[DeltaKeys.CHANGED])
+
+            if self._ranking_dict is not None:
+                ranking = self._ranking_dict[arbitrage_type]
+                for key in section[DeltaKeys.REMOVED]:
+                    ranking.remove(key)
+                for key, obj in section[DeltaKeys.ADDED].items():
+                    ranking.update(key, obj)
+                for key, obj in section[DeltaKeys.CHANGED].items():
+                    ranking.update(key, obj)
+
+        self._exchange_rate_dict.update(message[Consts.EXCHANGE_RATES])
+
+    def _publish(self, message):
+        """
+            message: delta message of workers
+        """
+        self._apply_message(message)
+        if self._is_delta_publish:
+            message[Consts.EXCHANGE_RATES] = dict(self._exchange_rate_dict)
+        else:
+            message = {
+                ArbitrageTypes.ORDERBOOK_HIGH_LOW: list(
+                    self._arbitrage_state_dict[ArbitrageTypes.ORDERBOOK_HIGH_LOW].values()),
+                ArbitrageTypes.TRADE_PRICE: list(self._arbitrage_state_dict[ArbitrageTypes.TRADE_PRICE].values()),
+                Consts.EXCHANGE_RATES: dict(self._exchange_rate_dict),
+                Consts.PUBLISHED_AT: message.get(Consts.PUBLISHED_AT)
+            }
+            if DEPTH_ARBITRAGE:
+                message[ArbitrageTypes.ORDERBOOK_DEPTH] = list(
+                    self._arbitrage_state_dict[ArbitrageTypes.ORDERBOOK_DEPTH].values())
+
+        if self._ranking_dict is not None:
+            message[Consts.TOP_ARBITRAGES] = {
+                arbitrage_type: ranking.top(RANKING_SIZE) for arbitrage_type, ranking in self._ranking_dict.items()
+                if arbitrage_type != ArbitrageTypes.ORDERBOOK_DEPTH or DEPTH_ARBITRAGE
+            }
+
+        self.arbitrage_queue.put(message)
+        self._published_counter.inc()
+
+    def run(self):
+        if self.exchange_rate_service is not None:
+            self.exchange_rate_service.start()
+        self.start_workers()
+
+        checked_at = fed_at = time.time()
+        while True:
+            self._broadcast_exclude_trigger()
+
+            if time.time() - fed_at >= self.EXCHANGE_RATE_FEED_INTERVAL:
+                self._feed_exchange_rates()
+                fed_at = time.time()
+
+            if time.time() - checked_at >= self.WORKER_CHECK_INTERVAL:
+                self._restart_dead_workers()
+                checked_at = time.time()
+
+            try:
+                message = self._shard_channel.get(timeout=0.1)
+            except queue.Empty:
+                continue
+
+            self._publish(message)
+
+
+if __name__ == '__main__':
+    start_metrics_exporters(METRICS_PORT, METRICS_LOG_INTERVAL)
+
+    arbitrage_q = ArbitrageChannel(delta_mode=PUBLISH_DELTA)
+    exclude_q = multiprocessing.get_context('spawn').Queue()
+
+    sharded_crawler = ShardedCrawler(arbitrage_q, exclude_q)
+    sharded_crawler.start()
+
+    arbitrage_monitor = ArbitrageMonitor(arbitrage_q, exclude_q)
+    arbitrage_monitor.start()
+
+    sharded_crawler.join()
+    arbitrage_monitor.join()
@@ -0,0 +1,214 @@
+import sys
+
+import numpy as np
+
+
+class SpreadMatrix(object):
+    """
+        best bid, best ask and last trade price kept as (trade symbol, venue) arrays
+        venue is (exchange, market) ex) ('binance', 'USDT'), ('upbit', 'KRW')
+
+        every spread of every trade symbol is computed at once as (trade symbol, base venue, target venue) matrix
+        percent[s, i, j] = (base price[s, i] - target price[s, j]) / base price[s, i] * 100
+
+        computed arrays are compared with the previous computation of the arbitrage type,
+        so only cells whose prices, percent or pass/fail state changed are turned into python objects
+    """
+    def __init__(self, exchange_symbols_dict):
+        """
+            exchange_symbols_dict: exchange -> sai symbols, ex) {'binance': ['USDT_BTC', ...], 'upbit': ['KRW_BTC', ...]}
+        """
+        self.trade_symbols = list()
+        self.venues = list()
+
+        # (exchange, symbol) -> (row, column)
+        self._cell_dict = dict()
+        self._trade_row_dict = trade_row_dict = dict()
+        self._venue_column_dict = venue_column_dict = dict()
+
+        for exchange in exchange_symbols_dict:
+            for symbol in sorted(exchange_symbols_dict[exchange]):
+                market, trade = map(sys.intern, symbol.split('_'))
+
+                if trade not in trade_row_dict:
+                    trade_row_dict[trade] = len(self.trade_symbols)
+                    self.trade_symbols.append(trade)
+
+                if (exchange, market) not in venue_column_dict:
+                    venue_column_dict[(exchange, market)] = len(self.venues)
+                    self.venues.append((exchange, market))
+
+                self._cell_dict[(exchange, symbol)] = (trade_row_dict[trade], venue_column_dict[(exchange, market)])
+
+        shape = (len(self.trade_symbols), len(self.venues))
+        self.bid = np.full(shape, np.nan)
+        self.ask = np.full(shape, np.nan)
+        self.trade = np.full(shape, np.nan)
+
+        self.venue_markets = [market for _, market in self.venues]
+
+        # pairs on the same exchange are not compared
+        venue_exchanges = np.array([exchange for exchange, _ in self.venues], dtype=object)
+        self._pair_mask = venue_exchanges[:, None] != venue_exchanges[None, :]
+
+        self._exclude_mask_dict = dict()
+
+        # net percent = percent * multiplier + addend, None is no cost
+        self._cost_multiplier = None
+        self._cost_addend = None
+
+        # arbitrage type -> (base prices, target prices, percent, mask) of the previous computation
+        self._previous_dict = dict()
+
+    def _get_cells(self, exchange, symbols):
+        rows, columns, keys = list(), list(), list()
+        for symbol in symbols:
+            cell = self._cell_dict.get((exchange, symbol))
+            if cell is not None:
+                rows.append(cell[0])
+                columns.append(cell[1])
+                keys.append(symbol)
+        return rows, columns, keys
+
+    def update_orderbook_high_low(self, exchange, symbols, orderbook_high_low_dict):
+        """
+            orderbook_high_low_dict: sai symbol -> dict(bid=, ask=), same as get_orderbook_high_low_sync() data
+        """
+        rows, columns, keys = self._get_cells(exchange, symbols)
+        if not keys:
+            return
+
+        bids, asks = list(), list()
+        for key in keys:
+            high_low = orderbook_high_low_dict.get(key) or dict()
+            bids.append(high_low.get('bid') or np.nan)
+            asks.append(high_low.get('ask') or np.nan)
+
+        self.bid[rows, columns] = bids
+        self.ask[rows, columns] = asks
+
+    def update_trade(self, exchange, symbols, trade_dict):
+        """
+            trade_dict: sai symbol -> dict(price=, amount=), same as get_latest_trade() data
+        """
+        rows, columns, keys = self._get_cells(exchange, symbols)
+        if not keys:
+            return
+
+        prices = list()
+        for key in keys:
+            trade = trade_dict.get(key) or dict()
+            prices.append(trade.get('price') or np.nan)
+
+        self.trade[rows, columns] = prices
+
+    def reset_excludes(self):
+        self._exclude_mask_dict = dict()
+
+    def set_exclude(self, arbitrage_type, trade_symbol, base_exchange, base_exchange_market,
+                    target_exchange, target_exchange_market):
+        row = self._trade_row_dict.get(trade_symbol)
+        base_column = self._venue_column_dict.get((base_exchange, base_exchange_market))
+        target_column = self._venue_column_dict.get((target_exchange, target_exchange_market))
+
+        if row is None or base_column is None or target_column is None:
+            # not subscribed, nothing to exclude
+            return
+
+        if arbitrage_type not in self._exclude_mask_dict:
+            self._exclude_mask_dict[arbitrage_type] = np.zeros(
+                (len(self.trade_symbols), len(self.venues), len(self.venues)), dtype=bool)
+
+        self._exclude_mask_dict[arbitrage_type][row, base_column, target_column] = True
+
+    def set_route_costs(self, cost_list):
+        """
+            cost_list: [(trade symbol, base venue, target venue, mul, add), ...], see RouteCostTable
+        """
+        shape = (len(self.trade_symbols), len(self.venues), len(self.venues))
+        multiplier = np.ones(shape)
+        addend = np.zeros(shape)
+        for trade_symbol, base_venue, target_venue, mul, add in cost_list:
+            row = self._trade_row_dict.get(trade_symbol)
+            base_column = self._venue_column_dict.get(base_venue)
+            target_column = self._venue_column_dict.get(target_venue)
+            if row is None or base_column is None or target_column is None:
+                continue
+
+            multiplier[row, base_column, target_column] = mul
+            addend[row, base_column, target_column] = add
+
+        self._cost_multiplier = multiplier
+        self._cost_addend = addend
+
+    def _compute(self, arbitrage_type, base_prices, target_prices, exchange_rate_dict, min_percent):
+        """
+            exchange_rate_dict: market -> KRW price of the market, markets not in it are used as it is
+            returns (changed, removed) since the previous computation of the arbitrage type
+            changed: [(trade symbol, base venue, target venue, base price, target price, percent), ...]
+                     passing cells which are new or whose prices or percent changed
+            removed: [(trade symbol, base venue, target venue), ...] cells which don't pass anymore
+        """
+        rates = np.array([exchange_rate_dict.get(market, 1.0) for market in self.venue_markets])
+
+        base_prices = base_prices * rates
+        target_prices = target_prices * rates
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            base = base_prices[:, :, None]
+            target = target_prices[:, None, :]
+            percent = (base - target) / base * 100
+            if self._cost_multiplier is not None:
+                percent = percent * self._cost_multiplier + self._cost_addend
+
+            mask = self._pair_mask & np.isfinite(percent) & (np.abs(percent) >= min_percent)
+
+        exclude_mask = self._exclude_mask_dict.get(arbitrage_type)
+        if exclude_mask is not None:
+            mask &= ~exclude_mask
+
+        previous = self._previous_dict.get(arbitrage_type)
+        self._previous_dict[arbitrage_type] = (base_prices, target_prices, percent, mask)
+        if previous is None:
+            changed_mask = mask
+            removed_mask = None
+        else:
+            previous_base_prices, previous_target_prices, previous_percent, previous_mask = previous
+            # nan never equals, but failing cells are masked out anyway
+            is_same = (
+                previous_mask
+                & (percent == previous_percent)
+                & (base_prices == previous_base_prices)[:, :, None]
+                & (target_prices == previous_target_prices)[:, None, :]
+            )
+            changed_mask = mask & ~is_same
+            removed_mask = previous_mask & ~mask
+
+        rows, base_columns, target_columns = np.nonzero(changed_mask)
+        changed = list(zip(
+            [self.trade_symbols[row] for row in rows.tolist()],
+            [self.venues[column] for column in base_columns.tolist()],
+            [self.venues[column] for column in target_columns.tolist()],
+            base_prices[rows, base_columns].tolist(),
+            target_prices[rows, target_columns].tolist(),
+            percent[rows, base_columns, target_columns].tolist()
+        ))
+
+        removed = list()
+        if removed_mask is not None:
+            rows, base_columns, target_columns = np.nonzero(removed_mask)
+            removed = list(zip(
+                [self.trade_symbols[row] for row in rows.tolist()],
+                [self.venues[column] for column in base_columns.tolist()],
+                [self.venues[column] for column in target_columns.tolist()]
+            ))
+
+        return changed, removed
+
+    def compute_orderbook_high_low(self, arbitrage_type, exchange_rate_dict, min_percent=0):
+        # base's high bid vs target's low ask, returns (changed, removed), see _compute()
+        return self._compute(arbitrage_type, self.bid, self.ask, exchange_rate_dict, min_percent)
+
+    def compute_trade_price(self, arbitrage_type, exchange_rate_dict, min_percent=0):
+        # base's last trade vs target's last trade, returns (changed, removed), see _compute()
+        return self._compute(arbitrage_type, self.trade, self.trade, exchange_rate_dict, min_percent)
@@ -1,11 +1,12 @@
 import itertools
 import json
 import logging
+import zlib
 
 from investpy import currency_crosses
 
 
-debugger = logging.logger()
+debugger = logging.getLogger(__name__)
 
 
 
@@ -26,6 +27,27 @@ def filter_market(market_list, symbol_list):
     return filtered
 
 
+def get_shard_index(trade_symbol, shard_count):
+    """
+        stable over processes and runs, unlike hash() of str
+        ex) get_shard_index('BTC', 4) -> 0 ~ 3
+    """
+    return zlib.crc32(trade_symbol.encode()) % shard_count
+
+
+def filter_shard(shard_index, shard_count, symbol_list):
+    """
+        keep symbols whose trade symbol belongs to the shard, the same trade symbol goes to the same shard
+        on every exchange and market
+    """
+    filtered = list()
+    for symbol in symbol_list:
+        market, trade = symbol.split('_')
+        if get_shard_index(trade, shard_count) == shard_index:
+            filtered.append(symbol)
+    return filtered
+
+
 def format_comma(number):
     if number:
         return format(number, ',')